@@ -0,0 +1,80 @@
+"""
+CPU time versus bytes on the wire of the response compression codings.
+
+Serializes a synthetic customer listing the way /users/by_customer/ does and,
+for each coding and level, times its compression and reports the compressed
+size. Needs neither the database nor Redis.
+
+    $ python -m benchmarks.compression --users 1000,10000,100000
+"""
+import argparse
+import statistics
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from modules.actions.listing_snapshots import serialize_listing
+from modules.utilities.compression import compress
+
+LEVELS: Dict[str, List[int]] = {
+    "gzip": [1, 6, 9],
+    "br": [1, 4, 6, 11],
+    "zstd": [1, 3, 9, 19],
+}
+BADGE_NAMES = ["EDITOR", "PAID", "CONTRIBUTOR"]
+
+
+def listing_body(users: int) -> bytes:
+    """Serialize a listing of users with up to two badges each"""
+    badge_names = {
+        uuid.uuid4(): BADGE_NAMES[number % 3 : number % 3 + number % 2 + 1]
+        for number in range(users)
+    }
+    return serialize_listing("bench-customer", badge_names)
+
+
+def time_compression(
+    body: bytes,
+    coding: str,
+    level: int,
+    iterations: int,
+) -> Tuple[float, int]:
+    """Time compressing a body, returning the p50 in milliseconds and the size"""
+    timings = []
+    compressed = b""
+    for _ in range(iterations):
+        started = time.perf_counter()
+        compressed = compress(body, coding, level)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(compressed)
+
+
+def run(user_counts: List[int], iterations: int) -> None:
+    """Compress listings of each size with every coding and level"""
+    print(
+        f"{'users':>7} {'coding':>6} {'level':>5} {'p50':>10} "
+        f"{'MB/s':>7} {'bytes':>10} {'ratio':>6}",
+    )
+    for users in user_counts:
+        body = listing_body(users)
+        print(f"{users:>7} {'-':>6} {'-':>5} {'-':>10} {'-':>7} {len(body):>10}")
+        for coding, levels in LEVELS.items():
+            for level in levels:
+                p50, size = time_compression(body, coding, level, iterations)
+                throughput = len(body) / 1e6 / (p50 / 1000)
+                print(
+                    f"{users:>7} {coding:>6} {level:>5} {p50:>8.2f}ms "
+                    f"{throughput:>7.0f} {size:>10} {len(body) / size:>6.1f}",
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--users",
+        default="1000,10000,100000",
+        help="Comma separated listing sizes, in users",
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    arguments = parser.parse_args()
+    run([int(users) for users in arguments.users.split(",")], arguments.iterations)
@@ -0,0 +1,93 @@
+"""
+Synthetic customers.csv files and user/badge datasets for the benchmarks
+"""
+import csv
+import random
+import uuid
+from typing import Iterator, List, Optional
+
+from sqlalchemy import insert
+
+from modules.database.models import Badge, User
+
+BADGE_NAMES = ["EDITOR", "PAID", "CONTRIBUTOR", "AUTHOR", "VISITOR", "ADMIN"]
+INSERT_BATCH = 5000
+
+
+def customer_ids(count: int, prefix: str = "bench") -> List[str]:
+    """Build customer ids of synthetic customers"""
+    return [f"{prefix}-{number}" for number in range(count)]
+
+
+def write_customers_csv(path: str, count: int, seed: int = 0) -> List[str]:
+    """
+    Write a customers.csv of synthetic customers, returning their ids.
+
+    Customers get one to five badges, one in ten is inactive and one in four
+    has its own rate limit, like the real file.
+    """
+    generator = random.Random(seed)
+    ids = customer_ids(count)
+    with open(path, "w", newline="") as customers_file:
+        writer = csv.writer(customers_file)
+        writer.writerow(
+            ["customer_id", "status", "rate_limit", "rate_burst"]
+            + [f"badge{number}" for number in range(1, 6)],
+        )
+        for customer_id in ids:
+            limited = generator.random() < 0.25
+            writer.writerow(
+                [
+                    customer_id,
+                    "inactive" if generator.random() < 0.1 else "active",
+                    generator.choice([5, 20, 100]) if limited else "",
+                    generator.choice([10, 50, 200]) if limited else "",
+                ]
+                + generator.sample(BADGE_NAMES, generator.randint(1, 5)),
+            )
+    return ids
+
+
+def insert_users(
+    db_session,
+    customer_ids_: List[str],
+    count: int,
+    badge_names: Optional[List[str]] = None,
+    badge_ids: Optional[Iterator[int]] = None,
+) -> List[uuid.UUID]:
+    """
+    Insert users with the given badges each, spread over the given customers.
+
+    Users get the first two benchmark badges unless badge_names is given.
+
+    Badge ids come from the database sequence, or from badge_ids for databases
+    without one, such as SQLite.
+    """
+    if badge_names is None:
+        badge_names = BADGE_NAMES[:2]
+    user_ids = []
+    for start in range(0, count, INSERT_BATCH):
+        users = [
+            {
+                "id": uuid.uuid4(),
+                "customer_id": customer_ids_[offset % len(customer_ids_)],
+            }
+            for offset in range(start, min(start + INSERT_BATCH, count))
+        ]
+        badges = [
+            {
+                "customer_id": user["customer_id"],
+                "user_id": user["id"],
+                "badge_name": badge_name,
+            }
+            for user in users
+            for badge_name in badge_names
+        ]
+        if badge_ids is not None:
+            for badge in badges:
+                badge["id"] = next(badge_ids)
+        db_session.execute(insert(User), users)
+        db_session.execute(insert(Badge), badges)
+        db_session.commit()
+        user_ids.extend(user["id"] for user in users)
+    return user_ids
@@ -0,0 +1,123 @@
+"""
+Timing, allocation measurement and baseline comparison for microbenchmarks
+"""
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class Measurement(NamedTuple):
+    """Throughput and allocations of one benchmark"""
+
+    name: str
+    ops_per_sec: float
+    peak_bytes_per_call: float
+    retained_blocks_per_call: float
+
+
+def _calls_per_round(func: Callable[[], object], min_time: float) -> int:
+    """Find how many calls take at least min_time, like timeit's autorange"""
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            func()
+        if time.perf_counter() - started >= min_time:
+            return calls
+        calls *= 2
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    rounds: int = 5,
+    min_time: float = 0.2,
+    traced_calls: int = 20,
+) -> Measurement:
+    """
+    Measure a benchmark.
+
+    Throughput is the best of several rounds, each lasting at least min_time.
+    Allocations are measured with tracemalloc over separate calls, as tracing
+    slows calls down: the peak of memory allocated during a call, freed or
+    not, and the number of memory blocks still allocated after it.
+    """
+    func()
+    calls = _calls_per_round(func, min_time)
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(calls):
+            func()
+        best = min(best, (time.perf_counter() - started) / calls)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(traced_calls):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return Measurement(
+        name,
+        1 / best,
+        sum(peaks) / traced_calls,
+        max(retained, 0) / traced_calls,
+    )
+
+
+def print_measurements(
+    measurements: List[Measurement],
+    baseline: Optional[Dict[str, Dict[str, float]]] = None,
+    tolerance: float = 0.1,
+) -> List[str]:
+    """
+    Print measurements, compared to a baseline if given.
+
+    Returns the names of the benchmarks whose throughput dropped, or whose
+    peak allocation grew, by more than the tolerance.
+    """
+    regressions = []
+    print(f"{'benchmark':<40} {'ops/s':>12} {'peak bytes':>11} {'retained':>9}")
+    for measurement in measurements:
+        line = (
+            f"{measurement.name:<40} {measurement.ops_per_sec:>12,.0f} "
+            f"{measurement.peak_bytes_per_call:>11,.0f} "
+            f"{measurement.retained_blocks_per_call:>9.1f}"
+        )
+        saved = (baseline or {}).get(measurement.name)
+        if saved is not None:
+            speed = measurement.ops_per_sec / saved["ops_per_sec"] - 1
+            memory = (
+                measurement.peak_bytes_per_call / max(saved["peak_bytes_per_call"], 1)
+                - 1
+            )
+            line += f"  {speed:+7.1%} ops/s {memory:+7.1%} peak"
+            if speed < -tolerance or memory > tolerance:
+                regressions.append(measurement.name)
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def save_measurements(path: str, measurements: List[Measurement]) -> None:
+    """Save measurements as a JSON baseline"""
+    with open(path, "w") as baseline_file:
+        json.dump(
+            {measurement.name: measurement._asdict() for measurement in measurements},
+            baseline_file,
+            indent=2,
+        )
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    """Load a JSON baseline saved by save_measurements"""
+    with open(path, "r") as baseline_file:
+        return json.load(baseline_file)
@@ -0,0 +1,167 @@
+"""
+Microbenchmarks of customer configuration lookups and user actions.
+
+Runs CustomerConfig and the user actions on synthetic data, against local
+stand-ins: fakeredis for Redis, and an in-memory SQLite database or, with
+--database postgres, the throwaway database configured by DATABASE_URL (rows
+use customer ids starting with "bench-" and are deleted at the end). Reports
+operations per second and memory allocated per call; save a run with --save
+and compare a later one to it with --compare.
+
+    $ python -m benchmarks.micro --save baseline.json
+    $ python -m benchmarks.micro --compare baseline.json
+"""
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import fakeredis
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.datasets import BADGE_NAMES, insert_users, write_customers_csv
+from benchmarks.harness import (
+    Measurement,
+    load_baseline,
+    measure,
+    print_measurements,
+    save_measurements,
+)
+from modules.actions.customer import CustomerConfig
+from modules.actions.customer_backends import InMemoryConfigBackend, RedisConfigBackend
+from modules.actions.user import get_customer_users
+from modules.database.models import Badge, User
+from modules.utilities.database import SessionLocal
+
+BENCH_CUSTOMER = "bench-users"
+
+
+@compiles(UUID, "sqlite")
+def compile_sqlite_uuid(*_, **__) -> str:
+    """Store the PostgreSQL UUID columns as text on SQLite"""
+    return "CHAR(32)"
+
+
+def customer_config_benchmarks(customers: int, **options) -> List[Measurement]:
+    """Measure loading customers.csv and looking customers up"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "customers.csv")
+        ids = write_customers_csv(path, customers)
+        memory = CustomerConfig(InMemoryConfigBackend(), customers_path=path)
+        redis_config = CustomerConfig(
+            RedisConfigBackend(fakeredis.FakeRedis()),
+            customers_path=path,
+        )
+        redis_config._refresh_config()  # pylint: disable=protected-access
+
+        aliases = itertools.cycle(ids)
+        badges = BADGE_NAMES[:1]
+
+        def reject_unknown() -> None:
+            try:
+                memory.get_customer_config("bench-unknown")
+            except HTTPException:
+                pass
+
+        return [
+            measure(
+                f"load_config[{customers}]",
+                lambda: CustomerConfig._load_config(path),  # pylint: disable=W0212
+                **options,
+            ),
+            measure(
+                "get_customer_config[memory]",
+                lambda: memory.get_customer_config(next(aliases)),
+                **options,
+            ),
+            measure(
+                "get_customer_config[fakeredis]",
+                lambda: redis_config.get_customer_config(next(aliases)),
+                **options,
+            ),
+            measure("get_customer_config[unknown]", reject_unknown, **options),
+            measure(
+                "is_valid_customer_badges[memory]",
+                lambda: memory.is_valid_customer_badges(next(aliases), badges),
+                **options,
+            ),
+        ]
+
+
+@contextmanager
+def user_database(database: str) -> Iterator[Session]:
+    """Open a session on an in-memory SQLite database or on DATABASE_URL"""
+    if database == "sqlite":
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        User.__table__.create(engine)
+        Badge.__table__.create(engine)
+        db_session = sessionmaker(autoflush=False, bind=engine)()
+    else:
+        db_session = SessionLocal()
+    try:
+        yield db_session
+    finally:
+        db_session.rollback()
+        db_session.execute(delete(Badge).where(Badge.customer_id.like("bench-%")))
+        db_session.execute(delete(User).where(User.customer_id.like("bench-%")))
+        db_session.commit()
+        db_session.close()
+
+
+def user_benchmarks(users: int, database: str, **options) -> List[Measurement]:
+    """Measure listing a customer's users"""
+    with user_database(database) as db_session:
+        badge_ids = itertools.count(1) if database == "sqlite" else None
+        insert_users(db_session, [BENCH_CUSTOMER], users, badge_ids=badge_ids)
+
+        def list_users() -> None:
+            get_customer_users(BENCH_CUSTOMER, db_session)
+            db_session.expire_all()
+
+        return [measure(f"get_customer_users[{users}]", list_users, **options)]
+
+
+def run(arguments: argparse.Namespace) -> int:
+    """Run the benchmarks, returning the exit status"""
+    # Statement logging, enabled by the app, would dominate the timings.
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    options = {"rounds": arguments.rounds, "min_time": arguments.min_time}
+    measurements = customer_config_benchmarks(arguments.customers, **options)
+    measurements += user_benchmarks(arguments.users, arguments.database, **options)
+
+    baseline = load_baseline(arguments.compare) if arguments.compare else None
+    regressions = print_measurements(measurements, baseline, arguments.tolerance)
+    if arguments.save:
+        save_measurements(arguments.save, measurements)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--database", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--save", help="Save the measurements as a baseline")
+    parser.add_argument("--compare", help="Compare to a saved baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative slowdown or allocation growth reported as a regression",
+    )
+    sys.exit(run(parser.parse_args()))
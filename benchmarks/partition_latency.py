@@ -0,0 +1,108 @@
+"""
+Per-tenant query latency as the users and badges tables grow.
+
+Fills the database configured by DATABASE_URL with filler tenants in steps and,
+after each step, times the per-tenant queries of a small tenant. Only use a
+throwaway database that has been migrated with `alembic upgrade head`; all
+benchmark rows use customer ids starting with "bench-" and are deleted at the
+end unless --keep is given.
+
+    $ python -m benchmarks.partition_latency --steps 10000,100000,1000000
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import delete, text
+
+from benchmarks.datasets import insert_users
+from modules.actions.badge_changes import load_users_badge_names
+from modules.actions.user import load_user_badge_names
+from modules.database.models import Badge, User
+from modules.utilities.database import SessionLocal
+
+SMALL_TENANT = "bench-small"
+FILLER_TENANTS = 64
+
+
+def time_query(query: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """Time a query, returning p50 and p95 latencies in milliseconds"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        query()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def cleanup(db_session) -> None:
+    """Delete all benchmark rows"""
+    db_session.execute(delete(Badge).where(Badge.customer_id.like("bench-%")))
+    db_session.execute(delete(User).where(User.customer_id.like("bench-%")))
+    db_session.commit()
+
+
+def run(steps: List[int], iterations: int, keep: bool) -> None:
+    """Grow the tables step by step and time the small tenant's queries"""
+    db_session = SessionLocal()
+    fillers = [f"bench-filler-{number}" for number in range(FILLER_TENANTS)]
+    try:
+        small_user_ids = insert_users(db_session, [SMALL_TENANT], 100)
+        inserted = len(small_user_ids)
+        print(
+            f"{'users':>10} {'lookup p50':>11} {'p95':>7} "
+            f"{'single p50':>11} {'p95':>7}",
+        )
+        for step in steps:
+            inserted += len(insert_users(db_session, fillers, step - inserted))
+            db_session.execute(text("ANALYZE users"))
+            db_session.execute(text("ANALYZE badges"))
+            db_session.commit()
+
+            lookup = time_query(
+                lambda: load_users_badge_names(
+                    small_user_ids,
+                    SMALL_TENANT,
+                    db_session,
+                ),
+                iterations,
+            )
+            single = time_query(
+                lambda: load_user_badge_names(
+                    small_user_ids[0],
+                    SMALL_TENANT,
+                    db_session,
+                ),
+                iterations,
+            )
+            print(
+                f"{inserted:>10} {lookup['p50']:>9.2f}ms {lookup['p95']:>5.2f}ms "
+                f"{single['p50']:>9.2f}ms {single['p95']:>5.2f}ms",
+            )
+    finally:
+        if not keep:
+            db_session.rollback()
+            cleanup(db_session)
+        db_session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--steps",
+        default="10000,100000,1000000",
+        help="Comma separated total user counts to measure at",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="Keep benchmark rows")
+    arguments = parser.parse_args()
+    run(
+        [int(step) for step in arguments.steps.split(",")],
+        arguments.iterations,
+        arguments.keep,
+    )
@@ -1,13 +1,28 @@
 """Main file"""
 import os
 import sys
+from contextlib import asynccontextmanager
 
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI
 
-from modules.routers import auth, user
+from modules.actions.badge_changes import BADGE_CHANGE_PRUNER
+from modules.actions.badge_stream import BADGE_EVENTS
+from modules.actions.listing_snapshots import LISTING_SNAPSHOTS
+from modules.actions.write_behind import WRITE_BEHIND
+from modules.routers import auth, jobs, monitoring, user, user_import
 from modules.utilities.auth import CUSTOMER_CONFIG
+from modules.utilities.cache import REDIS_CLIENT, REQUEST_REDIS_CLIENT
+from modules.utilities.compression import CompressionMiddleware
+from modules.utilities.config import app_config
+from modules.utilities.database import REPLICA_ROUTER
+from modules.utilities.health import HEALTH_PROBES
+from modules.utilities.host_lock import HOST_LOCK
+from modules.utilities.lifecycle import LIFECYCLE, GracefulServer, LifecycleMiddleware
+from modules.utilities.prefork import PreforkServer, available_cpus
+from modules.utilities.profiling import ProfilingMiddleware, install_query_timing
+from modules.utilities.query_budget import QueryBudgetMiddleware, install_query_counting
 from modules.utilities.response import base_responses
 
 ENVIRONMENT = os.getenv("RUN_ENV", "local")
@@ -17,6 +32,32 @@ load_dotenv(os.path.join(BASE_DIR, ".env"))
 API_TITLE = "Commentera API"
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """
+    Start background tasks, then drain and release connections on shutdown
+    """
+    print("Starting event to refresh customer configuration..")
+    await CUSTOMER_CONFIG.start_refresh_task()
+    await WRITE_BEHIND.start_flush_task()
+    HEALTH_PROBES.start()
+    BADGE_CHANGE_PRUNER.start()
+    LIFECYCLE.mark_started()
+    yield
+    LIFECYCLE.start_draining()
+    await LIFECYCLE.wait_for_requests(app_config.shutdown_drain_timeout)
+    await BADGE_EVENTS.close()
+    WRITE_BEHIND.drain()
+    LISTING_SNAPSHOTS.stop()
+    BADGE_CHANGE_PRUNER.stop()
+    HEALTH_PROBES.stop()
+    CUSTOMER_CONFIG.stop_refresh_task()
+    HOST_LOCK.release()
+    REPLICA_ROUTER.dispose()
+    REQUEST_REDIS_CLIENT.close()
+    REDIS_CLIENT.close()
+
+
 app = FastAPI(
     responses={**base_responses},
     title=API_TITLE,
@@ -26,16 +67,49 @@ app = FastAPI(
     openapi_url="/api/v1/openapi.json",
     redoc_url="/docs",
     version="1.0",
+    lifespan=lifespan,
 )
+app.add_middleware(LifecycleMiddleware)
+install_query_counting()
+app.add_middleware(QueryBudgetMiddleware)
+if app_config.compression_enabled:
+    app.add_middleware(CompressionMiddleware)
+if app_config.profiling_enabled:
+    install_query_timing()
+    app.add_middleware(ProfilingMiddleware)
 app.include_router(user.router)
+app.include_router(user_import.router)
+app.include_router(jobs.router)
 app.include_router(auth.router)
+app.include_router(monitoring.router)
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Startup event to update customer configurations"""
-    print("Starting event to refresh customer configuration..")
-    await CUSTOMER_CONFIG.start_refresh_task()
+def reset_after_fork() -> None:
+    """
+    Drop the database connections a forked worker inherited from the supervisor
+    """
+    REPLICA_ROUTER.dispose(close=False)
+
+
+def run_server(host: str, port: int) -> None:
+    """
+    Serve the preloaded app from one worker process per available CPU, unless
+    server_workers is set, using uvloop and httptools when they are installed
+    """
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        loop="auto",
+        http="auto",
+        backlog=app_config.server_backlog,
+        timeout_keep_alive=app_config.server_keep_alive,
+    )
+    workers = app_config.server_workers or available_cpus()
+    if workers == 1:
+        GracefulServer(config).run()
+    else:
+        PreforkServer(config, workers, after_fork=reset_after_fork).run()
 
 
 if __name__ == "__main__":
@@ -52,7 +126,7 @@ if __name__ == "__main__":
                 reload=True,
             )
         else:
-            uvicorn.run(app, host=api_host, port=api_port)
+            run_server(api_host, api_port)
     else:
         sys.stderr.write(
             "Variable DATABASE_URL cannot be found in environment. Put it in .env or in "
@@ -0,0 +1,169 @@
+"""partition users and badges by customer
+
+Revision ID: 5d2a7c41e8f3
+Revises: 899bbb555bb9
+Create Date: 2026-10-19 09:12:05.418233
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5d2a7c41e8f3"
+down_revision = "899bbb555bb9"
+branch_labels = None
+depends_on = None
+
+# Number of hash partitions of each table. Changing it requires a new
+# migration that repartitions the data.
+PARTITIONS = 16
+
+
+def create_partitions(table_name):
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE {table_name}_p{remainder} PARTITION OF {table_name} "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})",
+        )
+
+
+def set_aside_unpartitioned_tables():
+    op.drop_index("ix_badges_id", table_name="badges")
+    op.drop_index("ix_badges_badge_name", table_name="badges")
+    op.drop_index("ix_users_id", table_name="users")
+    op.execute("ALTER SEQUENCE badges_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE badges ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER TABLE badges DROP CONSTRAINT badges_user_id_fkey")
+    op.execute("ALTER TABLE badges RENAME CONSTRAINT badges_pkey TO badges_old_pkey")
+    op.execute("ALTER TABLE users RENAME CONSTRAINT users_pkey TO users_old_pkey")
+    op.rename_table("badges", "badges_old")
+    op.rename_table("users", "users_old")
+
+
+def upgrade():
+    set_aside_unpartitioned_tables()
+
+    op.create_table(
+        "users",
+        sa.Column("customer_id", sa.String(), nullable=False),
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.PrimaryKeyConstraint("customer_id", "id", name="users_pkey"),
+        postgresql_partition_by="HASH (customer_id)",
+    )
+    create_partitions("users")
+    op.create_index(op.f("ix_users_id"), "users", ["id"], unique=False)
+
+    op.create_table(
+        "badges",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('badges_id_seq')"),
+            nullable=False,
+        ),
+        sa.Column("customer_id", sa.String(), nullable=False),
+        sa.Column("badge_name", sa.String(), nullable=True),
+        sa.Column("user_id", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["customer_id", "user_id"],
+            ["users.customer_id", "users.id"],
+            name="badges_user_id_fkey",
+        ),
+        sa.PrimaryKeyConstraint("customer_id", "id", name="badges_pkey"),
+        postgresql_partition_by="HASH (customer_id)",
+    )
+    create_partitions("badges")
+    op.execute("ALTER SEQUENCE badges_id_seq OWNED BY badges.id")
+    op.create_index(op.f("ix_badges_id"), "badges", ["id"], unique=False)
+    op.create_index(
+        op.f("ix_badges_badge_name"),
+        "badges",
+        ["badge_name"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_badges_user_id"),
+        "badges",
+        ["customer_id", "user_id"],
+        unique=False,
+    )
+
+    # Rows without a customer are kept under the empty customer id.
+    op.execute(
+        "INSERT INTO users (customer_id, id) "
+        "SELECT COALESCE(customer_id, ''), id FROM users_old",
+    )
+    op.execute(
+        "INSERT INTO badges (id, customer_id, badge_name, user_id) "
+        "SELECT badges_old.id, COALESCE(users_old.customer_id, ''), "
+        "badges_old.badge_name, badges_old.user_id "
+        "FROM badges_old LEFT JOIN users_old ON users_old.id = badges_old.user_id",
+    )
+    op.drop_table("badges_old")
+    op.drop_table("users_old")
+
+
+def downgrade():
+    op.execute("ALTER SEQUENCE badges_id_seq OWNED BY NONE")
+    op.rename_table("badges", "badges_partitioned")
+    op.rename_table("users", "users_partitioned")
+    op.drop_index("ix_badges_user_id", table_name="badges_partitioned")
+    op.drop_index("ix_badges_id", table_name="badges_partitioned")
+    op.drop_index("ix_badges_badge_name", table_name="badges_partitioned")
+    op.drop_index("ix_users_id", table_name="users_partitioned")
+    op.execute(
+        "ALTER TABLE badges_partitioned DROP CONSTRAINT badges_user_id_fkey",
+    )
+    op.execute(
+        "ALTER TABLE badges_partitioned "
+        "RENAME CONSTRAINT badges_pkey TO badges_partitioned_pkey",
+    )
+    op.execute(
+        "ALTER TABLE users_partitioned "
+        "RENAME CONSTRAINT users_pkey TO users_partitioned_pkey",
+    )
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("customer_id", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id", name="users_pkey"),
+    )
+    op.create_index(op.f("ix_users_id"), "users", ["id"], unique=False)
+    op.create_table(
+        "badges",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('badges_id_seq')"),
+            nullable=False,
+        ),
+        sa.Column("badge_name", sa.String(), nullable=True),
+        sa.Column("user_id", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+            name="badges_user_id_fkey",
+        ),
+        sa.PrimaryKeyConstraint("id", name="badges_pkey"),
+    )
+    op.execute("ALTER SEQUENCE badges_id_seq OWNED BY badges.id")
+    op.create_index(
+        op.f("ix_badges_badge_name"),
+        "badges",
+        ["badge_name"],
+        unique=False,
+    )
+    op.create_index(op.f("ix_badges_id"), "badges", ["id"], unique=False)
+
+    op.execute(
+        "INSERT INTO users (id, customer_id) "
+        "SELECT id, NULLIF(customer_id, '') FROM users_partitioned "
+        "ON CONFLICT (id) DO NOTHING",
+    )
+    op.execute(
+        "INSERT INTO badges (id, badge_name, user_id) "
+        "SELECT id, badge_name, user_id FROM badges_partitioned",
+    )
+    op.drop_table("badges_partitioned")
+    op.drop_table("users_partitioned")
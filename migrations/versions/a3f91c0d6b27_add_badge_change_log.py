@@ -0,0 +1,59 @@
+"""add badge change log
+
+Revision ID: a3f91c0d6b27
+Revises: 5d2a7c41e8f3
+Create Date: 2026-10-19 14:37:52.104318
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "a3f91c0d6b27"
+down_revision = "5d2a7c41e8f3"
+branch_labels = None
+depends_on = None
+
+# Same number of hash partitions as users and badges.
+PARTITIONS = 16
+
+
+def upgrade():
+    op.create_table(
+        "badge_change_sequences",
+        sa.Column("customer_id", sa.String(), nullable=False),
+        sa.Column("last_sequence", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("customer_id"),
+    )
+    op.create_table(
+        "badge_changes",
+        sa.Column("customer_id", sa.String(), nullable=False),
+        sa.Column("sequence", sa.BigInteger(), nullable=False),
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("badge_names", postgresql.ARRAY(sa.String()), nullable=True),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(precision=6),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            postgresql.TIMESTAMP(precision=6),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("customer_id", "sequence"),
+        postgresql_partition_by="HASH (customer_id)",
+    )
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE badge_changes_p{remainder} PARTITION OF badge_changes "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})",
+        )
+
+
+def downgrade():
+    op.drop_table("badge_changes")
+    op.drop_table("badge_change_sequences")
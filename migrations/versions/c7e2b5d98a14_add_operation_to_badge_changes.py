@@ -0,0 +1,23 @@
+"""add operation to badge changes
+
+Revision ID: c7e2b5d98a14
+Revises: a3f91c0d6b27
+Create Date: 2026-10-19 16:05:11.532907
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c7e2b5d98a14"
+down_revision = "a3f91c0d6b27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("badge_changes", sa.Column("operation", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("badge_changes", "operation")
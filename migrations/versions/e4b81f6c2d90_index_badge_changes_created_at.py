@@ -0,0 +1,22 @@
+"""index badge changes created at
+
+Revision ID: e4b81f6c2d90
+Revises: c7e2b5d98a14
+Create Date: 2026-10-19 18:42:27.104385
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e4b81f6c2d90"
+down_revision = "c7e2b5d98a14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_badge_changes_created_at", "badge_changes", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_badge_changes_created_at", table_name="badge_changes")
@@ -0,0 +1,380 @@
+"""Badge change log actions"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import redis
+from apscheduler.schedulers.background import BackgroundScheduler
+from fastapi import HTTPException, status
+from sqlalchemy import any_, bindparam, delete, event, func, insert, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from modules.database.models import Badge, BadgeChange, BadgeChangeSequence, User
+from modules.database.schemas.user_schemas import BadgeChangeSchema, BadgeChangesOut
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.database import SessionLocal
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Session.info key of the changes recorded in the current transaction.
+RECORDED_CHANGES = "badge_changes"
+
+
+def badge_event_channel(customer_alias: str) -> str:
+    """
+    Build the Redis channel a customer's badge changes are published to.
+
+    :param customer_alias: Customer alias.
+    :return: Channel name.
+    """
+    return f"{app_config.badge_events_channel}:{customer_alias}"
+
+
+def publish_badge_changes(
+    changes: List[BadgeChangeSchema],
+    customer_alias: str,
+) -> None:
+    """
+    Publish committed badge changes to the customer's event channel.
+
+    Publishing is best effort: subscribers notice missed sequence numbers and
+    read them from the change log.
+
+    :param changes: Committed changes.
+    :param customer_alias: Customer alias.
+    """
+    pipeline = REQUEST_REDIS_CLIENT.pipeline(transaction=False)
+    for change in changes:
+        pipeline.publish(badge_event_channel(customer_alias), change.model_dump_json())
+    try:
+        pipeline.execute()
+    except redis.RedisError as redis_error:
+        logger.warning("Unable to publish badge changes: %s", redis_error)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_recorded_changes(session: Session) -> None:
+    """
+    Publish the changes recorded in a transaction once it committed.
+    """
+    for customer_alias, changes in session.info.pop(RECORDED_CHANGES, {}).items():
+        publish_badge_changes(changes, customer_alias)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_recorded_changes(session: Session) -> None:
+    """
+    Forget the changes recorded in a transaction that rolled back.
+    """
+    session.info.pop(RECORDED_CHANGES, None)
+
+
+def group_badge_names(
+    rows: Iterable[Tuple[UUID, Optional[str]]],
+) -> Dict[UUID, List[str]]:
+    """
+    Group the rows of a users outer joined to their badges query.
+
+    :param rows: User ID and badge name rows, the name None for users
+        without badges.
+    :return: Badge names per user ID, in row order.
+    """
+    badge_names: Dict[UUID, List[str]] = {}
+    for user_id, badge_name in rows:
+        user_badge_names = badge_names.setdefault(user_id, [])
+        if badge_name is not None:
+            user_badge_names.append(badge_name)
+    return badge_names
+
+
+def load_users_badge_names(
+    user_ids: List[UUID],
+    customer_alias: str,
+    db_session: Session,
+) -> Dict[UUID, List[str]]:
+    """
+    Load the badge names of many users in a single query.
+
+    The IDs are sent as one array parameter, so the statement is the same
+    whatever the number of users. Badge names are in the order they were
+    added, as seen by the current transaction.
+
+    :param user_ids: User IDs.
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: Badge names per ID of the users that exist.
+    """
+    ids = bindparam("user_ids", user_ids, type_=ARRAY(PG_UUID(as_uuid=True)))
+    rows = (
+        db_session.query(User.id, Badge.badge_name)
+        .outerjoin(User.badges)
+        .filter(User.id == any_(ids), User.customer_id == customer_alias)
+        .order_by(Badge.id)
+        .all()
+    )
+    return group_badge_names(rows)
+
+
+def _reserve_sequences(customer_alias: str, count: int, db_session: Session) -> int:
+    """
+    Reserve the next sequence numbers of a customer's change log.
+
+    The customer's sequence row stays locked until the transaction ends.
+
+    :param customer_alias: Customer alias.
+    :param count: Number of sequence numbers to reserve.
+    :param db_session: Database session.
+    :return: First reserved sequence number.
+    """
+    statement = (
+        pg_insert(BadgeChangeSequence)
+        .values(customer_id=customer_alias, last_sequence=count)
+        .on_conflict_do_update(
+            index_elements=[BadgeChangeSequence.customer_id],
+            set_={"last_sequence": BadgeChangeSequence.last_sequence + count},
+        )
+        .returning(BadgeChangeSequence.last_sequence)
+    )
+    return db_session.execute(statement).scalar_one() - count + 1
+
+
+def record_badge_changes(
+    customer_alias: str,
+    user_ids: Iterable[UUID],
+    db_session: Session,
+    operation: str,
+) -> None:
+    """
+    Append the current badge names of users to the customer's change log.
+
+    Must be called in the transaction changing the badges, right before its
+    commit: the customer's writers wait on each other from here until commit.
+    The changes are published to the customer's event channel after commit.
+
+    :param customer_alias: Customer alias.
+    :param user_ids: IDs of the users whose badges changed.
+    :param db_session: Database session.
+    :param operation: Operation that made the changes.
+    :return: None.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return
+
+    db_session.flush()
+    badge_names = load_users_badge_names(user_ids, customer_alias, db_session)
+    first_sequence = _reserve_sequences(customer_alias, len(user_ids), db_session)
+    changes = [
+        BadgeChangeSchema(
+            sequence=first_sequence + offset,
+            user_id=user_id,
+            badge_names=badge_names.get(user_id),
+            operation=operation,
+        )
+        for offset, user_id in enumerate(user_ids)
+    ]
+    db_session.execute(
+        insert(BadgeChange),
+        [
+            {"customer_id": customer_alias, **change.model_dump(exclude={"changed_at"})}
+            for change in changes
+        ],
+    )
+    recorded = db_session.info.setdefault(RECORDED_CHANGES, {})
+    recorded.setdefault(customer_alias, []).extend(changes)
+
+
+def get_last_sequence(customer_alias: str, db_session: Session) -> int:
+    """
+    Get the last sequence number of a customer's change log.
+
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: Last sequence number, 0 if nothing changed yet.
+    """
+    last_sequence: Optional[int] = (
+        db_session.query(BadgeChangeSequence.last_sequence)
+        .filter(BadgeChangeSequence.customer_id == customer_alias)
+        .scalar()
+    )
+    return last_sequence or 0
+
+
+def changes_pruned(after: int) -> HTTPException:
+    """
+    Build the error answering a request for changes no longer in the log.
+
+    :param after: Sequence number the client asked the changes after.
+    :return: 410 Gone error.
+    """
+    return HTTPException(
+        status_code=status.HTTP_410_GONE,
+        detail=(
+            f"Badge changes after sequence {after} were pruned, "
+            "reload /users/by_customer/"
+        ),
+    )
+
+
+def ensure_changes_retained(
+    customer_alias: str,
+    after: int,
+    db_session: Session,
+) -> None:
+    """
+    Check the changes after a sequence number are still in the change log.
+
+    :param customer_alias: Customer alias.
+    :param after: Sequence number of the last change already applied.
+    :param db_session: Database session.
+    :raises HTTPException: 410 Gone if some of the changes were pruned.
+    """
+    first_sequence: Optional[int] = (
+        db_session.query(func.min(BadgeChange.sequence))
+        .filter(BadgeChange.customer_id == customer_alias)
+        .scalar()
+    )
+    if first_sequence is not None and first_sequence > after + 1:
+        raise changes_pruned(after)
+
+
+def get_badge_changes(
+    customer_alias: str,
+    after: int,
+    limit: int,
+    db_session: Session,
+) -> BadgeChangesOut:
+    """
+    Get a page of a customer's badge changes.
+
+    :param customer_alias: Customer alias.
+    :param after: Sequence number of the last change already applied.
+    :param limit: Maximum number of changes.
+    :param db_session: Database session.
+    :return: Changes after the given sequence number, in order.
+    :raises HTTPException: 410 Gone if changes after the given sequence number
+        were pruned.
+    """
+    changes = (
+        db_session.query(BadgeChange)
+        .filter(
+            BadgeChange.customer_id == customer_alias,
+            BadgeChange.sequence > after,
+        )
+        .order_by(BadgeChange.sequence)
+        .limit(limit + 1)
+        .all()
+    )
+    # Sequence numbers have no gaps, so one before the first change read means
+    # the changes in between were pruned.
+    if changes and changes[0].sequence > after + 1:
+        raise changes_pruned(after)
+    page = changes[:limit]
+    return BadgeChangesOut(
+        changes=[
+            BadgeChangeSchema(
+                sequence=change.sequence,
+                user_id=change.user_id,
+                badge_names=change.badge_names,
+                operation=change.operation,
+                changed_at=change.created_at,
+            )
+            for change in page
+        ],
+        last_sequence=page[-1].sequence if page else after,
+        has_more=len(changes) > limit,
+    )
+
+
+def prune_badge_changes(retention: float, db_session: Session) -> int:
+    """
+    Delete the badge changes older than the retention.
+
+    The last change of each customer is kept, so a client asking for changes
+    after a pruned one always finds the gap.
+
+    :param retention: Seconds changes are kept.
+    :param db_session: Database session.
+    :return: Number of changes deleted.
+    """
+    last_sequence = (
+        select(BadgeChangeSequence.last_sequence)
+        .where(BadgeChangeSequence.customer_id == BadgeChange.customer_id)
+        .scalar_subquery()
+    )
+    statement = delete(BadgeChange).where(
+        BadgeChange.created_at < func.now() - timedelta(seconds=retention),
+        BadgeChange.sequence < last_sequence,
+    )
+    deleted = db_session.execute(statement).rowcount
+    db_session.commit()
+    return deleted
+
+
+class BadgeChangePruner:
+    """
+    Prunes the badge change log on a background interval.
+
+    Clients that fall further behind than the retention get a 410 Gone from
+    the change log and reload the listing.
+    """
+
+    def __init__(self, retention: float, interval: float) -> None:
+        """
+        Initialize the BadgeChangePruner.
+
+        :param retention: Seconds changes are kept, 0 to keep them forever.
+        :param interval: Seconds between prunes.
+        """
+        self.retention = retention
+        self.interval = interval
+        self.scheduler = BackgroundScheduler()
+
+    def prune(self) -> None:
+        """
+        Delete the changes older than the retention, logging failures.
+        """
+        try:
+            with SessionLocal() as db_session:
+                deleted = prune_badge_changes(self.retention, db_session)
+        except Exception:  # pylint: disable=W0703
+            logger.exception("Unable to prune badge changes")
+            return
+        METRICS.increment("badge_changes_pruned_total", deleted)
+        logger.info("Pruned %d badge changes", deleted)
+
+    def start(self) -> None:
+        """
+        Start pruning on the background interval, unless changes are kept
+        forever.
+        """
+        if self.retention <= 0:
+            return
+        self.scheduler.add_job(
+            self.prune,
+            trigger="interval",
+            seconds=self.interval,
+            max_instances=1,
+            coalesce=True,
+        )
+        self.scheduler.start()
+
+    def stop(self) -> None:
+        """
+        Stop pruning.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+
+BADGE_CHANGE_PRUNER = BadgeChangePruner(
+    retention=app_config.badge_changes_retention,
+    interval=app_config.badge_changes_prune_interval,
+)
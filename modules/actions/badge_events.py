@@ -0,0 +1,44 @@
+"""Badge change notification actions"""
+
+from typing import Callable, Iterable, List
+from uuid import UUID
+
+from modules.actions.user_cache import USER_BADGE_CACHE
+from modules.utilities.etag import CUSTOMER_VERSIONS
+
+BadgeChangeHook = Callable[[str, List[UUID]], None]
+
+# Functions called after committed badge mutations, see badge_change_hook.
+BADGE_CHANGE_HOOKS: List[BadgeChangeHook] = []
+
+
+def badge_change_hook(hook: BadgeChangeHook) -> BadgeChangeHook:
+    """
+    Register the decorated function to be called by badges_changed.
+
+    Caches built from the user actions register here, as this module cannot
+    import them without an import cycle.
+
+    :param hook: Function taking the customer alias and the IDs of the users
+        whose badges changed.
+    :return: The function.
+    """
+    BADGE_CHANGE_HOOKS.append(hook)
+    return hook
+
+
+def badges_changed(customer_alias: str, user_ids: Iterable[UUID]) -> None:
+    """
+    Propagate committed badge mutations to caches.
+
+    Must be called after the mutations are committed.
+
+    :param customer_alias: Customer alias.
+    :param user_ids: IDs of the users whose badges changed.
+    :return: None.
+    """
+    user_ids = list(user_ids)
+    USER_BADGE_CACHE.invalidate(customer_alias, user_ids)
+    CUSTOMER_VERSIONS.bump(customer_alias)
+    for hook in BADGE_CHANGE_HOOKS:
+        hook(customer_alias, user_ids)
@@ -0,0 +1,363 @@
+"""Badge change event stream actions"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import redis
+import redis.asyncio
+from starlette.concurrency import run_in_threadpool
+
+from modules.actions.badge_changes import (
+    ensure_changes_retained,
+    get_badge_changes,
+    get_last_sequence,
+)
+from modules.database.schemas.user_schemas import (
+    MAX_BADGE_CHANGES,
+    BadgeChangeSchema,
+    BadgeChangesOut,
+)
+from modules.utilities.cache import REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.database import SessionLocal
+from modules.utilities.lifecycle import LIFECYCLE
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before resubscribing after losing the Redis connection.
+RECONNECT_DELAY = 1
+
+# Seconds between checks for shutdown while a stream waits for events.
+POLL_INTERVAL = 1
+
+# Milliseconds clients wait before reconnecting to a closed stream.
+CLIENT_RETRY = 3000
+
+
+class BadgeListener:
+    """
+    Buffer of badge changes for one stream.
+
+    The buffer is bounded: when a slow client lets it fill up, it is emptied
+    and replaced by a None marker telling the stream to catch up from the
+    change log, so a slow client never holds up the others or grows memory.
+    """
+
+    def __init__(self, customer_alias: str, queue_size: int) -> None:
+        """
+        Initialize the BadgeListener.
+
+        :param customer_alias: Customer alias.
+        :param queue_size: Number of changes buffered at most.
+        """
+        self.customer_alias = customer_alias
+        self.queue: "asyncio.Queue[Optional[BadgeChangeSchema]]" = asyncio.Queue(
+            maxsize=queue_size,
+        )
+
+    def put(self, change: BadgeChangeSchema) -> None:
+        """
+        Buffer a change, or mark the stream as lagging if the buffer is full.
+
+        :param change: Badge change.
+        """
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            METRICS.increment("badge_event_overflows_total")
+            self.lag()
+
+    def lag(self) -> None:
+        """
+        Drop the buffered changes and ask the stream to catch up.
+        """
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class BadgeEventHub:
+    """
+    Fans badge changes published to Redis out to the streams of this process.
+
+    A single pattern subscription per process serves every stream, whatever
+    the number of clients.
+    """
+
+    def __init__(self, cache: redis.Redis, channel: str, queue_size: int) -> None:
+        """
+        Initialize the BadgeEventHub.
+
+        :param cache: Redis client whose server changes are published to.
+        :param channel: Prefix of the customer channels.
+        :param queue_size: Number of changes buffered per stream.
+        """
+        self.connection_kwargs = cache.connection_pool.connection_kwargs
+        self.channel = channel
+        self.queue_size = queue_size
+        self._listeners: Dict[str, Set[BadgeListener]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _lag_all(self) -> None:
+        """
+        Ask every stream to catch up, as changes may have been missed.
+        """
+        for listeners in self._listeners.values():
+            for listener in listeners:
+                listener.lag()
+
+    def _dispatch(self, message: Dict) -> None:
+        """
+        Hand a published change to the streams of its customer.
+
+        :param message: Pub/sub message.
+        """
+        customer_alias = message["channel"].decode("utf-8")[len(self.channel) + 1 :]
+        listeners = self._listeners.get(customer_alias)
+        if not listeners:
+            return
+        change = BadgeChangeSchema.model_validate_json(message["data"])
+        for listener in listeners:
+            listener.put(change)
+
+    async def _receive(self, cache: redis.asyncio.Redis) -> None:
+        """
+        Subscribe to the customer channels and dispatch published changes.
+
+        :param cache: Asynchronous Redis client.
+        """
+        pubsub = cache.pubsub()
+        try:
+            await pubsub.psubscribe(f"{self.channel}:*")
+            self._lag_all()
+            async for message in pubsub.listen():
+                if message["type"] == "pmessage":
+                    self._dispatch(message)
+        finally:
+            await pubsub.close()
+
+    async def _listen(self) -> None:
+        """
+        Receive published changes, resubscribing when the connection is lost.
+        """
+        cache = redis.asyncio.Redis(**self.connection_kwargs)
+        try:
+            while True:
+                try:
+                    await self._receive(cache)
+                except (redis.RedisError, OSError) as redis_error:
+                    logger.warning("Badge event subscription lost: %s", redis_error)
+                    await asyncio.sleep(RECONNECT_DELAY)
+        finally:
+            await cache.close()
+
+    def subscribe(self, customer_alias: str) -> BadgeListener:
+        """
+        Register a stream, subscribing to Redis on first use.
+
+        :param customer_alias: Customer alias.
+        :return: Listener receiving the customer's changes.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        listener = BadgeListener(customer_alias, self.queue_size)
+        self._listeners.setdefault(customer_alias, set()).add(listener)
+        return listener
+
+    @property
+    def stream_count(self) -> int:
+        """
+        Number of streams registered.
+        """
+        return sum(len(listeners) for listeners in self._listeners.values())
+
+    def unsubscribe(self, listener: BadgeListener) -> None:
+        """
+        Unregister a stream.
+
+        :param listener: Listener of the stream.
+        """
+        listeners = self._listeners.get(listener.customer_alias, set())
+        listeners.discard(listener)
+        if not listeners:
+            self._listeners.pop(listener.customer_alias, None)
+
+    async def close(self) -> None:
+        """
+        Stop receiving published changes.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+BADGE_EVENTS = BadgeEventHub(
+    cache=REDIS_CLIENT,
+    channel=app_config.badge_events_channel,
+    queue_size=app_config.badge_events_queue_size,
+)
+METRICS.gauge("badge_event_streams", lambda: BADGE_EVENTS.stream_count)
+
+
+def format_badge_event(change: BadgeChangeSchema) -> str:
+    """
+    Format a badge change as a server-sent event.
+
+    :param change: Badge change.
+    :return: Event, identified by the change sequence number.
+    """
+    return (
+        f"id: {change.sequence}\n"
+        f"event: {change.operation or 'change'}\n"
+        f"data: {change.model_dump_json()}\n\n"
+    )
+
+
+def load_badge_changes(customer_alias: str, after: int) -> BadgeChangesOut:
+    """
+    Load a page of badge changes after a sequence number from the change log.
+
+    :param customer_alias: Customer alias.
+    :param after: Sequence number of the last change already sent.
+    :return: Page of changes in order.
+    """
+    with SessionLocal() as db_session:
+        return get_badge_changes(customer_alias, after, MAX_BADGE_CHANGES, db_session)
+
+
+async def _catch_up(
+    customer_alias: str,
+    last_sequence: int,
+    until: Optional[int],
+) -> AsyncIterator[List[BadgeChangeSchema]]:
+    """
+    Read missed changes from the change log, a page at a time.
+
+    Only one page is held at once, however far behind the stream is.
+
+    :param customer_alias: Customer alias.
+    :param last_sequence: Sequence number of the last change sent.
+    :param until: Sequence number of the live change that showed the gap,
+        None to read up to the end of the change log.
+    :return: Pages of changes in order.
+    """
+    has_more = True
+    while has_more and (until is None or last_sequence < until):
+        page = await run_in_threadpool(
+            load_badge_changes,
+            customer_alias,
+            last_sequence,
+        )
+        yield page.changes
+        last_sequence, has_more = page.last_sequence, page.has_more
+        if LIFECYCLE.draining:
+            return
+
+
+def load_last_sequence(customer_alias: str) -> int:
+    """
+    Load the last sequence number of a customer's change log.
+
+    :param customer_alias: Customer alias.
+    :return: Last sequence number.
+    """
+    with SessionLocal() as db_session:
+        return get_last_sequence(customer_alias, db_session)
+
+
+async def _next_changes(
+    listener: BadgeListener,
+    last_sequence: int,
+) -> AsyncIterator[List[BadgeChangeSchema]]:
+    """
+    Wait for the changes following the last one sent.
+
+    :param listener: Listener of the stream.
+    :param last_sequence: Sequence number of the last change sent.
+    :return: Changes to send in order, nothing if none arrived in time.
+    """
+    try:
+        change = await asyncio.wait_for(listener.queue.get(), POLL_INTERVAL)
+    except asyncio.TimeoutError:
+        return
+    if change is not None and change.sequence <= last_sequence:
+        return
+    if change is not None and change.sequence == last_sequence + 1:
+        yield [change]
+        return
+    until = None if change is None else change.sequence
+    async for changes in _catch_up(listener.customer_alias, last_sequence, until):
+        yield changes
+
+
+def check_resumable(customer_alias: str, last_event_id: int) -> None:
+    """
+    Check a stream can resume after an event from the change log.
+
+    :param customer_alias: Customer alias.
+    :param last_event_id: Sequence number of the last change the client has.
+    :raises HTTPException: 410 Gone if changes after it were pruned.
+    """
+    with SessionLocal() as db_session:
+        ensure_changes_retained(customer_alias, last_event_id, db_session)
+
+
+async def _first_sequence(listener: BadgeListener, last_event_id: Optional[int]) -> int:
+    """
+    Get the sequence number a stream starts after.
+
+    :param listener: Listener of the stream.
+    :param last_event_id: Sequence number of the last change the client has.
+    :return: Sequence number of the last change sent, the last one of the
+        change log for new clients.
+    """
+    if last_event_id is None:
+        return await run_in_threadpool(load_last_sequence, listener.customer_alias)
+    listener.lag()
+    return last_event_id
+
+
+async def stream_badge_events(
+    customer_alias: str,
+    last_event_id: Optional[int] = None,
+    hub: BadgeEventHub = BADGE_EVENTS,
+    heartbeat: float = app_config.badge_events_heartbeat,
+) -> AsyncIterator[str]:
+    """
+    Stream a customer's badge changes as server-sent events.
+
+    Changes after last_event_id are first replayed from the change log. Live
+    changes follow; when sequence numbers show that some were missed, or the
+    stream lagged behind, they are read from the change log too, so clients
+    see every change once and in order. The stream ends when the process
+    drains, and clients resume elsewhere with the Last-Event-ID header.
+
+    :param customer_alias: Customer alias.
+    :param last_event_id: Sequence number of the last change the client has.
+    :param hub: Hub receiving published changes.
+    :param heartbeat: Seconds of inactivity before a heartbeat comment.
+    :return: Server-sent events.
+    """
+    listener = hub.subscribe(customer_alias)
+    try:
+        yield f"retry: {CLIENT_RETRY}\n\n"
+        last_sequence = await _first_sequence(listener, last_event_id)
+
+        last_sent = time.monotonic()
+        while not LIFECYCLE.draining:
+            async for changes in _next_changes(listener, last_sequence):
+                for change in changes:
+                    last_sequence, last_sent = change.sequence, time.monotonic()
+                    yield format_badge_event(change)
+            if time.monotonic() - last_sent >= heartbeat:
+                last_sent = time.monotonic()
+                yield ": heartbeat\n\n"
+    finally:
+        hub.unsubscribe(listener)
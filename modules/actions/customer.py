@@ -1,78 +1,224 @@
 """Customer configuration actions"""
 
 import csv
+import hashlib
 import json
-from typing import Any, Dict, List
+import logging
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional
 
 import redis
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.background import BackgroundScheduler
+from cachetools import TTLCache
 from fastapi import HTTPException, status
 
+from modules.actions.customer_backends import CustomerConfigBackend, CustomerData
+from modules.utilities.circuit_breaker import CircuitBreaker
+from modules.utilities.host_lock import HostLock
+from modules.utilities.metrics import METRICS
 
-class CustomerConfig:
+logger = logging.getLogger(__name__)
+
+# Seconds a refresh may run late before token claims stop being trusted.
+GENERATION_GRACE = 5
+
+
+def parse_badge_names(row: Dict[str, Any]) -> List[str]:
+    """
+    Get the badge names of a customers.csv row.
+
+    :param row: Row read by csv.DictReader.
+    :return: Badge names, from the non-empty badge columns.
+    """
+    return [
+        badge
+        for column, badge in row.items()
+        if column and column.startswith("badge") and badge
+    ]
+
+
+def _parse_optional_number(value: Optional[str], number_type: type) -> Optional[Any]:
+    """
+    Parse an optional numeric customers.csv cell.
+
+    :param value: Cell value.
+    :param number_type: int or float.
+    :return: Parsed number, None if the cell is empty.
+    """
+    return number_type(value) if value else None
+
+
+def config_generation(customer_data: CustomerData) -> int:
+    """
+    Derive a generation number from the content of customer configurations.
+
+    Every process loading the same customers.csv derives the same generation,
+    so it needs no coordination and only changes when a configuration does.
+
+    :param customer_data: Configurations by customer ID.
+    :return: 64-bit generation number.
+    """
+    content = json.dumps(customer_data, sort_keys=True).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(content, digest_size=8).digest(), "big")
+
+
+# Settings, the refresh scheduler and the last known good configurations
+# a failed refresh falls back on are one unit.
+class CustomerConfig:  # pylint: disable=too-many-instance-attributes
     """
     Customer configuration manager.
+
+    Unknown customers are rejected without asking the backend: each refresh
+    rebuilds the set of known aliases, and aliases the backend did not know
+    are remembered for a short time, so scans of made-up aliases cost no
+    network calls.
+
+    With a host lock, only the process holding it publishes to a shared
+    backend; the other processes of the host reload what it published.
+
+    With a circuit breaker, Redis errors do not fail lookups: they are
+    answered from the configurations last loaded from customers.csv by this
+    process, and so is every lookup while the circuit is open.
     """
 
-    def __init__(self, redis_host: str, redis_port: int, refresh_rate: int = 3) -> None:
+    def __init__(
+        self,
+        backend: CustomerConfigBackend,
+        refresh_rate: int = 3,
+        unknown_alias_ttl: float = 5,
+        unknown_alias_cache_size: int = 10000,
+        host_lock: Optional[HostLock] = None,
+        customers_path: str = "customers.csv",
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
         """
         Initialize the CustomerConfig.
 
-        :param redis_host: Redis host address.
-        :param redis_port: Redis port.
+        Backends local to this process are loaded right away, so lookups work
+        before the refresh task is started.
+
+        :param backend: Customer configuration storage backend.
         :param refresh_rate: Refresh rate in seconds.
+        :param unknown_alias_ttl: Seconds a backend miss is remembered for.
+        :param unknown_alias_cache_size: Number of backend misses remembered.
+        :param host_lock: Lock electing the process publishing to a shared
+            backend, None for every process to publish.
+        :param customers_path: Path of the customers CSV file.
+        :param breaker: Circuit breaker around the Redis calls of the backend,
+            None to let their errors propagate.
         """
-        self.redis_host = redis_host
-        self.redis_port = redis_port
+        self.backend = backend
+        self.host_lock = host_lock
+        self.customers_path = customers_path
+        self.breaker = breaker
+        self.last_known_good: CustomerData = {}
         self.refresh_rate = refresh_rate
-        self.cache = redis.Redis(host=self.redis_host, port=self.redis_port, db=0)
         self.scheduler = AsyncIOScheduler()
+        self.refreshed_at: Optional[float] = None
+        self.generation: Optional[int] = None
+        self.known_aliases: Optional[FrozenSet[str]] = None
+        self._unknown_aliases = TTLCache(
+            maxsize=unknown_alias_cache_size,
+            ttl=unknown_alias_ttl,
+        )
+        self._lock = threading.Lock()
+        if not backend.shared:
+            self._refresh_config()
 
     @staticmethod
-    def _load_config() -> Dict[str, Any]:
+    def _load_config(path: str = "customers.csv") -> CustomerData:
         """
         Load customer configurations from CSV.
 
+        :param path: Path of the customers CSV file.
         :return: Dictionary containing customer information.
         """
         customer_data = {}
-        with open("customers.csv", mode="r") as file:
+        with open(path, mode="r") as file:
             csv_reader = csv.DictReader(file)
             for row in csv_reader:
                 customer_id = row["customer_id"]
-                customer_status = row["status"]
-                badge_names = [
-                    badge
-                    for badge in row.values()
-                    if badge and badge != customer_id and badge != customer_status
-                ]
-
                 customer_info = {
                     "customer_id": customer_id,
-                    "status": customer_status,
-                    "badges": badge_names,
+                    "status": row["status"],
+                    "badges": parse_badge_names(row),
+                    "rate_limit": _parse_optional_number(row.get("rate_limit"), float),
+                    "rate_burst": _parse_optional_number(row.get("rate_burst"), int),
                 }
                 customer_data[customer_id] = customer_info
         return customer_data
 
+    def is_known_alias(self, customer_id: str) -> bool:
+        """
+        Check whether a customer may exist, without asking the backend.
+
+        :param customer_id: Customer ID.
+        :return: False if the alias is not in the last loaded configurations or
+            the backend recently did not know it.
+        """
+        known_aliases = self.known_aliases
+        if known_aliases is not None and customer_id not in known_aliases:
+            return False
+        with self._lock:
+            return customer_id not in self._unknown_aliases
+
     def get_customer_config(self, customer_id: str) -> Dict[str, Any]:
         """
-        Fetch customer configuration from Redis.
+        Fetch customer configuration from the backend.
 
         :param customer_id: Customer ID.
         :return: Customer configuration.
         :raises HTTPException: If customer is not registered.
         """
-        customer_info = self.cache.hget(customer_id, "customer_info")
+        unregistered_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unregistered customer",
+        )
+        if not self.is_known_alias(customer_id):
+            METRICS.increment("unknown_customer_rejections_total")
+            raise unregistered_exception
+
+        customer_info = self._lookup(customer_id)
 
         if customer_info is None:
+            with self._lock:
+                self._unknown_aliases[customer_id] = True
+            raise unregistered_exception
+
+        return customer_info
+
+    def _lookup(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look a customer up in the backend, or in the last known good
+        configurations if Redis fails or the circuit is open.
+
+        :param customer_id: Customer ID.
+        :return: Customer configuration, None if the customer is unknown.
+        :raises HTTPException: If Redis fails before any configurations were
+            loaded.
+        """
+        if self.breaker is None:
+            return self.backend.get(customer_id)
+
+        if self.breaker.allow():
+            try:
+                customer_info = self.backend.get(customer_id)
+            except redis.RedisError as redis_error:
+                self.breaker.record_failure()
+                logger.warning("Unable to look customer up: %s", redis_error)
+            else:
+                self.breaker.record_success()
+                return customer_info
+
+        if not self.last_known_good:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Unregistered customer",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Customer configuration unavailable",
             )
-
-        customer_info_str = customer_info.decode("utf-8")
-        return json.loads(customer_info_str)
+        METRICS.increment("customer_config_fallbacks_total")
+        return self.last_known_good.get(customer_id)
 
     def is_valid_customer_badges(self, customer_alias: str, badges: List[str]) -> bool:
         """
@@ -91,23 +237,78 @@ class CustomerConfig:
 
         return True
 
+    def _publishes(self) -> bool:
+        """
+        Check whether this process publishes to the backend.
+
+        :return: True for local backends, and for shared backends unless
+            another process of the host holds the host lock.
+        """
+        if not self.backend.shared or self.host_lock is None:
+            return True
+        return self.host_lock.acquire()
+
+    def _publish(self, customer_data: CustomerData) -> None:
+        """
+        Publish configurations to the backend, unless the circuit is open.
+
+        Failures to publish through the circuit breaker are logged, and the
+        next refresh publishes again.
+
+        :param customer_data: Configurations by customer ID.
+        """
+        if self.breaker is None:
+            self.backend.publish(customer_data)
+            return
+
+        if not self.breaker.allow():
+            return
+        try:
+            self.backend.publish(customer_data)
+        except redis.RedisError as redis_error:
+            self.breaker.record_failure()
+            logger.warning("Unable to publish customer configs: %s", redis_error)
+        else:
+            self.breaker.record_success()
+
     def _refresh_config(self) -> None:
         """
-        Refresh customer configurations and update Redis.
+        Refresh customer configurations and publish them to the backend.
         """
         print("Refreshing customer configurations...")
-        customer_data = self._load_config()
-        # Store customer data in Redis
-        for customer_id, customer_info in customer_data.items():
-            self.cache.hset(
-                customer_id,
-                "customer_info",
-                json.dumps(customer_info),
-            )
+        customer_data = self._load_config(self.customers_path)
+        if self.breaker is not None:
+            self.last_known_good = customer_data
+        if self._publishes():
+            self._publish(customer_data)
+        else:
+            self.backend.reload()
+        self.generation = config_generation(customer_data)
+        self.known_aliases = frozenset(customer_data)
+        with self._lock:
+            self._unknown_aliases.clear()
+        self.refreshed_at = time.time()
 
-    async def start_refresh_task(self) -> None:
+    @property
+    def current_generation(self) -> Optional[int]:
         """
-        Start the scheduled refresh task.
+        Generation of the loaded configurations, None unless they were refreshed
+        within the last refresh interval plus GENERATION_GRACE seconds.
+
+        Claims issued for a generation may be trusted while it is current, as a
+        configuration change gives a new generation on the next refresh. The
+        grace only covers a refresh running late, so a missed refresh stops
+        claims from being trusted right away.
+        """
+        if self.refreshed_at is None:
+            return None
+        if time.time() - self.refreshed_at > self.refresh_rate + GENERATION_GRACE:
+            return None
+        return self.generation
+
+    def _schedule_refresh(self) -> None:
+        """
+        Refresh the configurations now and then every refresh_rate seconds.
         """
         print("Scheduling refresh task...")
         self._refresh_config()
@@ -118,3 +319,24 @@ class CustomerConfig:
         )
         self.scheduler.start()
         print("Refresh task scheduled.")
+
+    async def start_refresh_task(self) -> None:
+        """
+        Start the scheduled refresh task.
+        """
+        self._schedule_refresh()
+
+    def start_background_refresh_task(self) -> None:
+        """
+        Start the scheduled refresh task in a thread, for processes without an
+        event loop such as job workers.
+        """
+        self.scheduler = BackgroundScheduler()
+        self._schedule_refresh()
+
+    def stop_refresh_task(self) -> None:
+        """
+        Stop the scheduled refresh task.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
@@ -0,0 +1,392 @@
+"""Customer configuration storage backends"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import redis
+
+from modules.actions.customer_snapshot import (
+    CustomerData,
+    CustomerSnapshot,
+    encode_snapshot,
+    snapshot_digest,
+)
+
+GENERATION = struct.Struct("=Q")
+
+
+class CustomerConfigBackend(ABC):
+    """
+    Storage of customer configurations.
+
+    The refresh task publishes the configurations loaded from customers.csv;
+    request handlers look customers up. Shared backends are published by one
+    process and read by all of them, each process calling reload() to pick up
+    a new publication.
+    """
+
+    shared = True
+
+    @abstractmethod
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a customer's configuration.
+
+        :param customer_id: Customer ID.
+        :return: Customer configuration, None if the customer is unknown.
+        """
+
+    @abstractmethod
+    def publish(self, customer_data: CustomerData) -> None:
+        """
+        Publish freshly loaded customer configurations.
+
+        :param customer_data: Configurations by customer ID.
+        """
+
+    def reload(self) -> None:
+        """
+        Pick up configurations published by another process.
+        """
+
+
+class RedisConfigBackend(CustomerConfigBackend):
+    """
+    Stores each customer's configuration in a Redis hash.
+    """
+
+    def __init__(self, cache: redis.Redis) -> None:
+        """
+        Initialize the RedisConfigBackend.
+
+        :param cache: Redis client.
+        """
+        self.cache = cache
+
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a customer's configuration from Redis.
+
+        :param customer_id: Customer ID.
+        :return: Customer configuration, None if the customer is unknown.
+        """
+        customer_info = self.cache.hget(customer_id, "customer_info")
+        if customer_info is None:
+            return None
+        return json.loads(customer_info.decode("utf-8"))
+
+    def publish(self, customer_data: CustomerData) -> None:
+        """
+        Store customer configurations in Redis.
+
+        :param customer_data: Configurations by customer ID.
+        """
+        pipeline = self.cache.pipeline(transaction=False)
+        for customer_id, customer_info in customer_data.items():
+            pipeline.hset(customer_id, "customer_info", json.dumps(customer_info))
+        pipeline.execute()
+
+
+class InMemoryConfigBackend(CustomerConfigBackend):
+    """
+    Keeps customer configurations in a dictionary of this process.
+
+    A refresh builds a new dictionary and swaps the reference, so lookups never
+    see a half-built snapshot and need no lock.
+    """
+
+    shared = False
+
+    def __init__(self) -> None:
+        """
+        Initialize the InMemoryConfigBackend.
+        """
+        self._snapshot: CustomerData = {}
+
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a customer's configuration in the current snapshot.
+
+        :param customer_id: Customer ID.
+        :return: Customer configuration, None if the customer is unknown.
+        """
+        return self._snapshot.get(customer_id)
+
+    def publish(self, customer_data: CustomerData) -> None:
+        """
+        Replace the current snapshot.
+
+        :param customer_data: Configurations by customer ID.
+        """
+        self._snapshot = dict(customer_data)
+
+
+class SnapshotConfigBackend(CustomerConfigBackend):
+    """
+    Shares customer configurations between the processes of a host through
+    binary snapshots mapped read-only in every process.
+
+    Each publication gets a higher generation number. Processes swap to a new
+    snapshot only if its generation is higher than the one they map, and keep
+    the previous snapshot open until the next swap so lookups still running on
+    it finish. Publishing configurations equal to the current snapshot is a
+    no-op, so every process may run the refresh task.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the SnapshotConfigBackend.
+        """
+        self._snapshot: Optional[CustomerSnapshot] = None
+        self._previous: Optional[CustomerSnapshot] = None
+
+    @property
+    def generation(self) -> int:
+        """
+        Generation of the mapped snapshot, 0 if none is mapped.
+        """
+        return self._snapshot.generation if self._snapshot is not None else 0
+
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a customer's configuration in the mapped snapshot.
+
+        :param customer_id: Customer ID.
+        :return: Customer configuration, None if the customer is unknown.
+        """
+        snapshot = self._snapshot
+        return snapshot.get(customer_id) if snapshot is not None else None
+
+    def _swap(self, snapshot: CustomerSnapshot) -> None:
+        """
+        Swap to a snapshot if it is newer than the mapped one.
+
+        :param snapshot: Newly mapped snapshot.
+        """
+        if snapshot.generation <= self.generation:
+            snapshot.close()
+            return
+        retired, self._previous, self._snapshot = (
+            self._previous,
+            self._snapshot,
+            snapshot,
+        )
+        if retired is not None:
+            retired.close()
+
+    @abstractmethod
+    def _write(self, snapshot: bytes, generation: int) -> None:
+        """
+        Make an encoded snapshot visible to every process.
+
+        :param snapshot: Snapshot bytes.
+        :param generation: Snapshot generation.
+        """
+
+    def publish(self, customer_data: CustomerData) -> None:
+        """
+        Publish a new snapshot unless the configurations are unchanged.
+
+        Generations are derived from the clock so they keep increasing across
+        restarts of the publishing processes.
+
+        :param customer_data: Configurations by customer ID.
+        """
+        self.reload()
+        generation = max(self.generation + 1, time.time_ns())
+        snapshot = encode_snapshot(customer_data, generation)
+        current = self._snapshot
+        if current is not None and current.digest == snapshot_digest(snapshot):
+            return
+        self._write(snapshot, generation)
+        self.reload()
+
+
+class MmapConfigBackend(SnapshotConfigBackend):
+    """
+    Publishes customer configuration snapshots to a file that every process
+    memory-maps.
+
+    The publisher writes a new file and renames it over the old one, so readers
+    always map a complete snapshot.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the MmapConfigBackend.
+
+        :param path: Snapshot file path.
+        """
+        super().__init__()
+        self.path = path
+        self._file_id: Optional[Tuple[int, int]] = None
+
+    def _write(self, snapshot: bytes, generation: int) -> None:
+        """
+        Write a new snapshot file and rename it into place.
+
+        :param snapshot: Snapshot bytes.
+        :param generation: Snapshot generation.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(file_descriptor, "wb") as snapshot_file:
+            snapshot_file.write(snapshot)
+        os.replace(temporary_path, self.path)
+
+    def reload(self) -> None:
+        """
+        Map the snapshot file if it was replaced since the last reload.
+        """
+        try:
+            file_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_id = (file_stat.st_ino, file_stat.st_mtime_ns)
+        if file_id == self._file_id:
+            return
+
+        with open(self.path, "rb") as snapshot_file:
+            mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._file_id = file_id
+        self._swap(CustomerSnapshot(mapping, owner=mapping))
+
+
+class SharedMemoryConfigBackend(SnapshotConfigBackend):
+    """
+    Publishes customer configuration snapshots to POSIX shared memory.
+
+    Every generation gets its own segment, named after the generation. A small
+    control segment holds the current generation, which readers check on
+    reload before attaching the matching segment. Segments are unlinked by the
+    process that created them, two publications later or when it exits;
+    processes that attached them keep their mapping.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Initialize the SharedMemoryConfigBackend.
+
+        :param name: Name of the control segment, prefixing snapshot segments.
+        """
+        super().__init__()
+        self.name = name
+        self._published: Deque[shared_memory.SharedMemory] = deque()
+
+    @staticmethod
+    def _attach(name: str) -> shared_memory.SharedMemory:
+        """
+        Attach an existing segment without taking ownership of it.
+
+        Before Python 3.13 the resource tracker unlinks attached segments when
+        the process exits, as if it had created them.
+
+        :param name: Segment name.
+        :return: Shared memory segment.
+        """
+        segment = shared_memory.SharedMemory(name=name)
+        # The tracker registered the POSIX name, which has a leading slash.
+        resource_tracker.unregister(f"/{segment.name}", "shared_memory")
+        return segment
+
+    def _segment_name(self, generation: int) -> str:
+        """
+        Build the name of a snapshot segment.
+
+        :param generation: Snapshot generation.
+        :return: Segment name.
+        """
+        return f"{self.name}_{generation}"
+
+    def _control(self) -> shared_memory.SharedMemory:
+        """
+        Attach the control segment, creating it if needed.
+
+        :return: Control segment.
+        """
+        try:
+            return shared_memory.SharedMemory(
+                name=self.name,
+                create=True,
+                size=GENERATION.size,
+            )
+        except FileExistsError:
+            return self._attach(self.name)
+
+    def _write(self, snapshot: bytes, generation: int) -> None:
+        """
+        Copy a snapshot to a new segment and make it current.
+
+        :param snapshot: Snapshot bytes.
+        :param generation: Snapshot generation.
+        """
+        segment = shared_memory.SharedMemory(
+            name=self._segment_name(generation),
+            create=True,
+            size=len(snapshot),
+        )
+        segment.buf[: len(snapshot)] = snapshot
+        control = self._control()
+        GENERATION.pack_into(control.buf, 0, generation)
+        control.close()
+
+        self._published.append(segment)
+        while len(self._published) > 2:
+            retired = self._published.popleft()
+            retired.close()
+            retired.unlink()
+
+    def reload(self) -> None:
+        """
+        Attach the current snapshot segment if it is newer than the mapped one.
+        """
+        try:
+            control = self._attach(self.name)
+        except FileNotFoundError:
+            return
+        (generation,) = GENERATION.unpack_from(control.buf, 0)
+        control.close()
+        if generation <= self.generation:
+            return
+
+        try:
+            segment = self._attach(self._segment_name(generation))
+        except FileNotFoundError:
+            # Superseded and unlinked meanwhile, the next reload catches up.
+            return
+        self._swap(CustomerSnapshot(segment.buf, owner=segment))
+
+
+def create_config_backend(
+    name: str,
+    cache: Optional[redis.Redis] = None,
+    snapshot_path: Optional[str] = None,
+    snapshot_name: Optional[str] = None,
+) -> CustomerConfigBackend:
+    """
+    Create the customer configuration backend selected in the app config.
+
+    :param name: "redis", "memory", "mmap" or "shared_memory".
+    :param cache: Redis client, for the redis backend.
+    :param snapshot_path: Snapshot file path, for the mmap backend.
+    :param snapshot_name: Shared memory name, for the shared_memory backend.
+    :return: Customer configuration backend.
+    :raises ValueError: If the backend name is unknown.
+    """
+    if name == "redis":
+        return RedisConfigBackend(cache)
+    if name == "memory":
+        return InMemoryConfigBackend()
+    if name == "mmap":
+        return MmapConfigBackend(snapshot_path)
+    if name == "shared_memory":
+        return SharedMemoryConfigBackend(snapshot_name)
+    raise ValueError(f"Unknown customer config backend: {name}")
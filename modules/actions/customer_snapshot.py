@@ -0,0 +1,150 @@
+"""Binary customer configuration snapshots"""
+
+import hashlib
+import json
+import struct
+from typing import Any, Dict, Optional
+
+CustomerData = Dict[str, Dict[str, Any]]
+
+# Snapshots never leave the host, so native byte order is used and the index
+# can be read through a memoryview cast without unpacking.
+SNAPSHOT_MAGIC = b"CCS2"
+SNAPSHOT_HEADER = struct.Struct("=4sQI16s")
+SNAPSHOT_ENTRY = struct.Struct("=IIII")
+ENTRY_FIELDS = 4
+
+
+def encode_snapshot(customer_data: CustomerData, generation: int) -> bytes:
+    """
+    Encode customer configurations as a binary snapshot.
+
+    The snapshot holds a header (magic, generation, customer count and digest
+    of the content), an index of (key offset, key length, value offset, value
+    length) entries sorted by key, then the keys and the JSON encoded
+    configurations.
+
+    :param customer_data: Configurations by customer ID.
+    :param generation: Snapshot generation, newer snapshots having higher ones.
+    :return: Snapshot bytes.
+    """
+    items = sorted(
+        (customer_id.encode("utf-8"), json.dumps(customer_info).encode("utf-8"))
+        for customer_id, customer_info in customer_data.items()
+    )
+    offset = SNAPSHOT_HEADER.size + SNAPSHOT_ENTRY.size * len(items)
+    index, data = [], []
+    for key, value in items:
+        value_offset = offset + len(key)
+        index.append(SNAPSHOT_ENTRY.pack(offset, len(key), value_offset, len(value)))
+        data.extend((key, value))
+        offset += len(key) + len(value)
+
+    content = b"".join(index + data)
+    digest = hashlib.blake2b(content, digest_size=16).digest()
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(items), digest)
+    return header + content
+
+
+def snapshot_digest(snapshot: bytes) -> bytes:
+    """
+    Get the content digest of an encoded snapshot.
+
+    :param snapshot: Snapshot bytes.
+    :return: Digest, equal for snapshots of equal configurations.
+    """
+    return SNAPSHOT_HEADER.unpack_from(snapshot, 0)[3]
+
+
+class CustomerSnapshot:
+    """
+    Read-only view of a snapshot mapped in memory.
+
+    Lookups binary search the mapped index and decode only the configuration
+    found. Decoded configurations are kept for the life of the snapshot, so
+    repeated lookups of a customer are a dictionary hit and allocate nothing;
+    callers must not modify them.
+    """
+
+    def __init__(self, buffer: Any, owner: Optional[Any] = None) -> None:
+        """
+        Initialize the CustomerSnapshot.
+
+        :param buffer: Snapshot buffer, e.g. an mmap or a shared memory buffer.
+        :param owner: Object to close with the snapshot, owning the buffer.
+        :raises ValueError: If the buffer does not hold a snapshot.
+        """
+        magic, generation, count, digest = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a customer config snapshot")
+
+        self.generation: int = generation
+        self.digest: bytes = digest
+        self.count: int = count
+        self._owner = owner
+        self._data = memoryview(buffer)
+        index_end = SNAPSHOT_HEADER.size + SNAPSHOT_ENTRY.size * count
+        self._index = self._data[SNAPSHOT_HEADER.size : index_end].cast("I")
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+
+    def _find(self, key: bytes) -> Optional[memoryview]:
+        """
+        Binary search the index for a key.
+
+        :param key: Encoded customer ID.
+        :return: JSON encoded configuration, None if the key is absent.
+        """
+        index, data = self._index, self._data
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry = middle * ENTRY_FIELDS
+            key_offset = index[entry]
+            candidate = data[key_offset : key_offset + index[entry + 1]].tobytes()
+            if candidate == key:
+                value_offset = index[entry + 2]
+                return data[value_offset : value_offset + index[entry + 3]]
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a customer's configuration.
+
+        :param customer_id: Customer ID.
+        :return: Customer configuration, None if the customer is unknown.
+        """
+        customer_info = self._decoded.get(customer_id)
+        if customer_info is not None:
+            return customer_info
+
+        value = self._find(customer_id.encode("utf-8"))
+        if value is None:
+            return None
+        customer_info = json.loads(value.tobytes())
+        self._decoded[customer_id] = customer_info
+        return customer_info
+
+    def close(self) -> None:
+        """
+        Release the mapping.
+
+        Must only be called once no lookup can still be running on it.
+        """
+        self._index.release()
+        self._data.release()
+        if self._owner is not None:
+            self._owner.close()
+
+    def __del__(self) -> None:
+        """
+        Release the mapping once the snapshot is no longer referenced.
+
+        The owner would otherwise be collected while the views of this snapshot
+        still export its buffer, and fail to close.
+        """
+        if hasattr(self, "_index"):
+            self.close()
@@ -0,0 +1,51 @@
+"""Background job handlers"""
+
+import os
+from typing import Any, Dict
+
+from modules.actions.jobs import ProgressCallback, job_handler
+from modules.actions.user_import import import_users_csv
+from modules.database.schemas.job_schemas import JobOut
+from modules.utilities.database import SessionLocal
+from modules.utilities.streaming import iter_text_lines
+
+USER_IMPORT_JOB = "user_import"
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+
+def remove_spooled_upload(job: JobOut) -> None:
+    """
+    Remove the upload spooled for a job.
+
+    :param job: Job with the upload path in its payload.
+    """
+    try:
+        os.remove(job.payload["path"])
+    except FileNotFoundError:
+        pass
+
+
+@job_handler(USER_IMPORT_JOB, cleanup=remove_spooled_upload)
+def run_user_import(job: JobOut, progress: ProgressCallback) -> Dict[str, Any]:
+    """
+    Import users and badges from a spooled CSV upload.
+
+    Imports are idempotent, so a retried job skips the rows already imported.
+
+    :param job: Job with the upload path in its payload.
+    :param progress: Progress callback.
+    :return: Import summary.
+    """
+    db_session = SessionLocal()
+    try:
+        with open(job.payload["path"], "rb") as upload:
+            chunks = iter(lambda: upload.read(SPOOL_CHUNK_SIZE), b"")
+            summary = import_users_csv(
+                job.customer_alias,
+                iter_text_lines(chunks),
+                db_session,
+                progress=lambda summary: progress(summary.model_dump()),
+            )
+    finally:
+        db_session.close()
+    return summary.model_dump()
@@ -0,0 +1,442 @@
+"""Background job actions"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from uuid import uuid4
+
+import redis
+from fastapi import HTTPException
+
+from modules.database.schemas.job_schemas import JobOut, JobStatus
+from modules.utilities.cache import REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+# Atomically moves the jobs whose delay is over back to the stream.
+PROMOTE_DELAYED_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job_id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('XADD', KEYS[2], '*', 'job_id', job_id)
+end
+return #due
+"""
+
+# Takes one of a customer's job slots, leased until ARGV[2]. Expired leases of
+# crashed workers are dropped first.
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[4])
+    or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    redis.call('PEXPIREAT', KEYS[1], math.floor(tonumber(ARGV[2]) * 1000))
+    return 1
+end
+return 0
+"""
+
+# Seconds before retrying a job whose customer has no free slot.
+SLOT_RETRY_DELAY = 1
+
+
+class JobHandler(NamedTuple):
+    """
+    Functions running a job type.
+
+    run gets the job and a progress callback, and returns the job result.
+    cleanup, if any, is called once the job will not run again.
+    """
+
+    run: Callable[[JobOut, ProgressCallback], Dict[str, Any]]
+    cleanup: Optional[Callable[[JobOut], None]] = None
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(
+    job_type: str,
+    cleanup: Optional[Callable[[JobOut], None]] = None,
+) -> Callable:
+    """
+    Register the decorated function as the handler of a job type.
+
+    :param job_type: Job type.
+    :param cleanup: Function called once a job of this type will not run again.
+    :return: Decorator.
+    """
+
+    def register(run: Callable[[JobOut, ProgressCallback], Dict[str, Any]]):
+        JOB_HANDLERS[job_type] = JobHandler(run, cleanup)
+        return run
+
+    return register
+
+
+# Queue settings sit next to the Lua scripts registered once per client.
+class JobQueue:  # pylint: disable=too-many-instance-attributes
+    """
+    Redis-backed queue of jobs run by worker processes.
+
+    Jobs are stored in hashes and their IDs queued in a stream read through a
+    consumer group. An entry is acknowledged once its job succeeded, failed
+    for good or was delayed; entries of crashed workers are reclaimed after
+    the lease timeout, which running jobs extend every time they report
+    progress. Failed jobs are retried with exponential backoff through a
+    sorted set of delayed jobs, and a customer never has more than
+    tenant_concurrency jobs running at once.
+    """
+
+    group = "job_workers"
+
+    def __init__(
+        self,
+        cache: redis.Redis,
+        stream: str,
+        max_attempts: int,
+        retry_backoff: float,
+        lease_timeout: float,
+        tenant_concurrency: int,
+        ttl: int,
+    ) -> None:
+        """
+        Initialize the JobQueue.
+
+        :param cache: Redis client.
+        :param stream: Redis stream of queued job IDs.
+        :param max_attempts: Attempts before a job is marked as failed.
+        :param retry_backoff: Seconds before the first retry, doubled each time.
+        :param lease_timeout: Seconds without progress before a job is reclaimed.
+        :param tenant_concurrency: Jobs a customer may have running at once.
+        :param ttl: Seconds finished jobs are kept for.
+        """
+        self.cache = cache
+        self.stream = stream
+        self.delayed_key = f"{stream}:delayed"
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_timeout = lease_timeout
+        self.tenant_concurrency = tenant_concurrency
+        self.ttl = ttl
+        self._group_ready = False
+        self._promote_delayed = cache.register_script(PROMOTE_DELAYED_SCRIPT)
+        self._acquire_slot = cache.register_script(ACQUIRE_SLOT_SCRIPT)
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        """
+        Build the Redis key of a job.
+
+        :param job_id: Job ID.
+        :return: Redis key.
+        """
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _slots_key(customer_alias: str) -> str:
+        """
+        Build the Redis key of a customer's running jobs.
+
+        :param customer_alias: Customer alias.
+        :return: Redis key.
+        """
+        return f"jobs_running:{customer_alias}"
+
+    def enqueue(
+        self,
+        job_type: str,
+        customer_alias: str,
+        payload: Dict[str, Any],
+    ) -> JobOut:
+        """
+        Queue a job.
+
+        :param job_type: Job type, with a registered handler.
+        :param customer_alias: Customer the job runs for.
+        :param payload: Job parameters.
+        :return: Queued job.
+        """
+        now = time.time()
+        job_id = uuid4().hex
+        pipeline = self.cache.pipeline()
+        pipeline.hset(
+            self._key(job_id),
+            mapping={
+                "id": job_id,
+                "type": job_type,
+                "customer_alias": customer_alias,
+                "status": JobStatus.QUEUED.value,
+                "attempts": 0,
+                "payload": json.dumps(payload),
+                "created_at": now,
+                "updated_at": now,
+            },
+        )
+        pipeline.xadd(self.stream, {"job_id": job_id})
+        pipeline.execute()
+        METRICS.increment("jobs_total", type=job_type, status=JobStatus.QUEUED.value)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[JobOut]:
+        """
+        Get a job.
+
+        :param job_id: Job ID.
+        :return: Job, None if it does not exist or expired.
+        """
+        fields = self.cache.hgetall(self._key(job_id))
+        if not fields:
+            return None
+        job = {
+            key.decode("utf-8"): value.decode("utf-8") for key, value in fields.items()
+        }
+        for json_field in ("payload", "progress", "result"):
+            if json_field in job:
+                job[json_field] = json.loads(job[json_field])
+        return JobOut(**job)
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        """
+        Update fields of a job.
+
+        :param job_id: Job ID.
+        :param fields: Fields to set, dictionaries being stored as JSON.
+        """
+        mapping = {
+            name: json.dumps(value) if isinstance(value, dict) else value
+            for name, value in fields.items()
+        }
+        mapping["updated_at"] = time.time()
+        self.cache.hset(self._key(job_id), mapping=mapping)
+
+    def _finish(self, job: JobOut, job_status: JobStatus, **fields: Any) -> None:
+        """
+        Record the final status of a job and let it expire.
+
+        :param job: Job.
+        :param job_status: JobStatus.SUCCEEDED or JobStatus.FAILED.
+        :param fields: Other fields to set.
+        """
+        self._update(job.id, status=job_status.value, **fields)
+        self.cache.expire(self._key(job.id), self.ttl)
+        METRICS.increment("jobs_total", type=job.type, status=job_status.value)
+        handler = JOB_HANDLERS.get(job.type)
+        if handler is not None and handler.cleanup is not None:
+            handler.cleanup(job)
+
+    def _delay(self, job_id: str, delay: float) -> None:
+        """
+        Queue a job again after a delay.
+
+        :param job_id: Job ID.
+        :param delay: Seconds to wait.
+        """
+        self.cache.zadd(self.delayed_key, {job_id: time.time() + delay})
+
+    def _ensure_group(self) -> None:
+        """
+        Create the consumer group, and the stream, if they do not exist.
+        """
+        if self._group_ready:
+            return
+        try:
+            self.cache.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as response_error:
+            if "BUSYGROUP" not in str(response_error):
+                raise
+        self._group_ready = True
+
+    def _read(self, consumer: str, block: float) -> List[Tuple[str, str]]:
+        """
+        Read a job, reclaiming one abandoned by a dead worker first.
+
+        :param consumer: Worker name.
+        :param block: Seconds to wait for a job.
+        :return: Entry IDs and job IDs, at most one.
+        """
+        _, entries, *_ = self.cache.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=int(self.lease_timeout * 1000),
+            count=1,
+        )
+        if not entries:
+            response = self.cache.xreadgroup(
+                self.group,
+                consumer,
+                {self.stream: ">"},
+                count=1,
+                block=int(block * 1000),
+            )
+            entries = response[0][1] if response else []
+        return [
+            (entry_id.decode("utf-8"), fields[b"job_id"].decode("utf-8"))
+            for entry_id, fields in entries
+            if fields
+        ]
+
+    def _acknowledge(self, entry_id: str) -> None:
+        """
+        Acknowledge and delete a stream entry.
+
+        :param entry_id: Stream entry ID.
+        """
+        pipeline = self.cache.pipeline()
+        pipeline.xack(self.stream, self.group, entry_id)
+        pipeline.xdel(self.stream, entry_id)
+        pipeline.execute()
+
+    def _take_slot(self, job: JobOut) -> bool:
+        """
+        Take or renew a slot of the job's customer.
+
+        :param job: Job.
+        :return: True if the job may run.
+        """
+        now = time.time()
+        return bool(
+            self._acquire_slot(
+                keys=[self._slots_key(job.customer_alias)],
+                args=[now, now + self.lease_timeout, self.tenant_concurrency, job.id],
+            ),
+        )
+
+    def _progress_callback(
+        self,
+        job: JobOut,
+        consumer: str,
+        entry_id: str,
+    ) -> ProgressCallback:
+        """
+        Build the progress callback of a running job.
+
+        Reporting progress also renews the stream entry and customer slot
+        leases, so jobs are only reclaimed if they stop making progress.
+
+        :param job: Job.
+        :param consumer: Worker name.
+        :param entry_id: Stream entry ID.
+        :return: Progress callback.
+        """
+
+        def report_progress(progress: Dict[str, Any]) -> None:
+            self._update(job.id, progress=progress)
+            self.cache.xclaim(
+                self.stream,
+                self.group,
+                consumer,
+                min_idle_time=0,
+                message_ids=[entry_id],
+                justid=True,
+            )
+            self._take_slot(job)
+
+        return report_progress
+
+    def _run(self, job: JobOut, consumer: str, entry_id: str) -> None:
+        """
+        Run a job and record its outcome.
+
+        HTTP errors are the caller's fault and fail the job right away. Other
+        errors are retried until the job has made max_attempts attempts.
+
+        :param job: Job.
+        :param consumer: Worker name.
+        :param entry_id: Stream entry ID.
+        """
+        attempts = self.cache.hincrby(self._key(job.id), "attempts", 1)
+        self._update(job.id, status=JobStatus.RUNNING.value)
+        try:
+            handler = JOB_HANDLERS[job.type]
+            result = handler.run(job, self._progress_callback(job, consumer, entry_id))
+        except HTTPException as http_exception:
+            self._finish(job, JobStatus.FAILED, error=str(http_exception.detail))
+        except Exception as general_exception:  # pylint: disable=W0703
+            logger.exception("Job %s failed", job.id)
+            if attempts >= self.max_attempts:
+                self._finish(job, JobStatus.FAILED, error=str(general_exception))
+                return
+            self._update(
+                job.id,
+                status=JobStatus.QUEUED.value,
+                error=str(general_exception),
+            )
+            self._delay(job.id, self.retry_backoff * 2 ** (attempts - 1))
+        else:
+            self._finish(job, JobStatus.SUCCEEDED, result=result or {})
+
+    def process(self, consumer: str, entry_id: str, job_id: str) -> None:
+        """
+        Process a stream entry.
+
+        :param consumer: Worker name.
+        :param entry_id: Stream entry ID.
+        :param job_id: Job ID.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            self._acknowledge(entry_id)
+            return
+
+        if not self._take_slot(job):
+            self._delay(job.id, SLOT_RETRY_DELAY)
+            self._acknowledge(entry_id)
+            return
+
+        try:
+            self._run(job, consumer, entry_id)
+        finally:
+            self.cache.zrem(self._slots_key(job.customer_alias), job.id)
+            self._acknowledge(entry_id)
+
+    def run_once(self, consumer: str, block: float = 1) -> int:
+        """
+        Queue delayed jobs that are due, then process the next job.
+
+        :param consumer: Worker name.
+        :param block: Seconds to wait for a job.
+        :return: Number of jobs processed.
+        """
+        self._ensure_group()
+        self._promote_delayed(keys=[self.delayed_key, self.stream], args=[time.time()])
+        entries = self._read(consumer, block)
+        for entry_id, job_id in entries:
+            self.process(consumer, entry_id, job_id)
+        return len(entries)
+
+    def run(self, consumer: str, stop: threading.Event) -> None:
+        """
+        Process jobs until stopped.
+
+        The running job, if any, is finished before returning.
+
+        :param consumer: Worker name.
+        :param stop: Event set to stop the worker.
+        """
+        logger.info("Job worker %s started", consumer)
+        while not stop.is_set():
+            try:
+                self.run_once(consumer)
+            except redis.RedisError as redis_error:
+                logger.error("Job queue unavailable: %s", redis_error)
+                stop.wait(1)
+        logger.info("Job worker %s stopped", consumer)
+
+
+JOB_QUEUE = JobQueue(
+    cache=REDIS_CLIENT,
+    stream=app_config.job_stream,
+    max_attempts=app_config.job_max_attempts,
+    retry_backoff=app_config.job_retry_backoff,
+    lease_timeout=app_config.job_lease_timeout,
+    tenant_concurrency=app_config.job_tenant_concurrency,
+    ttl=app_config.job_ttl,
+)
@@ -0,0 +1,507 @@
+"""Precomputed customer listing snapshots"""
+
+import gzip
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import quote
+from uuid import UUID
+
+import redis
+from apscheduler.schedulers.background import BackgroundScheduler
+from fastapi import Response, status
+from pydantic import TypeAdapter
+
+from modules.actions.badge_changes import get_last_sequence
+from modules.actions.badge_events import badge_change_hook
+from modules.actions.user import load_customer_badge_names
+from modules.database.schemas.user_schemas import BadgeSchema, UserSchema
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+from modules.utilities.compression import ENCODINGS, negotiate_encoding
+from modules.utilities.config import app_config
+from modules.utilities.database import SessionLocal
+from modules.utilities.etag import CUSTOMER_VERSIONS, CustomerVersions, etag_matches
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Magic, customer version, badge change sequence, build time and body length,
+# followed by the JSON body then its gzip encoding, if any.
+LISTING_MAGIC = b"CLS1"
+LISTING_HEADER = struct.Struct("=4sQQdI")
+
+# Seconds an unused snapshot is kept in Redis.
+REDIS_SNAPSHOT_TTL = 86400
+
+USER_LIST = TypeAdapter(List[UserSchema])
+
+
+class ListingSnapshot(NamedTuple):
+    """
+    Serialized listing of a customer's users, as of a customer version.
+    """
+
+    version: int
+    sequence: int
+    built_at: float
+    body: bytes
+    gzip_body: bytes
+
+    def encode(self) -> bytes:
+        """
+        Encode the snapshot for storage.
+
+        :return: Snapshot bytes.
+        """
+        header = LISTING_HEADER.pack(
+            LISTING_MAGIC,
+            self.version,
+            self.sequence,
+            self.built_at,
+            len(self.body),
+        )
+        return header + self.body + self.gzip_body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "ListingSnapshot":
+        """
+        Decode a stored snapshot.
+
+        :param data: Snapshot bytes.
+        :return: Snapshot.
+        :raises ValueError: If the data does not hold a snapshot.
+        """
+        magic, version, sequence, built_at, body_length = LISTING_HEADER.unpack_from(
+            data,
+            0,
+        )
+        if magic != LISTING_MAGIC:
+            raise ValueError("Not a listing snapshot")
+        body_end = LISTING_HEADER.size + body_length
+        return cls(
+            version,
+            sequence,
+            built_at,
+            data[LISTING_HEADER.size : body_end],
+            data[body_end:],
+        )
+
+
+class ListingSnapshotStore(ABC):
+    """
+    Storage of encoded listing snapshots, shared by the API processes.
+    """
+
+    @abstractmethod
+    def load(self, customer_alias: str) -> Optional[bytes]:
+        """
+        Load a customer's snapshot.
+
+        :param customer_alias: Customer alias.
+        :return: Snapshot bytes, None if there is none.
+        """
+
+    @abstractmethod
+    def save(self, customer_alias: str, data: bytes) -> None:
+        """
+        Replace a customer's snapshot.
+
+        :param customer_alias: Customer alias.
+        :param data: Snapshot bytes.
+        """
+
+
+class RedisListingSnapshotStore(ListingSnapshotStore):
+    """
+    Stores snapshots in Redis, for deployments spanning several hosts.
+    """
+
+    def __init__(self, cache: redis.Redis) -> None:
+        """
+        Initialize the RedisListingSnapshotStore.
+
+        :param cache: Redis client.
+        """
+        self.cache = cache
+
+    @staticmethod
+    def _key(customer_alias: str) -> str:
+        """
+        Build the Redis key of a customer's snapshot.
+
+        :param customer_alias: Customer alias.
+        :return: Redis key.
+        """
+        return f"listing_snapshot:{customer_alias}"
+
+    def load(self, customer_alias: str) -> Optional[bytes]:
+        """
+        Fetch a customer's snapshot from Redis.
+
+        :param customer_alias: Customer alias.
+        :return: Snapshot bytes, None if there is none.
+        """
+        return self.cache.get(self._key(customer_alias))
+
+    def save(self, customer_alias: str, data: bytes) -> None:
+        """
+        Store a customer's snapshot in Redis.
+
+        :param customer_alias: Customer alias.
+        :param data: Snapshot bytes.
+        """
+        self.cache.set(self._key(customer_alias), data, ex=REDIS_SNAPSHOT_TTL)
+
+
+class DiskListingSnapshotStore(ListingSnapshotStore):
+    """
+    Stores snapshots as files, for the API processes of a single host.
+
+    Files are replaced atomically, so readers never see a partial snapshot.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Initialize the DiskListingSnapshotStore.
+
+        :param directory: Directory holding the snapshot files.
+        """
+        self.directory = directory
+
+    def _path(self, customer_alias: str) -> str:
+        """
+        Build the path of a customer's snapshot file.
+
+        :param customer_alias: Customer alias.
+        :return: File path.
+        """
+        file_name = f"{quote(customer_alias, safe='')}.listing"
+        return os.path.join(self.directory, file_name)
+
+    def load(self, customer_alias: str) -> Optional[bytes]:
+        """
+        Read a customer's snapshot file.
+
+        :param customer_alias: Customer alias.
+        :return: Snapshot bytes, None if there is none.
+        """
+        try:
+            with open(self._path(customer_alias), "rb") as snapshot_file:
+                return snapshot_file.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, customer_alias: str, data: bytes) -> None:
+        """
+        Write a customer's snapshot file.
+
+        :param customer_alias: Customer alias.
+        :param data: Snapshot bytes.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as snapshot_file:
+                snapshot_file.write(data)
+            os.replace(temporary_path, self._path(customer_alias))
+        except OSError:
+            os.unlink(temporary_path)
+            raise
+
+
+def create_listing_snapshot_store(
+    name: str,
+    cache: Optional[redis.Redis] = None,
+    directory: Optional[str] = None,
+) -> Optional[ListingSnapshotStore]:
+    """
+    Create the listing snapshot store selected in the app config.
+
+    :param name: "off", "redis" or "disk".
+    :param cache: Redis client, for the redis store.
+    :param directory: Snapshot directory, for the disk store.
+    :return: Listing snapshot store, None if snapshots are off.
+    :raises ValueError: If the store name is unknown.
+    """
+    if name == "off":
+        return None
+    if name == "redis":
+        return RedisListingSnapshotStore(cache)
+    if name == "disk":
+        return DiskListingSnapshotStore(directory)
+    raise ValueError(f"Unknown listing snapshot store: {name}")
+
+
+def serialize_listing(
+    customer_alias: str,
+    badge_names: Dict[UUID, List[str]],
+) -> bytes:
+    """
+    Serialize a customer's users as the /users/by_customer/ body.
+
+    :param customer_alias: Customer alias.
+    :param badge_names: Badge names per user ID.
+    :return: JSON body.
+    """
+    return USER_LIST.dump_json(
+        [
+            UserSchema(
+                id=user_id,
+                customer_alias=customer_alias,
+                badges=[BadgeSchema(badge_name=name) for name in user_badge_names],
+            )
+            for user_id, user_badge_names in badge_names.items()
+        ],
+    )
+
+
+# Staleness and debounce settings sit next to the rebuild scheduler and
+# the debounce state it reads.
+class ListingSnapshots:  # pylint: disable=too-many-instance-attributes
+    """
+    Serves customer listings from precomputed snapshots.
+
+    Badge mutations schedule a rebuild of the customer's snapshot, debounced
+    so a burst of mutations costs one rebuild, yet delayed by max_delay at
+    most while mutations keep coming. A snapshot is served while it is at the
+    customer's current version, or while it is younger than max_age if a
+    bounded staleness is acceptable; otherwise the listing is built live.
+
+    Snapshots hold committed badges only: writes still queued for
+    write-behind are not visible until flushed.
+    """
+
+    def __init__(
+        self,
+        store: Optional[ListingSnapshotStore],
+        versions: CustomerVersions,
+        debounce: float = 1,
+        max_delay: float = 5,
+        max_age: float = 0,
+        gzip_level: int = 6,
+    ) -> None:
+        """
+        Initialize the ListingSnapshots.
+
+        :param store: Snapshot store, None to disable snapshots.
+        :param versions: Customer versions snapshots are labelled with.
+        :param debounce: Seconds without mutation before a rebuild.
+        :param max_delay: Seconds a rebuild is postponed by debouncing at most.
+        :param max_age: Seconds an outdated snapshot may still be served.
+        :param gzip_level: Level snapshots are precompressed at, 0 to disable.
+        """
+        self.store = store
+        self.versions = versions
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self.gzip_level = gzip_level
+        self.scheduler = BackgroundScheduler()
+        self._first_scheduled: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether listings are served from snapshots.
+        """
+        return self.store is not None
+
+    def build(self, customer_alias: str) -> Optional[ListingSnapshot]:
+        """
+        Build and store a customer's snapshot.
+
+        The version is read before the query, so the snapshot is never
+        labelled with a version newer than its content.
+
+        :param customer_alias: Customer alias.
+        :return: Snapshot, None if the version is unavailable or there are no
+            users to list.
+        """
+        version = self.versions.get(customer_alias)
+        if version is None:
+            return None
+        with SessionLocal() as db_session:
+            sequence = get_last_sequence(customer_alias, db_session)
+            badge_names = load_customer_badge_names(customer_alias, db_session)
+        if not badge_names:
+            return None
+
+        body = serialize_listing(customer_alias, badge_names)
+        gzip_body = gzip.compress(body, self.gzip_level) if self.gzip_level else b""
+        snapshot = ListingSnapshot(version, sequence, time.time(), body, gzip_body)
+        self.store.save(customer_alias, snapshot.encode())
+        METRICS.increment("listing_snapshot_builds_total")
+        return snapshot
+
+    def _rebuild(self, customer_alias: str) -> None:
+        """
+        Rebuild a customer's snapshot from the scheduler, logging failures.
+
+        :param customer_alias: Customer alias.
+        """
+        with self._lock:
+            self._first_scheduled.pop(customer_alias, None)
+        try:
+            self.build(customer_alias)
+        # pylint: disable=broad-except
+        except Exception as build_error:
+            logger.exception(
+                "Unable to build listing snapshot of %s: %s",
+                customer_alias,
+                build_error,
+            )
+
+    def schedule_rebuild(self, customer_alias: str) -> None:
+        """
+        Rebuild a customer's snapshot once its badges stop changing.
+
+        :param customer_alias: Customer alias.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            first_scheduled = self._first_scheduled.setdefault(customer_alias, now)
+            if not self.scheduler.running:
+                self.scheduler.start()
+        run_at = min(now + self.debounce, first_scheduled + self.max_delay)
+        self.scheduler.add_job(
+            self._rebuild,
+            trigger="date",
+            run_date=datetime.fromtimestamp(run_at),
+            args=[customer_alias],
+            id=f"listing_snapshot:{customer_alias}",
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+
+    def load(self, customer_alias: str) -> Optional[ListingSnapshot]:
+        """
+        Load a customer's stored snapshot.
+
+        :param customer_alias: Customer alias.
+        :return: Snapshot, None if there is none or it cannot be read.
+        """
+        try:
+            data = self.store.load(customer_alias)
+            return ListingSnapshot.decode(data) if data else None
+        except (redis.RedisError, OSError, ValueError, struct.error) as load_error:
+            logger.warning(
+                "Unable to load listing snapshot of %s: %s",
+                customer_alias,
+                load_error,
+            )
+            return None
+
+    def _servable(self, snapshot: ListingSnapshot, version: Optional[int]) -> bool:
+        """
+        Check a snapshot against the staleness bounds.
+
+        A snapshot is never served while the current version is unavailable,
+        as the data may have changed since without the version being bumped.
+
+        :param snapshot: Snapshot.
+        :param version: Customer's current version, None if unavailable.
+        :return: True if the snapshot may be served.
+        """
+        if version is None:
+            return False
+        if snapshot.version == version:
+            return True
+        return time.time() - snapshot.built_at < self.max_age
+
+    def serve(
+        self,
+        customer_alias: str,
+        if_none_match: Optional[str] = None,
+        accept_encoding: Optional[str] = None,
+    ) -> Optional[Response]:
+        """
+        Answer a listing request from the customer's snapshot.
+
+        Missing or outdated snapshots are scheduled for a rebuild.
+
+        :param customer_alias: Customer alias.
+        :param if_none_match: If-None-Match header value.
+        :param accept_encoding: Accept-Encoding header value.
+        :return: Response, None if the listing must be built live.
+        """
+        if not self.enabled:
+            return None
+        version = self.versions.get(customer_alias)
+        snapshot = self.load(customer_alias)
+        if snapshot is None or snapshot.version != version:
+            self.schedule_rebuild(customer_alias)
+        if snapshot is None or not self._servable(snapshot, version):
+            METRICS.increment("listing_snapshot_misses_total")
+            return None
+
+        METRICS.increment("listing_snapshot_hits_total")
+        return self._respond(customer_alias, snapshot, if_none_match, accept_encoding)
+
+    def _respond(
+        self,
+        customer_alias: str,
+        snapshot: ListingSnapshot,
+        if_none_match: Optional[str],
+        accept_encoding: Optional[str],
+    ) -> Response:
+        """
+        Build the response carrying a snapshot.
+
+        :param customer_alias: Customer alias.
+        :param snapshot: Snapshot to serve.
+        :param if_none_match: If-None-Match header value.
+        :param accept_encoding: Accept-Encoding header value.
+        :return: Response, 304 Not Modified if the client's copy is current.
+        """
+        headers = {
+            "ETag": self.versions.format_etag(customer_alias, snapshot.version),
+            "Cache-Control": "private, no-cache",
+            "X-Badge-Sequence": str(snapshot.sequence),
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        body = snapshot.body
+        preferred = negotiate_encoding(accept_encoding, ENCODINGS)
+        if snapshot.gzip_body and preferred == "gzip":
+            body = snapshot.gzip_body
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, media_type="application/json", headers=headers)
+
+    def stop(self) -> None:
+        """
+        Stop the scheduled rebuilds.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+
+LISTING_SNAPSHOTS = ListingSnapshots(
+    store=create_listing_snapshot_store(
+        app_config.listing_snapshot_store,
+        cache=REQUEST_REDIS_CLIENT,
+        directory=app_config.listing_snapshot_dir,
+    ),
+    versions=CUSTOMER_VERSIONS,
+    debounce=app_config.listing_snapshot_debounce,
+    max_delay=app_config.listing_snapshot_max_delay,
+    max_age=app_config.listing_snapshot_max_age,
+    gzip_level=app_config.listing_snapshot_gzip_level,
+)
+
+
+@badge_change_hook
+def _rebuild_changed_listing(customer_alias: str, _user_ids: List[UUID]) -> None:
+    """
+    Schedule the rebuild of a customer's snapshot after its badges changed.
+    """
+    LISTING_SNAPSHOTS.schedule_rebuild(customer_alias)
@@ -1,22 +1,67 @@
 """User related actions"""
-from typing import List
+from collections import Counter
+from typing import Dict, List, Optional
 from uuid import UUID
 
 import sqlalchemy
 import sqlalchemy.exc
 from fastapi import HTTPException, status
-from sqlalchemy import String, cast
+from sqlalchemy import delete, insert
 from sqlalchemy.orm import Session
 
+from modules.actions.badge_changes import (
+    group_badge_names,
+    load_users_badge_names,
+    record_badge_changes,
+)
+from modules.actions.badge_events import badges_changed
+from modules.actions.user_cache import USER_BADGE_CACHE
+from modules.actions.write_behind import MAX_BADGES_PER_USER, WRITE_BEHIND
 from modules.database.models import Badge, User
 from modules.database.schemas.user_schemas import (
     AddBadges,
     BadgeSchema,
     DeleteBadges,
     UpdateBadges,
+    UserBadgesLookupOut,
     UserSchema,
 )
 from modules.utilities.auth import CUSTOMER_CONFIG
+from modules.utilities.etag import CUSTOMER_VERSIONS
+
+
+def get_user_badge_names(user: User) -> List[str]:
+    """
+    Get a user's badge names, including writes still waiting to be flushed.
+
+    :param user: User object.
+    :return: Badge names.
+    """
+    badge_names = [badge.badge_name for badge in user.badges]
+    return WRITE_BEHIND.pending_badge_names(user.id, badge_names)
+
+
+def validate_customer_badges(customer_alias: str, badge_names: List[str]) -> None:
+    """
+    Ensure a customer has configured all the given badges.
+
+    :param customer_alias: Customer alias.
+    :param badge_names: Badge names.
+    :return: None.
+    :raises HTTPException: If badges are not configured or unknown.
+    """
+    customer_info = CUSTOMER_CONFIG.get_customer_config(customer_alias)
+    if not customer_info.get("badges"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You have not configured badges yet",
+        )
+
+    if not CUSTOMER_CONFIG.is_valid_customer_badges(customer_alias, badge_names):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You do not have all the badge(s) provided in the request",
+        )
 
 
 def get_user_by_id_and_customer(
@@ -38,7 +83,7 @@ def get_user_by_id_and_customer(
             db_session.query(User)
             .filter(
                 User.id == user_id,
-                cast(User.customer_id, String) == customer_alias,
+                User.customer_id == customer_alias,
             )
             .first()
         )
@@ -57,39 +102,54 @@ def add_badges_to_user(
     """
     Add badges to a user.
 
+    Badges the user already has, including queued ones, and badges repeated in
+    the request are rejected.
+
     :param user: User object.
     :param add_badge_info: Badge information to add.
     :param db_session: Database session.
     :return: None.
     """
-    customer_info = CUSTOMER_CONFIG.get_customer_config(user.customer_id)
+    validate_customer_badges(user.customer_id, add_badge_info.badge_names)
 
-    if not customer_info.get("badges"):
+    current = get_user_badge_names(user)
+    badge_count = len(current) + len(add_badge_info.badge_names)
+    if badge_count > MAX_BADGES_PER_USER:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have not configured badges yet",
+            detail=f"Maximum {MAX_BADGES_PER_USER} badges allowed per user",
         )
-
-    if not CUSTOMER_CONFIG.is_valid_customer_badges(
-        user.customer_id,
-        add_badge_info.badge_names,
-    ):
+    # Rejected rather than skipped, so queued and direct writes agree.
+    counts = Counter([*current, *add_badge_info.badge_names])
+    duplicates = sorted(
+        name for name in set(add_badge_info.badge_names) if counts[name] > 1
+    )
+    if duplicates:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You do not have all the badge(s) provided in the request",
+            detail=f"Badges {duplicates} are already assigned or repeated",
         )
 
-    if len(user.badges) + len(add_badge_info.badge_names) > 2:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum 2 badges allowed per user",
+    if WRITE_BEHIND.enabled:
+        WRITE_BEHIND.enqueue(
+            user,
+            {"op": "add", "badge_names": add_badge_info.badge_names},
         )
-
-    for badge_name in add_badge_info.badge_names:
-        badge = Badge(badge_name=badge_name, user=user)
-        db_session.add(badge)
-
+        CUSTOMER_VERSIONS.bump(user.customer_id)
+        return
+
+    customer_alias, user_id = user.customer_id, user.id
+    # One statement whatever the number of badges, keeping the route's budget.
+    db_session.execute(
+        insert(Badge),
+        [
+            {"customer_id": customer_alias, "user_id": user_id, "badge_name": name}
+            for name in add_badge_info.badge_names
+        ],
+    )
+    record_badge_changes(customer_alias, [user_id], db_session, "add")
     db_session.commit()
+    badges_changed(customer_alias, [user_id])
 
 
 def update_user_badges(
@@ -105,21 +165,7 @@ def update_user_badges(
     :param db_session: Database session.
     :return: None.
     """
-    customer_info = CUSTOMER_CONFIG.get_customer_config(user.customer_id)
-    if not customer_info.get("badges"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have not configured badges yet",
-        )
-
-    if not CUSTOMER_CONFIG.is_valid_customer_badges(
-        user.customer_id,
-        update_badge_info.new_badge_names,
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You do not have all the badge(s) provided in the request",
-        )
+    validate_customer_badges(user.customer_id, update_badge_info.new_badge_names)
     old_badge_names = update_badge_info.old_badge_names
     new_badge_names = update_badge_info.new_badge_names
 
@@ -129,20 +175,38 @@ def update_user_badges(
             detail="Number of old and new badges must be the same",
         )
 
-    # Update the badges
-    user_badge_names = {badge.badge_name: badge for badge in user.badges}
-    print(f"user_badge_names>>>{user_badge_names}")
-
-    for old_badge_name, new_badge_name in zip(old_badge_names, new_badge_names):
-        if old_badge_name not in user_badge_names:
+    current_badge_names = get_user_badge_names(user)
+    for old_badge_name in old_badge_names:
+        if old_badge_name not in current_badge_names:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"User does not have the old badge '{old_badge_name}' to be updated",
+                detail=(
+                    f"User does not have the old badge '{old_badge_name}' "
+                    "to be updated"
+                ),
             )
 
+    if WRITE_BEHIND.enabled:
+        WRITE_BEHIND.enqueue(
+            user,
+            {
+                "op": "update",
+                "old_badge_names": old_badge_names,
+                "new_badge_names": new_badge_names,
+            },
+        )
+        CUSTOMER_VERSIONS.bump(user.customer_id)
+        return
+
+    # Update the badges
+    user_badge_names = {badge.badge_name: badge for badge in user.badges}
+    for old_badge_name, new_badge_name in zip(old_badge_names, new_badge_names):
         user_badge_names[old_badge_name].badge_name = new_badge_name
 
+    customer_alias, user_id = user.customer_id, user.id
+    record_badge_changes(customer_alias, [user_id], db_session, "update")
     db_session.commit()
+    badges_changed(customer_alias, [user_id])
 
 
 def delete_user_badges(
@@ -158,52 +222,197 @@ def delete_user_badges(
     :param db_session: Database session.
     :return: Response message.
     """
-    for badge_name in delete_badge_info.badge_names:
-        badge = (
-            db_session.query(Badge)
-            .filter_by(user_id=user.id, badge_name=badge_name)
-            .first()
+    if WRITE_BEHIND.enabled:
+        current_badge_names = get_user_badge_names(user)
+        for badge_name in delete_badge_info.badge_names:
+            if badge_name not in current_badge_names:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Badge '{badge_name}' does not exist for the user",
+                )
+        WRITE_BEHIND.enqueue(
+            user,
+            {"op": "delete", "badge_names": delete_badge_info.badge_names},
         )
-        if badge:
-            db_session.delete(badge)
-        else:
+        CUSTOMER_VERSIONS.bump(user.customer_id)
+        return
+
+    # Find the badges among the loaded ones and delete them in one statement
+    user_badges = {badge.badge_name: badge for badge in user.badges}
+    for badge_name in delete_badge_info.badge_names:
+        if badge_name not in user_badges:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Badge '{badge_name}' does not exist for the user",
             )
+    db_session.execute(
+        delete(Badge).where(
+            Badge.customer_id == user.customer_id,
+            Badge.id.in_(
+                [
+                    user_badges[badge_name].id
+                    for badge_name in delete_badge_info.badge_names
+                ],
+            ),
+        ),
+    )
 
+    customer_alias, user_id = user.customer_id, user.id
+    record_badge_changes(customer_alias, [user_id], db_session, "delete")
     db_session.commit()
+    badges_changed(customer_alias, [user_id])
+
+
+def load_user_badge_names(
+    user_id: UUID,
+    customer_alias: str,
+    db_session: Session,
+) -> Optional[List[str]]:
+    """
+    Load a user's badge names from the database in a single query.
+
+    :param user_id: User ID.
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: Badge names, None if the user does not exist.
+    """
+    rows = (
+        db_session.query(User.id, Badge.badge_name)
+        .outerjoin(User.badges)
+        .filter(User.id == user_id, User.customer_id == customer_alias)
+        .all()
+    )
+    if not rows:
+        return None
+    return [badge_name for _, badge_name in rows if badge_name is not None]
+
+
+def get_user_badges(
+    user_id: UUID,
+    customer_alias: str,
+    db_session: Session,
+) -> UserSchema:
+    """
+    Get a user's badges through the user badge cache.
+
+    :param user_id: User ID.
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: User schema.
+    :raises HTTPException: If user not found.
+    """
+    badge_names = USER_BADGE_CACHE.get_badge_names(
+        customer_alias,
+        user_id,
+        lambda: load_user_badge_names(user_id, customer_alias, db_session),
+    )
+    if badge_names is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No user found with user id: {user_id}",
+        )
+
+    badge_names = WRITE_BEHIND.pending_badge_names(user_id, badge_names)
+    return UserSchema(
+        id=user_id,
+        customer_alias=customer_alias,
+        badges=[BadgeSchema(badge_name=badge_name) for badge_name in badge_names],
+    )
+
+
+def get_users_badges(
+    user_ids: List[UUID],
+    customer_alias: str,
+    db_session: Session,
+) -> UserBadgesLookupOut:
+    """
+    Get the badges of many users through the user badge cache.
+
+    :param user_ids: User IDs.
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: Users found and IDs of users that were not found.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    badge_names = USER_BADGE_CACHE.get_many_badge_names(
+        customer_alias,
+        user_ids,
+        lambda missing_ids: load_users_badge_names(
+            missing_ids,
+            customer_alias,
+            db_session,
+        ),
+    )
+
+    users, missing = [], []
+    for user_id in user_ids:
+        if badge_names.get(user_id) is None:
+            missing.append(user_id)
+            continue
+        user_badge_names = WRITE_BEHIND.pending_badge_names(
+            user_id,
+            badge_names[user_id],
+        )
+        users.append(
+            UserSchema(
+                id=user_id,
+                customer_alias=customer_alias,
+                badges=[BadgeSchema(badge_name=name) for name in user_badge_names],
+            ),
+        )
+    return UserBadgesLookupOut(users=users, missing=missing)
+
+
+def load_customer_badge_names(
+    customer_alias: str,
+    db_session: Session,
+) -> Dict[UUID, List[str]]:
+    """
+    Load the badge names of every user of a customer in one query.
+
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: Badge names per user ID, in user ID order.
+    """
+    rows = (
+        db_session.query(User.id, Badge.badge_name)
+        .outerjoin(User.badges)
+        .filter(User.customer_id == customer_alias)
+        .order_by(User.id, Badge.id)
+        .all()
+    )
+    return group_badge_names(rows)
 
 
 def get_customer_users(customer_alias: str, db_session: Session) -> List[UserSchema]:
     """
     Get users by customer ID.
 
+    The users and their badges are loaded in a single query.
+
     :param customer_alias: customer alias.
     :param db_session: Database session.
     :return: Response message.
     """
-
-    users: List[User] = (
-        db_session.query(User).filter_by(customer_id=customer_alias).all()
-    )
-    if not users:
+    badge_names = load_customer_badge_names(customer_alias, db_session)
+    if not badge_names:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No users found for customer_id: {customer_alias}",
         )
 
-    # Convert User objects to UserSchema objects
-    user_schemas = []
-    for user in users:
-        badge_schemas = [
-            BadgeSchema(badge_name=badge.badge_name) for badge in user.badges
-        ]
-        user_schema = UserSchema(
-            id=user.id,
-            customer_alias=user.customer_id,
-            badges=badge_schemas,
+    # Convert the rows to UserSchema objects
+    return [
+        UserSchema(
+            id=user_id,
+            customer_alias=customer_alias,
+            badges=[
+                BadgeSchema(badge_name=badge_name)
+                for badge_name in WRITE_BEHIND.pending_badge_names(
+                    user_id,
+                    user_badge_names,
+                )
+            ],
         )
-        user_schemas.append(user_schema)
-
-    return user_schemas
+        for user_id, user_badge_names in badge_names.items()
+    ]
@@ -0,0 +1,337 @@
+"""User badge cache actions"""
+
+import json
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import redis
+
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+BadgeLoader = Callable[[], Optional[List[str]]]
+BulkBadgeLoader = Callable[[List[UUID]], Dict[UUID, List[str]]]
+
+
+class UserBadgeCache:
+    """
+    Read-through Redis cache of per-user badge names.
+
+    Every entry is tagged with the user's cache generation, read before the
+    database is queried. Committed badge mutations bump the generation, so an
+    entry filled from data older than the last commit is never served, even if
+    its write to Redis races with the invalidation. Generations expire, twice
+    as late as the entries tagged with them, so they do not pile up in Redis
+    for users that are never read again.
+    """
+
+    def __init__(
+        self,
+        cache: redis.Redis,
+        ttl: int,
+        missing_ttl: int,
+        lock_ttl: float,
+        wait_timeout: float,
+    ) -> None:
+        """
+        Initialize the UserBadgeCache.
+
+        :param cache: Redis client.
+        :param ttl: Seconds a user's badges are cached for.
+        :param missing_ttl: Seconds an unknown user is cached for.
+        :param lock_ttl: Seconds a cache fill lock is held for at most.
+        :param wait_timeout: Seconds to wait for another request's cache fill.
+        """
+        self.cache = cache
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.generation_ttl = 2 * max(ttl, missing_ttl)
+
+    @staticmethod
+    def _key(customer_alias: str, user_id: UUID) -> str:
+        """
+        Build the Redis key of a user's cached badges.
+
+        :param customer_alias: Customer alias.
+        :param user_id: User ID.
+        :return: Redis key.
+        """
+        return f"user_badges:{customer_alias}:{user_id}"
+
+    def _generation_key(self, customer_alias: str, user_id: UUID) -> str:
+        """
+        Build the Redis key of a user's cache generation.
+
+        :param customer_alias: Customer alias.
+        :param user_id: User ID.
+        :return: Redis key.
+        """
+        return f"{self._key(customer_alias, user_id)}:generation"
+
+    @staticmethod
+    def _decode_generation(generation: Optional[bytes]) -> str:
+        """
+        Decode a generation read from Redis.
+
+        :param generation: Raw generation, None if it was never bumped.
+        :return: Generation.
+        """
+        return generation.decode("utf-8") if generation else "0"
+
+    def _cached(self, raw_entry: Optional[bytes], generation: str) -> Optional[dict]:
+        """
+        Decode an entry if it belongs to the current generation.
+
+        :param raw_entry: Raw cache entry.
+        :param generation: Current generation.
+        :return: Cache entry, or None if absent or stale.
+        """
+        if raw_entry is None:
+            return None
+        entry = json.loads(raw_entry)
+        return entry if entry["generation"] == generation else None
+
+    def store(
+        self,
+        customer_alias: str,
+        user_id: UUID,
+        generation: str,
+        badge_names: Optional[List[str]],
+    ) -> None:
+        """
+        Store a user's badges, or their absence, for a generation.
+
+        :param customer_alias: Customer alias.
+        :param user_id: User ID.
+        :param generation: Generation read before loading the badges.
+        :param badge_names: Badge names, None if the user does not exist.
+        """
+        entry = json.dumps({"generation": generation, "badges": badge_names})
+        ttl = self.ttl if badge_names is not None else self.missing_ttl
+        self.cache.set(self._key(customer_alias, user_id), entry, ex=ttl)
+
+    def _wait_for_fill(self, key: str, generation: str) -> Optional[dict]:
+        """
+        Wait for another request to fill the cache.
+
+        :param key: Redis key of the entry.
+        :param generation: Current generation.
+        :return: Cache entry, or None if the wait timed out.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            entry = self._cached(self.cache.get(key), generation)
+            if entry is not None:
+                return entry
+        return None
+
+    def _fill(
+        self,
+        customer_alias: str,
+        user_id: UUID,
+        generation: str,
+        loader: BadgeLoader,
+    ) -> Optional[List[str]]:
+        """
+        Load a user's badges on a miss, letting one request per key do it.
+
+        :param customer_alias: Customer alias.
+        :param user_id: User ID.
+        :param generation: Current generation.
+        :param loader: Function loading the badge names from the database.
+        :return: Badge names, None if the user does not exist.
+        """
+        key = self._key(customer_alias, user_id)
+        lock_key = f"{key}:lock"
+        if not self.cache.set(lock_key, 1, nx=True, px=int(self.lock_ttl * 1000)):
+            entry = self._wait_for_fill(key, generation)
+            if entry is not None:
+                return entry["badges"]
+            return loader()
+
+        # Redis errors past the load must not reach get_badge_names, which
+        # would run the loader a second time.
+        try:
+            badge_names = loader()
+            try:
+                self.store(customer_alias, user_id, generation, badge_names)
+            except redis.RedisError as redis_error:
+                logger.warning("Unable to fill user badge cache: %s", redis_error)
+            return badge_names
+        finally:
+            self._unlock(lock_key)
+
+    def _unlock(self, lock_key: str) -> None:
+        """
+        Release a cache fill lock, leaving it to expire if Redis fails.
+
+        :param lock_key: Redis key of the lock.
+        """
+        try:
+            self.cache.delete(lock_key)
+        except redis.RedisError as redis_error:
+            logger.warning("Unable to release user badge cache lock: %s", redis_error)
+
+    def get_badge_names(
+        self,
+        customer_alias: str,
+        user_id: UUID,
+        loader: BadgeLoader,
+    ) -> Optional[List[str]]:
+        """
+        Get a user's badge names from the cache, loading them on a miss.
+
+        :param customer_alias: Customer alias.
+        :param user_id: User ID.
+        :param loader: Function loading the badge names from the database.
+        :return: Badge names, None if the user does not exist.
+        """
+        try:
+            raw_entry, generation = self.cache.mget(
+                self._key(customer_alias, user_id),
+                self._generation_key(customer_alias, user_id),
+            )
+            generation = self._decode_generation(generation)
+            entry = self._cached(raw_entry, generation)
+            if entry is not None:
+                METRICS.increment("user_badge_cache_hits_total")
+                return entry["badges"]
+
+            METRICS.increment("user_badge_cache_misses_total")
+            return self._fill(customer_alias, user_id, generation, loader)
+        except redis.RedisError as redis_error:
+            logger.warning("User badge cache unavailable: %s", redis_error)
+            METRICS.increment("user_badge_cache_errors_total")
+            return loader()
+
+    def _read_many(
+        self,
+        customer_alias: str,
+        user_ids: List[UUID],
+    ) -> Tuple[Dict[UUID, Optional[List[str]]], Dict[UUID, str]]:
+        """
+        Read many users' entries and generations with one MGET.
+
+        :param customer_alias: Customer alias.
+        :param user_ids: User IDs.
+        :return: Badge names of the users with a current entry, and the
+            generation of every user.
+        :raises redis.RedisError: If Redis is unavailable.
+        """
+        keys = [self._key(customer_alias, user_id) for user_id in user_ids]
+        generation_keys = [
+            self._generation_key(customer_alias, user_id) for user_id in user_ids
+        ]
+        values = self.cache.mget(keys + generation_keys)
+
+        badge_names: Dict[UUID, Optional[List[str]]] = {}
+        generations: Dict[UUID, str] = {}
+        for user_id, raw_entry, generation in zip(
+            user_ids,
+            values[: len(user_ids)],
+            values[len(user_ids) :],
+        ):
+            generations[user_id] = self._decode_generation(generation)
+            entry = self._cached(raw_entry, generations[user_id])
+            if entry is not None:
+                badge_names[user_id] = entry["badges"]
+        return badge_names, generations
+
+    def get_many_badge_names(
+        self,
+        customer_alias: str,
+        user_ids: List[UUID],
+        loader: BulkBadgeLoader,
+    ) -> Dict[UUID, Optional[List[str]]]:
+        """
+        Get many users' badge names with one MGET, loading all misses at once.
+
+        Bulk misses are filled without per-key locks: they are answered by a
+        single query, which is cheaper than waiting on other requests.
+
+        :param customer_alias: Customer alias.
+        :param user_ids: User IDs.
+        :param loader: Function loading the badge names of existing users.
+        :return: Badge names per user ID, None for users that do not exist.
+        """
+        try:
+            badge_names, generations = self._read_many(customer_alias, user_ids)
+        except redis.RedisError as redis_error:
+            logger.warning("User badge cache unavailable: %s", redis_error)
+            METRICS.increment("user_badge_cache_errors_total")
+            loaded = loader(user_ids)
+            return {user_id: loaded.get(user_id) for user_id in user_ids}
+
+        misses = [user_id for user_id in user_ids if user_id not in badge_names]
+        METRICS.increment("user_badge_cache_hits_total", len(badge_names))
+        METRICS.increment("user_badge_cache_misses_total", len(misses))
+        if misses:
+            loaded = loader(misses)
+            self._store_many(customer_alias, loaded, misses, generations)
+            badge_names.update((user_id, loaded.get(user_id)) for user_id in misses)
+        return badge_names
+
+    def _store_many(
+        self,
+        customer_alias: str,
+        loaded: Dict[UUID, List[str]],
+        user_ids: List[UUID],
+        generations: Dict[UUID, str],
+    ) -> None:
+        """
+        Store the badges of many users in one pipeline.
+
+        :param customer_alias: Customer alias.
+        :param loaded: Badge names of the users that exist.
+        :param user_ids: IDs of all users that were loaded.
+        :param generations: Generation of each user read before loading.
+        """
+        try:
+            pipeline = self.cache.pipeline(transaction=False)
+            for user_id in user_ids:
+                badge_names = loaded.get(user_id)
+                entry = {"generation": generations[user_id], "badges": badge_names}
+                pipeline.set(
+                    self._key(customer_alias, user_id),
+                    json.dumps(entry),
+                    ex=self.ttl if badge_names is not None else self.missing_ttl,
+                )
+            pipeline.execute()
+        except redis.RedisError as redis_error:
+            logger.warning("Unable to fill user badge cache: %s", redis_error)
+
+    def invalidate(self, customer_alias: str, user_ids: Iterable[UUID]) -> None:
+        """
+        Invalidate users' cached badges after a committed mutation.
+
+        :param customer_alias: Customer alias.
+        :param user_ids: IDs of the users whose badges changed.
+        """
+        try:
+            pipeline = self.cache.pipeline(transaction=False)
+            for user_id in user_ids:
+                generation_key = self._generation_key(customer_alias, user_id)
+                pipeline.set(generation_key, time.time_ns(), nx=True)
+                pipeline.incr(generation_key)
+                pipeline.expire(generation_key, self.generation_ttl)
+                pipeline.delete(self._key(customer_alias, user_id))
+            pipeline.execute()
+        except redis.RedisError as redis_error:
+            logger.error("Unable to invalidate user badge cache: %s", redis_error)
+
+
+USER_BADGE_CACHE = UserBadgeCache(
+    cache=REQUEST_REDIS_CLIENT,
+    ttl=app_config.user_cache_ttl,
+    missing_ttl=app_config.user_cache_missing_ttl,
+    lock_ttl=app_config.user_cache_lock_ttl,
+    wait_timeout=app_config.user_cache_wait_timeout,
+)
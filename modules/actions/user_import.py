@@ -0,0 +1,244 @@
+"""User CSV import actions"""
+
+import csv
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from modules.actions.badge_changes import load_users_badge_names, record_badge_changes
+from modules.actions.badge_events import badges_changed
+from modules.actions.customer import parse_badge_names
+from modules.actions.write_behind import MAX_BADGES_PER_USER
+from modules.database.models import Badge, User
+from modules.database.schemas.user_schemas import ImportRowError, UserImportOut
+from modules.utilities.auth import CUSTOMER_CONFIG
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+from modules.utilities.streaming import LineTooLongError
+
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_ERRORS = 100
+
+ImportRow = Tuple[int, UUID, List[str]]
+ProgressCallback = Callable[[UserImportOut], None]
+
+
+# The batch and summary being built sit next to the import's settings.
+class UserImport:  # pylint: disable=too-many-instance-attributes
+    """
+    Import of a customer's users and badges, written in batches.
+
+    Each batch is validated against the badges its users already have, then
+    written in one transaction: users with a single INSERT ... ON CONFLICT DO
+    NOTHING, badges with a single multi-row INSERT. Only the current batch is
+    held in memory.
+    """
+
+    def __init__(
+        self,
+        customer_alias: str,
+        db_session: Session,
+        batch_size: int,
+        progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        """
+        Initialize the UserImport.
+
+        :param customer_alias: Customer alias.
+        :param db_session: Database session.
+        :param batch_size: Rows written per transaction.
+        :param progress: Function called with the summary after every batch.
+        """
+        customer_info = CUSTOMER_CONFIG.get_customer_config(customer_alias)
+        self.customer_alias = customer_alias
+        self.customer_badges = set(customer_info.get("badges", []))
+        self.db_session = db_session
+        self.batch_size = batch_size
+        self.progress = progress
+        self.summary = UserImportOut()
+        # Rejected rows are collected here, the summary sharing the list.
+        self._errors: List[ImportRowError] = []
+        self.summary.errors = self._errors
+        self._batch: List[ImportRow] = []
+
+    def reject(self, line: int, detail: str) -> None:
+        """
+        Count a rejected row, keeping the first reasons.
+
+        :param line: Line of the row.
+        :param detail: Reason the row was rejected.
+        """
+        self.summary.rejected += 1
+        if len(self._errors) < MAX_IMPORT_ERRORS:
+            self._errors.append(ImportRowError(line=line, detail=detail))
+
+    def add_row(self, line: int, row: Dict[str, str]) -> None:
+        """
+        Validate a row and queue it for the current batch.
+
+        :param line: Line of the row.
+        :param row: Row read by csv.DictReader.
+        """
+        self.summary.rows += 1
+        try:
+            user_id = UUID(row.get("user_id") or "")
+        except ValueError:
+            self.reject(line, "Invalid user_id")
+            return
+
+        badge_names = list(dict.fromkeys(parse_badge_names(row)))
+        unknown = [name for name in badge_names if name not in self.customer_badges]
+        if unknown:
+            self.reject(line, f"Unknown badge(s): {', '.join(unknown)}")
+            return
+
+        self._batch.append((line, user_id, badge_names))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def _merge(
+        self,
+        batch: List[ImportRow],
+        badge_names: Dict[UUID, List[str]],
+    ) -> Tuple[Set[UUID], List[Dict]]:
+        """
+        Merge a batch into its users' current badges.
+
+        :param batch: Batch rows.
+        :param badge_names: Current badge names per user, updated in place.
+        :return: IDs of the users with accepted rows, and badges to insert.
+        """
+        accepted: Set[UUID] = set()
+        new_badges: List[Dict] = []
+        for line, user_id, row_badge_names in batch:
+            current = badge_names.setdefault(user_id, [])
+            added = [name for name in row_badge_names if name not in current]
+            if len(current) + len(added) > MAX_BADGES_PER_USER:
+                self.reject(
+                    line,
+                    f"Maximum {MAX_BADGES_PER_USER} badges allowed per user",
+                )
+                continue
+            accepted.add(user_id)
+            current.extend(added)
+            new_badges.extend(
+                {
+                    "customer_id": self.customer_alias,
+                    "user_id": user_id,
+                    "badge_name": badge_name,
+                }
+                for badge_name in added
+            )
+        return accepted, new_badges
+
+    def _create_users(self, user_ids: List[UUID]) -> int:
+        """
+        Insert users, skipping those created meanwhile.
+
+        :param user_ids: IDs of the users to create.
+        :return: Number of users created.
+        """
+        if not user_ids:
+            return 0
+        users = [{"customer_id": self.customer_alias, "id": id_} for id_ in user_ids]
+        statement = (
+            pg_insert(User)
+            .values(users)
+            .on_conflict_do_nothing(index_elements=[User.customer_id, User.id])
+            .returning(User.id)
+        )
+        return len(self.db_session.execute(statement).all())
+
+    def flush(self) -> None:
+        """
+        Write the current batch in one transaction.
+        """
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+
+        user_ids = list(dict.fromkeys(user_id for _, user_id, _ in batch))
+        badge_names = load_users_badge_names(
+            user_ids,
+            self.customer_alias,
+            self.db_session,
+        )
+        existing = set(badge_names)
+        accepted, new_badges = self._merge(batch, badge_names)
+        new_users = accepted - existing
+
+        created = self._create_users([id_ for id_ in user_ids if id_ in new_users])
+        if new_badges:
+            self.db_session.execute(insert(Badge), new_badges)
+        changed = {badge["user_id"] for badge in new_badges} | new_users
+        record_badge_changes(self.customer_alias, changed, self.db_session, "import")
+        self.db_session.commit()
+
+        self.summary.users_created += created
+        self.summary.badges_added += len(new_badges)
+        if changed:
+            badges_changed(self.customer_alias, changed)
+
+        METRICS.increment("user_import_rows_total", len(batch))
+        logger.info(
+            "Imported %d rows for customer %s",
+            self.summary.rows,
+            self.customer_alias,
+        )
+        if self.progress is not None:
+            self.progress(self.summary)
+
+
+def import_users_csv(
+    customer_alias: str,
+    lines: Iterable[str],
+    db_session: Session,
+    batch_size: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> UserImportOut:
+    """
+    Import a customer's users and badges from CSV lines.
+
+    The CSV has a user_id column and any number of badge columns, named like
+    in customers.csv. Users are created if needed and badges missing from
+    them added; rows with an invalid user ID, a badge the customer has not
+    configured or too many badges are rejected and reported.
+
+    :param customer_alias: Customer alias.
+    :param lines: CSV lines, consumed as they are read.
+    :param db_session: Database session.
+    :param batch_size: Rows written per transaction.
+    :param progress: Function called with the summary after every batch.
+    :return: Import summary.
+    :raises HTTPException: If the CSV has no user_id column or a line is too
+        long.
+    """
+    try:
+        csv_reader = csv.DictReader(lines)
+        if not csv_reader.fieldnames or "user_id" not in csv_reader.fieldnames:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The CSV file must have a user_id column",
+            )
+
+        user_import = UserImport(
+            customer_alias,
+            db_session,
+            batch_size or app_config.import_batch_size,
+            progress,
+        )
+        for row in csv_reader:
+            user_import.add_row(csv_reader.line_num, row)
+    except LineTooLongError as line_error:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(line_error),
+        ) from line_error
+    user_import.flush()
+    return user_import.summary
@@ -0,0 +1,449 @@
+"""Write-behind badge mutation actions"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+import redis
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, selectinload
+
+from modules.actions.badge_changes import record_badge_changes
+from modules.actions.badge_events import badges_changed
+from modules.database.models import Badge, User
+from modules.utilities.cache import REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.database import SessionLocal
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+Mutation = Dict[str, Any]
+
+MAX_BADGES_PER_USER = 2
+
+
+def apply_mutation(badge_names: List[str], mutation: Mutation) -> List[str]:
+    """
+    Apply a badge mutation to a list of badge names.
+
+    Applying a mutation that is already reflected in the list is a no-op, so
+    a pending mutation can safely overlay state that has just been flushed.
+
+    :param badge_names: Current badge names.
+    :param mutation: Badge mutation.
+    :return: Badge names after the mutation.
+    """
+    names = list(badge_names)
+    operation = mutation["op"]
+    if operation == "add":
+        names.extend(name for name in mutation["badge_names"] if name not in names)
+    elif operation == "delete":
+        names = [name for name in names if name not in mutation["badge_names"]]
+    elif operation == "update":
+        renames = dict(zip(mutation["old_badge_names"], mutation["new_badge_names"]))
+        names = [renames.get(name, name) for name in names]
+    return names
+
+
+def mutation_rejection(badge_names: List[str], mutation: Mutation) -> Optional[str]:
+    """
+    Check a mutation against a user's badges as flushed so far.
+
+    Mutations are validated when they are queued, but only against the
+    mutations pending in the queueing process: concurrent writes through other
+    processes may have changed the badges since.
+
+    :param badge_names: Current badge names.
+    :param mutation: Badge mutation.
+    :return: Why the mutation cannot be applied, None if it can.
+    """
+    if mutation["op"] == "add":
+        if len(apply_mutation(badge_names, mutation)) > MAX_BADGES_PER_USER:
+            return f"Maximum {MAX_BADGES_PER_USER} badges allowed per user"
+        return None
+    # Updates need their old badges, deletions the badges they delete.
+    required = mutation.get("old_badge_names") or mutation.get("badge_names", [])
+    missing = sorted(set(required) - set(badge_names))
+    if missing:
+        return f"User does not have the badges {missing}"
+    return None
+
+
+def reject_mutation(mutation: Mutation, reason: str) -> None:
+    """
+    Log and count a queued mutation that could not be applied.
+
+    :param mutation: Badge mutation.
+    :param reason: Why it was rejected.
+    """
+    METRICS.increment("write_behind_rejected_mutations_total", op=mutation["op"])
+    logger.warning(
+        "Rejected queued %s of badges for user %s of %s: %s",
+        mutation["op"],
+        mutation["user_id"],
+        mutation["customer_id"],
+        reason,
+    )
+
+
+def reconcile_badges(user: User, badge_names: List[str], db_session: Session) -> None:
+    """
+    Make the user's badge rows match a list of badge names.
+
+    :param user: User object with badges loaded.
+    :param badge_names: Desired badge names.
+    :param db_session: Database session.
+    :return: None.
+    """
+    missing = list(badge_names)
+    for badge in list(user.badges):
+        if badge.badge_name in missing:
+            missing.remove(badge.badge_name)
+        else:
+            db_session.delete(badge)
+    for badge_name in missing:
+        db_session.add(Badge(badge_name=badge_name, user=user))
+
+
+def apply_valid_mutations(
+    badge_names: List[str],
+    mutations: List[Mutation],
+) -> Tuple[List[str], List[Mutation]]:
+    """
+    Apply a user's mutations in order, rejecting the ones that do not apply.
+
+    :param badge_names: Badge names as stored in the database.
+    :param mutations: Badge mutations, in stream order.
+    :return: Resulting badge names and the mutations applied.
+    """
+    applied = []
+    for mutation in mutations:
+        reason = mutation_rejection(badge_names, mutation)
+        if reason is not None:
+            reject_mutation(mutation, reason)
+            continue
+        badge_names = apply_mutation(badge_names, mutation)
+        applied.append(mutation)
+    return badge_names, applied
+
+
+def apply_user_mutations(
+    users: List[User],
+    mutations_by_user: Dict[Tuple[str, UUID], List[Mutation]],
+    db_session: Session,
+) -> None:
+    """
+    Apply the mutations of users and record the changes, without committing.
+
+    Each mutation is validated again against the badges resulting from the
+    previous ones; mutations that no longer apply are rejected and skipped.
+    Mutations of users that no longer exist are rejected too. Changes are
+    labelled with the operation of each user's last applied mutation.
+
+    :param users: Users to mutate, with their badges loaded.
+    :param mutations_by_user: Mutations per customer ID and user ID.
+    :param db_session: Database session.
+    """
+    changed_users: Dict[Tuple[str, str], List[UUID]] = defaultdict(list)
+    users_by_key = {(user.customer_id, user.id): user for user in users}
+    for user_key, mutations in mutations_by_user.items():
+        user = users_by_key.get(user_key)
+        if user is None:
+            for mutation in mutations:
+                reject_mutation(mutation, "User not found")
+            continue
+        badge_names, applied = apply_valid_mutations(
+            [badge.badge_name for badge in user.badges],
+            mutations,
+        )
+        if applied:
+            reconcile_badges(user, badge_names, db_session)
+            changed_users[(user.customer_id, applied[-1]["op"])].append(user.id)
+    # Sorted so concurrent flushes lock customer sequences in the same order.
+    for (customer_alias, operation), user_ids in sorted(changed_users.items()):
+        record_badge_changes(customer_alias, user_ids, db_session, operation)
+
+
+# Flush settings sit next to the pending mutations and their lock.
+class BadgeWriteBehind:  # pylint: disable=too-many-instance-attributes
+    """
+    Write-behind queue for badge mutations.
+
+    Mutations are acknowledged once they are appended to a Redis stream. A
+    consumer flushes them in batches, coalescing all mutations for a user into
+    a single reconcile inside one transaction per batch.
+    """
+
+    group = "badge-writers"
+
+    def __init__(
+        self,
+        cache: redis.Redis,
+        stream: str,
+        enabled: bool = False,
+        batch_size: int = 500,
+        flush_interval: float = 1,
+    ) -> None:
+        """
+        Initialize the BadgeWriteBehind.
+
+        :param cache: Redis client.
+        :param stream: Redis stream name.
+        :param enabled: Whether badge writes go through the queue.
+        :param batch_size: Maximum mutations flushed per transaction.
+        :param flush_interval: Flush interval in seconds.
+        """
+        self.cache = cache
+        self.stream = stream
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.scheduler = AsyncIOScheduler()
+        self._pending: Dict[UUID, List[Tuple[str, Mutation]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._group_ready = False
+
+    @property
+    def consumer(self) -> str:
+        """
+        Consumer name of this process, which may have been forked.
+        """
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    def enqueue(self, user: User, mutation: Mutation) -> str:
+        """
+        Append a validated mutation to the stream.
+
+        :param user: User object.
+        :param mutation: Badge mutation without user fields.
+        :return: Stream entry ID.
+        """
+        mutation = {
+            **mutation,
+            "user_id": str(user.id),
+            "customer_id": user.customer_id,
+        }
+        entry_id = self.cache.xadd(self.stream, {"mutation": json.dumps(mutation)})
+        entry_id = entry_id.decode("utf-8")
+        with self._lock:
+            self._pending[user.id].append((entry_id, mutation))
+        return entry_id
+
+    def pending_badge_names(self, user_id: UUID, badge_names: List[str]) -> List[str]:
+        """
+        Overlay this process' unflushed mutations on a user's badge names.
+
+        :param user_id: User ID.
+        :param badge_names: Badge names as stored in the database.
+        :return: Badge names including pending mutations.
+        """
+        if not self._pending:
+            return badge_names
+        with self._lock:
+            pending = list(self._pending.get(user_id, ()))
+        for _, mutation in pending:
+            badge_names = apply_mutation(badge_names, mutation)
+        return badge_names
+
+    def _ensure_group(self) -> None:
+        """
+        Create the consumer group, and the stream, if they do not exist.
+        """
+        if self._group_ready:
+            return
+        try:
+            self.cache.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as response_error:
+            if "BUSYGROUP" not in str(response_error):
+                raise
+        self._group_ready = True
+
+    def _read_batch(self) -> List[Tuple[str, Optional[Mutation]]]:
+        """
+        Read a batch of entries, reclaiming ones abandoned by dead consumers.
+
+        :return: List of entry IDs and mutations, None for deleted entries.
+        """
+        idle_ms = int(max(self.flush_interval, 1) * 30_000)
+        _, entries, *_ = self.cache.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=idle_ms,
+            count=self.batch_size,
+        )
+        if not entries:
+            response = self.cache.xreadgroup(
+                self.group,
+                self.consumer,
+                {self.stream: ">"},
+                count=self.batch_size,
+            )
+            entries = response[0][1] if response else []
+        return [
+            (
+                entry_id.decode("utf-8"),
+                json.loads(fields[b"mutation"]) if fields else None,
+            )
+            for entry_id, fields in entries
+        ]
+
+    @staticmethod
+    def _write_batch(batch: List[Tuple[str, Optional[Mutation]]]) -> None:
+        """
+        Apply a batch of mutations in a single transaction.
+
+        :param batch: List of entry IDs and mutations, in stream order.
+        """
+        mutations_by_user: Dict[Tuple[str, UUID], List[Mutation]] = defaultdict(list)
+        for mutation in filter(None, (mutation for _, mutation in batch)):
+            user_key = (mutation["customer_id"], UUID(mutation["user_id"]))
+            mutations_by_user[user_key].append(mutation)
+
+        db_session = SessionLocal()
+        try:
+            users = (
+                db_session.query(User)
+                .options(selectinload(User.badges))
+                .filter(tuple_(User.customer_id, User.id).in_(list(mutations_by_user)))
+                .all()
+            )
+            apply_user_mutations(users, mutations_by_user, db_session)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    def _removed_from_stream(self, entry_ids: List[str]) -> Set[str]:
+        """
+        Find entries that have already been flushed and deleted from the stream.
+
+        :param entry_ids: Entry IDs to check.
+        :return: Entry IDs no longer in the stream.
+        """
+        if not entry_ids:
+            return set()
+        pipeline = self.cache.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipeline.xrange(self.stream, min=entry_id, max=entry_id)
+        return {
+            entry_id
+            for entry_id, found in zip(entry_ids, pipeline.execute())
+            if not found
+        }
+
+    def _prune_pending(self, flushed_ids: List[str]) -> None:
+        """
+        Drop buffered mutations that no longer wait in the stream.
+
+        :param flushed_ids: Entry IDs flushed by this process.
+        """
+        with self._lock:
+            buffered = [
+                entry_id
+                for entries in self._pending.values()
+                for entry_id, _ in entries
+                if entry_id not in flushed_ids
+            ]
+        gone = set(flushed_ids) | self._removed_from_stream(buffered)
+        with self._lock:
+            for user_id in list(self._pending):
+                entries = [
+                    entry for entry in self._pending[user_id] if entry[0] not in gone
+                ]
+                if entries:
+                    self._pending[user_id] = entries
+                else:
+                    del self._pending[user_id]
+
+    def _acknowledge(self, batch: List[Tuple[str, Optional[Mutation]]]) -> None:
+        """
+        Propagate a flushed batch to caches and remove it from the stream.
+
+        :param batch: List of entry IDs and mutations.
+        """
+        users_by_customer: Dict[str, Set[UUID]] = defaultdict(set)
+        for mutation in filter(None, (mutation for _, mutation in batch)):
+            users_by_customer[mutation["customer_id"]].add(UUID(mutation["user_id"]))
+        for customer_alias, user_ids in users_by_customer.items():
+            badges_changed(customer_alias, user_ids)
+        entry_ids = [entry_id for entry_id, _ in batch]
+        self.cache.xack(self.stream, self.group, *entry_ids)
+        self.cache.xdel(self.stream, *entry_ids)
+
+    def flush(self) -> int:
+        """
+        Flush one batch of mutations to the database.
+
+        :return: Number of mutations flushed.
+        """
+        self._ensure_group()
+        batch = self._read_batch()
+        if batch:
+            self._write_batch(batch)
+            self._acknowledge(batch)
+        if self._pending:
+            self._prune_pending([entry_id for entry_id, _ in batch])
+        return len(batch)
+
+    def _scheduled_flush(self) -> None:
+        """
+        Flush until the stream has no new entries, logging failures.
+        """
+        try:
+            while self.flush() == self.batch_size:
+                continue
+        # pylint: disable=broad-except
+        except Exception as flush_error:
+            logger.exception("Badge write-behind flush failed: %s", flush_error)
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Flush pending mutations before shutdown.
+
+        :param timeout: Seconds to keep flushing for.
+        """
+        if not self.enabled:
+            return
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=True)
+        deadline = time.monotonic() + (timeout or app_config.write_behind_drain_timeout)
+        while time.monotonic() < deadline:
+            if self.flush():
+                continue
+            if not self._pending:
+                return
+            time.sleep(0.05)
+        logger.warning("Badge write-behind drain timed out with pending mutations")
+
+    async def start_flush_task(self) -> None:
+        """
+        Start the scheduled flush task.
+        """
+        if not self.enabled:
+            return
+        self.scheduler.add_job(
+            self._scheduled_flush,
+            trigger="interval",
+            seconds=self.flush_interval,
+        )
+        self.scheduler.start()
+
+
+WRITE_BEHIND = BadgeWriteBehind(
+    cache=REDIS_CLIENT,
+    stream=app_config.write_behind_stream,
+    enabled=app_config.write_behind_enabled,
+    batch_size=app_config.write_behind_batch_size,
+    flush_interval=app_config.write_behind_flush_interval,
+)
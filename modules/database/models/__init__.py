@@ -1,4 +1,5 @@
 """Imports the different model files"""
+from .badge_changes import *
 from .badges import *
 from .user import *
 from .utility_model import *
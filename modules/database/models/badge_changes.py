@@ -0,0 +1,44 @@
+"""Badge change log models"""
+
+from sqlalchemy import BigInteger, Column, Index, String
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+
+from modules.database.models.utility_model import TimeStampMixin
+from modules.utilities.database import Base
+
+
+class BadgeChangeSequence(Base):
+    """
+    Last sequence number of each customer's badge change log.
+
+    Writers increment the row in the transaction recording their changes and
+    hold its lock until they commit, so a customer's sequence numbers become
+    visible in increasing order.
+    """
+
+    __tablename__ = "badge_change_sequences"
+
+    customer_id = Column(String, primary_key=True)
+    last_sequence = Column(BigInteger, nullable=False)
+
+
+class BadgeChange(TimeStampMixin, Base):
+    """
+    Badge change log entry.
+
+    Entries are only appended, and pruned once older than the retention. Each
+    holds a user's badge names after a change, or None if the user no longer
+    exists, so replaying entries is idempotent.
+    """
+
+    __tablename__ = "badge_changes"
+    __table_args__ = (
+        Index("ix_badge_changes_created_at", "created_at"),
+        {"postgresql_partition_by": "HASH (customer_id)"},
+    )
+
+    customer_id = Column(String, primary_key=True)
+    sequence = Column(BigInteger, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    badge_names = Column(ARRAY(String))
+    operation = Column(String)
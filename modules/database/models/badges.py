@@ -1,6 +1,6 @@
 """badges mode"""
 
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKeyConstraint, Integer, Sequence, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -10,10 +10,21 @@ from modules.utilities.database import Base
 class Badge(Base):
     """
     Badge model.
+
+    Badges are co-partitioned with users: customer_id is denormalized from the
+    user and filled in through the relationship.
     """
 
     __tablename__ = "badges"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["customer_id", "user_id"],
+            ["users.customer_id", "users.id"],
+        ),
+        {"postgresql_partition_by": "HASH (customer_id)"},
+    )
+    id = Column(Integer, Sequence("badges_id_seq"), primary_key=True, index=True)
+    customer_id = Column(String, primary_key=True)
     badge_name = Column(String, index=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    user_id = Column(UUID(as_uuid=True))
     user = relationship("User", back_populates="badges")
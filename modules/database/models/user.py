@@ -10,11 +10,17 @@ from modules.utilities.database import Base
 class User(Base):
     """
     Represents a user model.
+
+    The table is hash partitioned by customer_id, which is therefore part of
+    its primary key. The ORM identifies users by (customer_id, id) as well:
+    the same user ID may exist for several customers.
     """
 
     __tablename__ = "users"
+    __table_args__ = {"postgresql_partition_by": "HASH (customer_id)"}
 
+    customer_id = Column(String, primary_key=True)
     id = Column(UUID(as_uuid=True), primary_key=True, index=True)
-    customer_id = Column(String)
 
-    badges = relationship("Badge", back_populates="user")
+    # Badges cannot outlive their user: customer_id is part of their primary key.
+    badges = relationship("Badge", back_populates="user", cascade="all, delete-orphan")
@@ -2,17 +2,14 @@
 
 from sqlalchemy import Column, func
 from sqlalchemy.dialects.postgresql import TIMESTAMP
-from sqlalchemy.ext.declarative import declarative_base
 
-Base = declarative_base()
 
-
-class TimeStampMixin(Base):
+class TimeStampMixin:
     """
     Mixin for adding created_at and updated_at timestamps to models.
-    """
 
-    __abstract__ = True
+    A plain mixin, so the models using it stay bound to the application Base.
+    """
 
     created_at = Column(TIMESTAMP(precision=6), server_default=func.now())
     updated_at = Column(TIMESTAMP(precision=6), server_default=func.now())
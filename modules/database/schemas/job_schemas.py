@@ -0,0 +1,32 @@
+"""Schemas for background jobs"""
+
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, Field
+
+
+class JobStatus(str, Enum):
+    """Job status"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobOut(BaseModel):
+    """Job schema"""
+
+    id: str = Field(..., description="Job ID")
+    type: str = Field(..., description="Job type")
+    customer_alias: str = Field(..., description="Customer the job runs for")
+    status: JobStatus = Field(..., description="Job status")
+    attempts: int = Field(0, description="Number of times the job was started")
+    payload: Dict[str, Any] = Field(default_factory=dict, exclude=True)
+    progress: Optional[Dict[str, Any]] = Field(None, description="Last progress")
+    result: Optional[Dict[str, Any]] = Field(None, description="Result on success")
+    error: Optional[str] = Field(None, description="Last error")
+    created_at: datetime = Field(..., description="Time the job was queued")
+    updated_at: datetime = Field(..., description="Time the job last changed")
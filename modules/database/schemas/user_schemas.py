@@ -1,6 +1,7 @@
 """Schemas for various badge operations"""
 
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field, model_validator
@@ -80,3 +81,75 @@ class UserSchema(BaseModel):
         """Configuration for this schema class"""
 
         from_attributes = True
+
+
+MAX_LOOKUP_USERS = 500
+
+
+class UserBadgesLookup(BaseModel):
+    """Badges lookup for many users schema"""
+
+    user_ids: List[UUID] = Field(
+        ...,
+        description="IDs of the users to get badges for",
+        max_length=MAX_LOOKUP_USERS,
+        min_length=1,
+    )
+
+
+class UserBadgesLookupOut(BaseModel):
+    """Badges lookup for many users response schema"""
+
+    users: List[UserSchema] = Field(..., description="Users that were found")
+    missing: List[UUID] = Field(..., description="IDs of users that were not found")
+
+
+MAX_BADGE_CHANGES = 1000
+
+
+class BadgeChangeSchema(BaseModel):
+    """Badge change log entry schema"""
+
+    sequence: int = Field(..., description="Sequence number of the change")
+    user_id: UUID = Field(..., description="ID of the user whose badges changed")
+    badge_names: Optional[List[str]] = Field(
+        ...,
+        description="Badge names of the user after the change, null if the user "
+        "no longer exists",
+    )
+    operation: Optional[str] = Field(
+        None,
+        description="Operation that made the change: add, update, delete or import",
+    )
+    changed_at: Optional[datetime] = Field(None, description="Time of the change")
+
+
+class BadgeChangesOut(BaseModel):
+    """Page of badge changes schema"""
+
+    changes: List[BadgeChangeSchema] = Field(..., description="Changes in order")
+    last_sequence: int = Field(
+        ...,
+        description="Sequence number to request the next changes after",
+    )
+    has_more: bool = Field(..., description="Whether more changes are available")
+
+
+class ImportRowError(BaseModel):
+    """Rejected CSV import row schema"""
+
+    line: int = Field(..., description="Line of the row in the CSV file")
+    detail: str = Field(..., description="Reason the row was rejected")
+
+
+class UserImportOut(BaseModel):
+    """CSV import summary schema"""
+
+    rows: int = Field(0, description="Number of rows read")
+    users_created: int = Field(0, description="Number of users created")
+    badges_added: int = Field(0, description="Number of badges added")
+    rejected: int = Field(0, description="Number of rows rejected")
+    errors: List[ImportRowError] = Field(
+        default_factory=list,
+        description="First rejected rows and why they were rejected",
+    )
@@ -0,0 +1,76 @@
+"""Background job related routers"""
+import logging
+import os
+import tempfile
+
+from fastapi import APIRouter, HTTPException, Path, Request, Security, status
+
+from modules.actions.job_handlers import USER_IMPORT_JOB
+from modules.actions.jobs import JOB_QUEUE
+from modules.database.schemas.job_schemas import JobOut
+from modules.routers.user_import import CSV_REQUEST_BODY
+from modules.utilities.auth import authenticate_customer
+from modules.utilities.config import app_config
+from modules.utilities.response import base_responses, internal_errors
+from modules.utilities.streaming import iter_request_chunks
+
+router = APIRouter(tags=["Jobs"], responses={**base_responses})
+logger = logging.getLogger(__name__)
+
+
+def spool_request_body(request: Request) -> str:
+    """
+    Write a request body to a file of the spool directory as it is received.
+
+    :param request: Incoming request.
+    :return: File path.
+    """
+    os.makedirs(app_config.job_spool_dir, exist_ok=True)
+    file_descriptor, path = tempfile.mkstemp(dir=app_config.job_spool_dir)
+    try:
+        with os.fdopen(file_descriptor, "wb") as spool_file:
+            for chunk in iter_request_chunks(request):
+                spool_file.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+@router.post(
+    "/jobs/user_import/",
+    response_model=JobOut,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=CSV_REQUEST_BODY,
+)
+def queue_user_import(
+    request: Request,
+    customer_alias: str = Security(authenticate_customer),
+) -> JobOut:
+    """
+    Queue an import of users and their badges from a CSV request body.
+
+    The CSV has the format of POST /users/import/. Poll the returned job for
+    progress and the import summary.
+    """
+    with internal_errors("queue user import"):
+        path = spool_request_body(request)
+        return JOB_QUEUE.enqueue(USER_IMPORT_JOB, customer_alias, {"path": path})
+
+
+@router.get("/jobs/{job_id}/", response_model=JobOut)
+def get_job(
+    job_id: str = Path(..., description="The Id of the job"),
+    customer_alias: str = Security(authenticate_customer),
+) -> JobOut:
+    """
+    Get the status, progress and result of a job.
+    """
+    with internal_errors("get job"):
+        job = JOB_QUEUE.get(job_id)
+        if job is None or job.customer_alias != customer_alias:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No job found with job id: {job_id}",
+            )
+        return job
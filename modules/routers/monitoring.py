@@ -0,0 +1,51 @@
+"""Monitoring related routers"""
+import logging
+
+from fastapi import APIRouter, Response, status
+from fastapi.responses import PlainTextResponse
+
+from modules.utilities.health import HEALTH_PROBES
+from modules.utilities.lifecycle import LIFECYCLE
+from modules.utilities.metrics import METRICS
+
+router = APIRouter(tags=["Monitoring"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics() -> str:
+    """
+    Expose in-process metrics in the Prometheus text format.
+    """
+    return METRICS.render()
+
+
+@router.get("/healthz", include_in_schema=False)
+def get_liveness() -> dict:
+    """
+    Report that the process is alive, with the last dependency probes.
+
+    Failing dependencies do not fail liveness, restarting would not fix them.
+    """
+    return {"status": "ok", **HEALTH_PROBES.report()}
+
+
+@router.get("/readyz", include_in_schema=False)
+def get_readiness(response: Response) -> dict:
+    """
+    Report whether the process should get traffic, with a 503 if not.
+
+    Only the cached probe results are read. Failing non-critical dependencies
+    are reported as degraded but keep the process in rotation, so an outage
+    of Redis does not take every instance out at once.
+    """
+    report = HEALTH_PROBES.report()
+    if not LIFECYCLE.ready:
+        readiness = "draining" if LIFECYCLE.draining else "starting"
+    elif not report["ok"]:
+        readiness = "unavailable"
+    else:
+        readiness = "degraded" if report["degraded"] else "ready"
+    if readiness not in ("ready", "degraded"):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {**report, "status": readiness}
@@ -1,37 +1,68 @@
 """User related routers"""
 import logging
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Security, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    Security,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from modules.actions.badge_changes import get_badge_changes, get_last_sequence
+from modules.actions.badge_stream import check_resumable, stream_badge_events
+from modules.actions.listing_snapshots import LISTING_SNAPSHOTS
 from modules.actions.user import (
     add_badges_to_user,
     delete_user_badges,
     get_customer_users,
+    get_user_badges,
     get_user_by_id_and_customer,
+    get_users_badges,
     update_user_badges,
 )
 from modules.database.schemas.user_schemas import (
+    MAX_BADGE_CHANGES,
     AddBadges,
+    BadgeChangesOut,
     DeleteBadges,
     UpdateBadges,
+    UserBadgesLookup,
+    UserBadgesLookupOut,
     UserSchema,
 )
 from modules.database.schemas.utility_schemas import SuccessfulResponseOut
 from modules.utilities.auth import authenticate_customer
-from modules.utilities.database import get_db_session
+from modules.utilities.database import (
+    REPLICA_ROUTER,
+    get_db_session,
+    get_read_db_session,
+)
+from modules.utilities.etag import CUSTOMER_VERSIONS, etag_matches
+from modules.utilities.idempotency import IdempotentRoute
+from modules.utilities.query_budget import query_budget
 from modules.utilities.response import base_responses
 
 router = APIRouter(
     tags=["User"],
     responses={**base_responses},
+    route_class=IdempotentRoute,
 )
 logger = logging.getLogger(__name__)
 
 
 @router.post("/users/{user_id}/badges/", response_model=SuccessfulResponseOut)
+@query_budget(6)
 def add_badges(
     user_id: UUID = Path(..., description="The Id of the user to update badges for"),
     add_badge_info: AddBadges = Body(..., description="List of badges to be added"),
@@ -66,6 +97,7 @@ def add_badges(
 
 
 @router.patch("/users/{user_id}/badges/", response_model=SuccessfulResponseOut)
+@query_budget(6)
 def update_badges(
     user_id: UUID = Path(..., description="The Id of the user to update badges for"),
     update_badge_info: UpdateBadges = Body(
@@ -104,6 +136,7 @@ def update_badges(
 
 
 @router.delete("/users/{user_id}/badges/", response_model=SuccessfulResponseOut)
+@query_budget(6)
 def delete_badges(
     user_id: UUID = Path(..., description="The Id of the user to delete badges for"),
     delete_badge_info: DeleteBadges = Body(
@@ -134,19 +167,153 @@ def delete_badges(
         ) from general_exception
 
 
-@router.get("/users/by_customer/", response_model=List[UserSchema])
-def get_users_by_customer_id(
+@router.post("/users/badges/lookup/", response_model=UserBadgesLookupOut)
+@query_budget(1)
+def lookup_badges(
+    lookup_info: UserBadgesLookup = Body(
+        ...,
+        description="IDs of the users to get badges for",
+    ),
     db_session: Session = Depends(get_db_session),
     customer_alias: str = Depends(authenticate_customer),
+) -> UserBadgesLookupOut:
+    """
+    Retrieve the badges of many users at once, e.g. all commenters of a thread.
+
+    Users that do not exist for the customer are listed in `missing`.
+    """
+    try:
+        return get_users_badges(lookup_info.user_ids, customer_alias, db_session)
+
+    except Exception as general_exception:
+        if isinstance(general_exception, HTTPException):
+            raise general_exception
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unable to get user badges: {str(general_exception)}",
+        ) from general_exception
+
+
+@router.get(
+    "/users/{user_id}/badges/",
+    response_model=UserSchema,
+    responses={304: {"description": "Not Modified"}},
+)
+@query_budget(1)
+def get_badges(
+    response: Response,
+    user_id: UUID = Path(..., description="The Id of the user to get badges for"),
+    if_none_match: Optional[str] = Header(None),
+    db_session: Session = Depends(get_db_session),
+    customer_alias: str = Depends(authenticate_customer),
+) -> UserSchema:
+    """
+    Retrieve the badges of a single user.
+
+    The response carries an ETag; send it back in If-None-Match to get a
+    304 Not Modified while the customer's badges are unchanged.
+    """
+    try:
+        etag = CUSTOMER_VERSIONS.etag(customer_alias, str(user_id))
+        if etag_matches(if_none_match, etag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+            )
+
+        user = get_user_badges(user_id, customer_alias, db_session)
+        if etag:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "private, no-cache"
+        return user
+
+    except Exception as general_exception:
+        if isinstance(general_exception, HTTPException):
+            raise general_exception
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unable to get user badges: {str(general_exception)}",
+        ) from general_exception
+
+
+def _list_customer_users(
+    response: Response,
+    if_none_match: Optional[str],
+    customer_alias: str,
+    db_session: Session,
+) -> List[UserSchema]:
+    """
+    Build a customer's listing from the database, with its ETag.
+
+    Listings read from a replica get no ETag: the replica may lag behind the
+    customer's version, and clients would keep a stale listing until the next
+    badge mutation.
+
+    :param response: Response to set the headers of.
+    :param if_none_match: If-None-Match header value.
+    :param customer_alias: Customer alias.
+    :param db_session: Database session.
+    :return: Users, or a 304 Not Modified response.
+    """
+    etag = CUSTOMER_VERSIONS.etag(customer_alias)
+    if etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+        )
+
+    sequence = get_last_sequence(customer_alias, db_session)
+    users = get_customer_users(customer_alias, db_session)
+    response.headers["X-Badge-Sequence"] = str(sequence)
+    # A lagging replica may not have the rows of the version read above yet.
+    if etag and REPLICA_ROUTER.reads_from_primary(db_session):
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+    return users
+
+
+@router.get(
+    "/users/by_customer/",
+    response_model=List[UserSchema],
+    responses={304: {"description": "Not Modified"}},
+)
+@query_budget(2)
+def get_users_by_customer_id(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    db_session: Session = Depends(get_read_db_session),
+    customer_alias: str = Depends(authenticate_customer),
 ) -> List[UserSchema]:
     """
     Retrieve a list of users with a specific customer_id.
 
     This endpoint allows you to retrieve all users associated with a given customer_id.
+    The response carries an ETag; send it back in If-None-Match to get a
+    304 Not Modified while the customer's badges are unchanged.
+
+    The X-Badge-Sequence header holds the badge change sequence number the
+    listing is at least as recent as; request /users/badges/changes/ after it
+    to keep the listing in sync.
 
+    When listing snapshots are enabled, the listing may be served from a
+    snapshot precomputed after the customer's last badge mutation.
     """
     try:
-        return get_customer_users(customer_alias, db_session)
+        snapshot_response = LISTING_SNAPSHOTS.serve(
+            customer_alias,
+            if_none_match,
+            accept_encoding,
+        )
+        if snapshot_response is not None:
+            return snapshot_response
+
+        return _list_customer_users(
+            response,
+            if_none_match,
+            customer_alias,
+            db_session,
+        )
 
     except Exception as general_exception:
         if isinstance(general_exception, HTTPException):
@@ -155,3 +322,80 @@ def get_users_by_customer_id(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Unable to get users: {str(general_exception)}",
         ) from general_exception
+
+
+@router.get(
+    "/users/badges/changes/",
+    response_model=BadgeChangesOut,
+    responses={410: {"description": "Changes were pruned, reload the listing"}},
+)
+@query_budget(1)
+def get_changes(
+    after: int = Query(
+        0,
+        ge=0,
+        description="Sequence number of the last change already applied",
+    ),
+    limit: int = Query(
+        500,
+        ge=1,
+        le=MAX_BADGE_CHANGES,
+        description="Maximum number of changes to return",
+    ),
+    db_session: Session = Depends(get_read_db_session),
+    customer_alias: str = Depends(authenticate_customer),
+) -> BadgeChangesOut:
+    """
+    Retrieve the badge changes made after a sequence number, in order.
+
+    Each change holds a user's badge names after the change, or null if the
+    user no longer exists, so applying a change twice is harmless. Start from
+    the X-Badge-Sequence header of /users/by_customer/, then request the
+    changes after last_sequence while has_more is true. Changes are kept for
+    a limited time: a 410 Gone means some were pruned, so start over from
+    /users/by_customer/.
+    """
+    try:
+        return get_badge_changes(customer_alias, after, limit, db_session)
+
+    except Exception as general_exception:
+        if isinstance(general_exception, HTTPException):
+            raise general_exception
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unable to get badge changes: {str(general_exception)}",
+        ) from general_exception
+
+
+@router.get(
+    "/users/badges/events/",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        410: {"description": "Changes were pruned, reload the listing"},
+    },
+)
+async def stream_badge_changes(
+    last_event_id: Optional[int] = Header(
+        None,
+        description="ID of the last event received, to resume a stream",
+    ),
+    customer_alias: str = Depends(authenticate_customer),
+) -> StreamingResponse:
+    """
+    Stream the customer's badge changes as server-sent events.
+
+    Events are named after the operation that made the change: add, update,
+    delete or import. Their ID is the change sequence number and their data
+    is a change as returned by /users/badges/changes/. Reconnect with the
+    Last-Event-ID header to resume after the last event received. Comments
+    are sent as heartbeats while no badge changes. A 410 Gone means changes
+    after the Last-Event-ID were pruned, so start over from /users/by_customer/.
+    """
+    if last_event_id is not None:
+        await run_in_threadpool(check_resumable, customer_alias, last_event_id)
+    return StreamingResponse(
+        stream_badge_events(customer_alias, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,47 @@
+"""User import related routers"""
+import logging
+
+from fastapi import APIRouter, Depends, Request, Security
+from sqlalchemy.orm import Session
+
+from modules.actions.user_import import import_users_csv
+from modules.database.schemas.user_schemas import UserImportOut
+from modules.utilities.auth import authenticate_customer
+from modules.utilities.database import get_db_session
+from modules.utilities.response import base_responses, internal_errors
+from modules.utilities.streaming import iter_request_chunks, iter_text_lines
+
+router = APIRouter(tags=["User"], responses={**base_responses})
+logger = logging.getLogger(__name__)
+
+CSV_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"text/csv": {"schema": {"type": "string", "format": "binary"}}},
+    },
+}
+
+
+@router.post(
+    "/users/import/",
+    response_model=UserImportOut,
+    openapi_extra=CSV_REQUEST_BODY,
+)
+def import_users(
+    request: Request,
+    customer_alias: str = Security(authenticate_customer),
+    db_session: Session = Depends(get_db_session),
+) -> UserImportOut:
+    """
+    Import users and their badges from a CSV request body.
+
+    The body has a user_id column and badge columns. It is parsed while it is
+    received and written in batches, so files of any size can be imported.
+    Rows already committed stay imported if the upload fails midway.
+    """
+    with internal_errors("import users"):
+        return import_users_csv(
+            customer_alias,
+            iter_text_lines(iter_request_chunks(request)),
+            db_session,
+        )
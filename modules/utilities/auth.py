@@ -2,8 +2,8 @@
 Authentication Utilities
 """
 
-import os
 from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
 
 import jwt
 from dotenv import load_dotenv
@@ -11,7 +11,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, OAuth2PasswordBearer
 
 from modules.actions.customer import CustomerConfig
+from modules.actions.customer_backends import create_config_backend
+from modules.utilities.cache import REDIS_CLIENT, redis_client_with_timeout
+from modules.utilities.circuit_breaker import CircuitBreaker
 from modules.utilities.config import app_config
+from modules.utilities.host_lock import HOST_LOCK
+from modules.utilities.rate_limit import RATE_LIMITER
 
 security = HTTPBearer()
 
@@ -20,11 +25,32 @@ SECRET_KEY = app_config.secret_key
 load_dotenv()
 
 CUSTOMER_CONFIG = CustomerConfig(
-    redis_host=os.getenv("REDIS_HOST"),
-    redis_port=int(os.getenv("REDIS_PORT")),
+    backend=create_config_backend(
+        app_config.customer_config_backend,
+        cache=redis_client_with_timeout(
+            REDIS_CLIENT,
+            app_config.customer_config_redis_timeout,
+        ),
+        snapshot_path=app_config.customer_config_snapshot_path,
+        snapshot_name=app_config.customer_config_snapshot_name,
+    ),
     refresh_rate=app_config.refresh_rate,
+    unknown_alias_ttl=app_config.unknown_alias_ttl,
+    host_lock=HOST_LOCK,
+    breaker=(
+        CircuitBreaker(
+            "customer_config",
+            failure_threshold=app_config.customer_config_breaker_threshold,
+            reset_timeout=app_config.customer_config_breaker_reset_timeout,
+        )
+        if app_config.customer_config_backend == "redis"
+        else None
+    ),
 )
 
+# Configuration fields carried by self-contained tokens.
+TOKEN_CLAIMS = ("status", "rate_limit", "rate_burst")
+
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="generate_token",
     auto_error=False,
@@ -32,15 +58,40 @@ oauth2_scheme = OAuth2PasswordBearer(
 )
 
 
-def authenticate_customer(bearer_token: str = Depends(oauth2_scheme)) -> str:
+def get_token_customer_info(payload: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Authenticate a customer based on bearer token.
+    Get the configuration of the customer a token was issued to.
+
+    Self-contained tokens carry the fields authentication needs, trusted
+    without a lookup while the configuration generation they were issued for
+    is current. Any configuration change, such as a suspension, gives a new
+    generation on the next refresh, after which the configuration is looked up.
+
+    Args:
+        payload (dict): Decoded token payload.
+
+    Returns:
+        dict: Customer configuration.
+    """
+    generation = payload.get("generation")
+    if (
+        app_config.self_contained_tokens
+        and generation is not None
+        and generation == CUSTOMER_CONFIG.current_generation
+    ):
+        return {claim: payload.get(claim) for claim in TOKEN_CLAIMS}
+    return CUSTOMER_CONFIG.get_customer_config(payload.get("customer_alias"))
+
+
+def verify_customer_token(bearer_token: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Verify a bearer token and the status of the customer it was issued to.
 
     Args:
         bearer_token (str): Bearer token.
 
     Returns:
-        str: Customer alias.
+        tuple: Customer alias and customer configuration.
 
     Raises:
         HTTPException: If authentication fails.
@@ -58,7 +109,7 @@ def authenticate_customer(bearer_token: str = Depends(oauth2_scheme)) -> str:
         payload = jwt.decode(bearer_token, SECRET_KEY, algorithms=["HS256"])
         customer_alias = payload.get("customer_alias")
 
-        customer_info = CUSTOMER_CONFIG.get_customer_config(customer_alias)
+        customer_info = get_token_customer_info(payload)
         if not customer_info:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,8 +122,7 @@ def authenticate_customer(bearer_token: str = Depends(oauth2_scheme)) -> str:
                 status_code=status.HTTP_402_PAYMENT_REQUIRED,
                 detail="Payment required",
             )
-
-        return customer_alias
+        return customer_alias, customer_info
     except jwt.ExpiredSignatureError as exc:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -85,12 +135,35 @@ def authenticate_customer(bearer_token: str = Depends(oauth2_scheme)) -> str:
         ) from exc
 
 
-def generate_jwt_token(customer_alias: str) -> str:
+def authenticate_customer(bearer_token: str = Depends(oauth2_scheme)) -> str:
+    """
+    Authenticate a customer based on bearer token.
+
+    Args:
+        bearer_token (str): Bearer token.
+
+    Returns:
+        str: Customer alias.
+
+    Raises:
+        HTTPException: If authentication fails or the customer is rate limited.
+    """
+    customer_alias, customer_info = verify_customer_token(bearer_token)
+    RATE_LIMITER.check(customer_alias, customer_info)
+    return customer_alias
+
+
+def generate_jwt_token(
+    customer_alias: str,
+    customer_info: Optional[Dict[str, Any]] = None,
+) -> str:
     """
     Generate JWT token for a customer alias.
 
     Args:
         customer_alias (str): Customer alias.
+        customer_info (dict): Customer configuration, embedded in the token
+            with the configuration generation if self-contained tokens are on.
 
     Returns:
         str: JWT token.
@@ -99,6 +172,10 @@ def generate_jwt_token(customer_alias: str) -> str:
         "customer_alias": customer_alias,
         "exp": datetime.utcnow() + timedelta(minutes=30),  # Token expiration time
     }
+    generation = CUSTOMER_CONFIG.current_generation
+    if app_config.self_contained_tokens and customer_info and generation is not None:
+        payload.update({claim: customer_info.get(claim) for claim in TOKEN_CLAIMS})
+        payload["generation"] = generation
     token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
     return token
 
@@ -131,5 +208,5 @@ def generate_customer_token(customer_alias: str) -> dict:
         )
 
     # Generate and return the JWT token
-    token = generate_jwt_token(customer_alias)
+    token = generate_jwt_token(customer_alias, customer_config)
     return {"token": token}
@@ -0,0 +1,162 @@
+"""
+Shared Redis clients
+"""
+
+import os
+from typing import Any, Callable, Optional
+
+import redis
+import redis.client
+from dotenv import load_dotenv
+
+from modules.utilities.circuit_breaker import CircuitBreaker
+from modules.utilities.config import app_config
+
+load_dotenv()
+
+
+# redis.Redis and its pipelines are assembled from command mixins, some
+# declaring commands they leave abstract.
+# pylint: disable=abstract-method,too-many-ancestors
+class GuardedRedis(redis.Redis):
+    """
+    Redis client whose commands and pipelines go through a circuit breaker.
+
+    While the circuit is open, calls fail right away with a
+    redis.ConnectionError, so callers failing open on Redis errors skip Redis
+    instead of each waiting for a timeout. Connection errors and timeouts
+    count as failures; other errors, such as script errors, show that Redis
+    answered.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, **connection_kwargs: Any) -> None:
+        """
+        Initialize the GuardedRedis.
+
+        :param breaker: Circuit breaker around the calls.
+        :param connection_kwargs: Connection settings, as taken by redis.Redis.
+        """
+        super().__init__(**connection_kwargs)
+        self.breaker = breaker
+
+    def guarded(self, call: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Make a call to Redis through the circuit breaker.
+
+        :param call: Function calling Redis.
+        :param args: Positional arguments of the call.
+        :param kwargs: Keyword arguments of the call.
+        :return: Result of the call.
+        :raises redis.ConnectionError: If the circuit is open.
+        """
+        if not self.breaker.allow():
+            raise redis.ConnectionError(f"Circuit breaker {self.breaker.name} is open")
+        try:
+            result = call(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.breaker.record_failure()
+            raise
+        except redis.RedisError:
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        """
+        Run a command through the circuit breaker.
+        """
+        return self.guarded(super().execute_command, *args, **options)
+
+    def pipeline(
+        self,
+        transaction: bool = True,
+        shard_hint: Optional[str] = None,
+    ) -> "GuardedPipeline":
+        """
+        Create a pipeline executed through the circuit breaker.
+
+        :param transaction: Whether the pipeline runs in a MULTI/EXEC.
+        :param shard_hint: Unused, as by redis.Redis.
+        :return: Pipeline.
+        """
+        return GuardedPipeline(
+            self,
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
+
+
+class GuardedPipeline(redis.client.Pipeline):
+    """
+    Pipeline of a GuardedRedis, executed through its circuit breaker.
+    """
+
+    def __init__(self, client: GuardedRedis, *args: Any) -> None:
+        """
+        Initialize the GuardedPipeline.
+
+        :param client: Client whose circuit breaker guards the execution.
+        :param args: Arguments of redis.client.Pipeline.
+        """
+        super().__init__(*args)
+        self.client = client
+
+    def execute(self, raise_on_error: bool = True) -> Any:
+        """
+        Execute the queued commands through the circuit breaker.
+
+        :param raise_on_error: Whether a failed command raises.
+        :return: Results of the commands.
+        """
+        return self.client.guarded(super().execute, raise_on_error)
+
+
+def redis_client_with_timeout(
+    cache: redis.Redis,
+    timeout: float,
+    breaker: Optional[CircuitBreaker] = None,
+) -> redis.Redis:
+    """
+    Create a client of the same Redis server whose connections and commands
+    time out.
+
+    :param cache: Redis client to copy the connection settings of.
+    :param timeout: Seconds a connection attempt or command may take.
+    :param breaker: Circuit breaker around the commands, None for none.
+    :return: Redis client with its own connection pool.
+    """
+    connection_kwargs = {
+        **cache.connection_pool.connection_kwargs,
+        "socket_timeout": timeout,
+        "socket_connect_timeout": timeout,
+    }
+    if breaker is None:
+        return redis.Redis(**connection_kwargs)
+    return GuardedRedis(breaker, **connection_kwargs)
+
+
+# Commands are not given a timeout, as blocking reads of job workers, the
+# badge event listener and the write-behind flusher wait longer than any
+# sensible one. Use REQUEST_REDIS_CLIENT for calls made while serving requests.
+REDIS_CLIENT = redis.Redis(
+    host=os.getenv("REDIS_HOST"),
+    port=int(os.getenv("REDIS_PORT")),
+    db=0,
+    socket_connect_timeout=app_config.redis_connect_timeout,
+)
+
+# Client of the calls made while serving requests. Their callers fail open on
+# Redis errors, so a slow or unavailable Redis costs requests at most the
+# timeout, and nothing once the circuit is open.
+REQUEST_REDIS_CLIENT = redis_client_with_timeout(
+    REDIS_CLIENT,
+    app_config.redis_request_timeout,
+    breaker=CircuitBreaker(
+        "redis",
+        failure_threshold=app_config.redis_breaker_threshold,
+        reset_timeout=app_config.redis_breaker_reset_timeout,
+    ),
+)
@@ -0,0 +1,114 @@
+"""
+Circuit breaker for calls to a dependency that may be slow or down
+"""
+
+import logging
+import threading
+import time
+
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Values of the circuit_breaker_state gauge.
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+# The breaker's state fields change together under its lock.
+class CircuitBreaker:  # pylint: disable=too-many-instance-attributes
+    """
+    Stops calling a dependency after consecutive failures.
+
+    The circuit opens after failure_threshold consecutive failures, and calls
+    are then refused without reaching the dependency. After reset_timeout
+    seconds it half-opens: a single trial call is let through, closing the
+    circuit if it succeeds and opening it again if it fails.
+
+    Callers check allow() before each call and report its outcome with
+    record_success() or record_failure(). The state is exposed as the
+    circuit_breaker_state gauge, and transitions are counted in
+    circuit_breaker_transitions_total.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5,
+    ) -> None:
+        """
+        Initialize the CircuitBreaker.
+
+        :param name: Name of the guarded dependency, used as metric label.
+        :param failure_threshold: Consecutive failures opening the circuit.
+        :param reset_timeout: Seconds the circuit stays open before a trial call.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        METRICS.gauge(
+            "circuit_breaker_state",
+            lambda: STATE_VALUES[self.state],
+            breaker=name,
+        )
+
+    def _transition(self, state: str) -> None:
+        """
+        Change state, with the lock held.
+
+        :param state: New state.
+        """
+        if state == self.state:
+            return
+        logger.warning("Circuit breaker %s is now %s", self.name, state)
+        METRICS.increment(
+            "circuit_breaker_transitions_total",
+            breaker=self.name,
+            state=state,
+        )
+        self.state = state
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may reach the dependency.
+
+        :return: False while the circuit is open, or half-open with a trial
+            call already running.
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        """
+        Report a successful call, closing the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        """
+        Report a failed call, opening the circuit once failures add up.
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._transition(OPEN)
+                self.opened_at = time.monotonic()
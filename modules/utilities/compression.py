@@ -0,0 +1,274 @@
+"""
+Content coding negotiation and response compression
+"""
+
+import gzip
+from typing import Dict, Iterable, Optional, Tuple
+
+import anyio.to_thread
+import brotli
+import zstandard
+from cachetools import LRUCache
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+# Codings the API compresses with, in order of preference among equally
+# accepted ones: zstd is the cheapest to produce, brotli the smallest.
+ENCODINGS = ("zstd", "br", "gzip")
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+)
+
+
+def _quality(parameters: str) -> float:
+    """
+    Read the quality value of an Accept-Encoding item.
+
+    :param parameters: Parameters following the content coding.
+    :return: Quality value, 1 if none is given, 0 if it is invalid.
+    """
+    name, _, value = parameters.partition("=")
+    if name.strip().lower() != "q":
+        return 1.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """
+    Parse an Accept-Encoding header.
+
+    :param accept_encoding: Accept-Encoding header value.
+    :return: Quality value per content coding, 0 for refused codings.
+    """
+    encodings: Dict[str, float] = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, parameters = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        encodings[coding] = _quality(parameters)
+    return encodings
+
+
+def negotiate_encoding(
+    accept_encoding: Optional[str],
+    available: Iterable[str],
+) -> Optional[str]:
+    """
+    Pick the content coding to answer with.
+
+    Codings listed with q=0 are refused, even when "*" accepts the others.
+
+    :param accept_encoding: Accept-Encoding header value.
+    :param available: Codings the server can produce, in order of preference.
+    :return: Preferred coding among the most accepted ones, None for identity.
+    """
+    encodings = accepted_encodings(accept_encoding)
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = encodings.get(coding, encodings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, coding: str, level: int) -> bytes:
+    """
+    Compress a body with a content coding.
+
+    :param body: Body to compress.
+    :param coding: "zstd", "br" or "gzip".
+    :param level: Compression level, or brotli quality.
+    :return: Compressed body.
+    :raises ValueError: If the coding is unknown.
+    """
+    if coding == "gzip":
+        return gzip.compress(body, level, mtime=0)
+    if coding == "br":
+        return brotli.compress(body, quality=level)
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"Unknown content coding: {coding}")
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses in the coding the client prefers.
+
+    Only complete bodies of compressible types above a size threshold are
+    compressed; streamed responses, such as event streams, pass through.
+    Compressed bodies of responses carrying a strong ETag are cached by
+    path, ETag and coding, so repeated listings are compressed once per
+    version.
+
+    Responses of compressible types, and 304 Not Modified responses, vary by
+    Accept-Encoding whether they are compressed or not. Their ETag is made
+    weak, which still matches If-None-Match, so a client is given the same
+    validator in a 200 and in the 304 answering it.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        levels: Optional[Dict[str, int]] = None,
+        min_size: int = app_config.compression_min_size,
+        cache_size: int = app_config.compression_cache_size,
+    ) -> None:
+        """
+        Initialize the CompressionMiddleware.
+
+        :param app: Wrapped ASGI application.
+        :param levels: Compression level per coding, the app config's by default.
+        :param min_size: Smallest body compressed, in bytes.
+        :param cache_size: Total size of the cached compressed bodies, in bytes.
+        """
+        self.app = app
+        self.levels = levels or {
+            "zstd": app_config.compression_zstd_level,
+            "br": app_config.compression_brotli_quality,
+            "gzip": app_config.compression_gzip_level,
+        }
+        self.min_size = min_size
+        self.cache: LRUCache = LRUCache(maxsize=cache_size, getsizeof=len)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Serve a request, compressing its response if the client accepts it.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive channel.
+        :param send: ASGI send channel.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        coding = negotiate_encoding(accept_encoding, ENCODINGS)
+        responder = CompressingResponder(self, scope["path"], coding, send)
+        await self.app(scope, receive, responder.send)
+
+    async def compressed_body(
+        self,
+        body: bytes,
+        coding: str,
+        cache_key: Optional[Tuple[str, str, str]],
+    ) -> bytes:
+        """
+        Compress a body, reusing the cached result for the same ETag.
+
+        :param body: Body to compress.
+        :param coding: Content coding.
+        :param cache_key: Path, ETag and coding, None if the body is not cached.
+        :return: Compressed body.
+        """
+        if cache_key is not None and cache_key in self.cache:
+            METRICS.increment("compression_cache_hits_total")
+            return self.cache[cache_key]
+        compressed = await anyio.to_thread.run_sync(
+            compress,
+            body,
+            coding,
+            self.levels[coding],
+        )
+        METRICS.increment("compressed_responses_total")
+        if cache_key is not None and len(compressed) <= self.cache.maxsize:
+            self.cache[cache_key] = compressed
+        return compressed
+
+
+class CompressingResponder:
+    """
+    Send channel compressing the response of one request.
+    """
+
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        path: str,
+        coding: Optional[str],
+        send: Send,
+    ) -> None:
+        """
+        Initialize the CompressingResponder.
+
+        :param middleware: Compression middleware.
+        :param path: Request path.
+        :param coding: Content coding negotiated with the client, None for
+            identity.
+        :param send: ASGI send channel.
+        """
+        self.middleware = middleware
+        self.path = path
+        self.coding = coding
+        self._send = send
+        self.start: Optional[Message] = None
+        self.etag: Optional[str] = None
+        self.passthrough = False
+
+    def _prepare(self, message: Message) -> bool:
+        """
+        Set the Vary header and weak ETag of a response start.
+
+        :param message: Response start.
+        :return: True if the body may be compressed.
+        """
+        headers = MutableHeaders(scope=message)
+        content_type = headers.get("content-type", "")
+        varies = content_type.startswith(COMPRESSIBLE_TYPES)
+        if varies or message["status"] == 304:
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            self.etag = headers.get("etag")
+            if self.etag and not self.etag.startswith("W/"):
+                headers["ETag"] = f"W/{self.etag}"
+        return varies and self.coding is not None and "content-encoding" not in headers
+
+    async def send(self, message: Message) -> None:
+        """
+        Hold the response start until the body shows whether to compress.
+
+        :param message: ASGI message.
+        """
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not self._prepare(message)
+            if self.passthrough:
+                await self._send(message)
+        elif self.passthrough or message["type"] != "http.response.body":
+            await self._send(message)
+        else:
+            self.passthrough = True
+            await self._send_body(message)
+
+    async def _send_body(self, message: Message) -> None:
+        """
+        Send the response start and first body message, compressed if the
+        body is complete and large enough.
+
+        :param message: First body message.
+        """
+        body = message.get("body", b"")
+        if message.get("more_body", False) or len(body) < self.middleware.min_size:
+            await self._send(self.start)
+            await self._send(message)
+            return
+
+        cache_key = None
+        if self.etag and not self.etag.startswith("W/"):
+            cache_key = (self.path, self.etag, self.coding)
+        compressed = await self.middleware.compressed_body(body, self.coding, cache_key)
+        headers = MutableHeaders(scope=self.start)
+        headers["Content-Encoding"] = self.coding
+        headers["Content-Length"] = str(len(compressed))
+        await self._send(self.start)
+        await self._send({"type": "http.response.body", "body": compressed})
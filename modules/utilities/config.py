@@ -2,6 +2,9 @@
 Application Configuration
 """
 
+import os
+import tempfile
+
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +15,104 @@ class AppConfig(BaseSettings):
     Attributes:
         secret_key (str): Secret key.
         refresh_rate (int): Refresh rate.
+        unknown_alias_ttl (float): Seconds an alias unknown to the customer
+            config backend is rejected for without asking it again.
+        self_contained_tokens (bool): Whether tokens carry the customer's status
+            and rate limits, trusted while the configurations are unchanged.
+        idempotency_ttl (int): Seconds an idempotent response is replayed for.
+        idempotency_lock_ttl (int): Seconds an idempotent request may stay in progress.
+        write_behind_enabled (bool): Queue badge writes and flush them in batches.
+        write_behind_stream (str): Redis stream holding queued badge writes.
+        write_behind_batch_size (int): Maximum badge writes flushed per transaction.
+        write_behind_flush_interval (float): Seconds between write-behind flushes.
+        write_behind_drain_timeout (float): Seconds to drain queued writes on shutdown.
+        replica_max_lag (float): Seconds of replication lag a read replica may have.
+        replica_check_interval (float): Seconds between read replica lag checks.
+        replica_connect_timeout (int): Seconds a connection to a read replica may
+            take.
+        user_cache_ttl (int): Seconds a user's badges stay cached.
+        user_cache_missing_ttl (int): Seconds an unknown user stays cached.
+        user_cache_lock_ttl (float): Seconds a user cache fill lock is held at most.
+        user_cache_wait_timeout (float): Seconds to wait for a concurrent cache fill.
+        rate_limit_enabled (bool): Rate limit requests per customer.
+        rate_limit (float): Requests per second for customers without their own limit.
+        rate_burst (int): Burst size for customers without their own burst.
+        customer_config_backend (str): Customer config storage: redis, memory,
+            mmap or shared_memory.
+        customer_config_snapshot_path (str): Snapshot file of the mmap backend.
+        customer_config_snapshot_name (str): Shared memory name of the
+            shared_memory backend.
+        import_batch_size (int): CSV import rows written per transaction.
+        job_stream (str): Redis stream of queued background jobs.
+        job_max_attempts (int): Attempts before a background job fails.
+        job_retry_backoff (float): Seconds before a failed job's first retry.
+        job_lease_timeout (float): Seconds without progress before a running job
+            is taken over by another worker.
+        job_tenant_concurrency (int): Background jobs a customer may run at once.
+        job_ttl (int): Seconds finished background jobs are kept for.
+        job_spool_dir (str): Directory of uploads waiting for a background job.
+        shutdown_grace_period (float): Seconds the API fails readiness on SIGTERM
+            before it stops accepting connections.
+        shutdown_drain_timeout (float): Seconds in-flight requests get to finish.
+        health_check_interval (float): Seconds between dependency probes.
+        health_check_timeout (float): Seconds a dependency probe may take.
+        badge_events_channel (str): Prefix of the Redis channels badge changes are
+            published to.
+        badge_events_heartbeat (float): Seconds between heartbeats of idle badge
+            event streams.
+        badge_events_queue_size (int): Badge events buffered for a slow stream
+            before it catches up from the change log instead.
+        badge_changes_retention (float): Seconds badge changes are kept in the
+            change log, 0 to keep them forever.
+        badge_changes_prune_interval (float): Seconds between prunes of the
+            badge change log.
+        profiling_enabled (bool): Whether requests may be profiled.
+        profiling_sample_rate (float): Share of requests profiled without a
+            signed X-Profile-Token header.
+        profiling_sample_interval (float): Seconds between profiler stack samples.
+        profiling_dir (str): Directory profiles are written to.
+        slow_query_threshold (float): Seconds after which a profiled query is
+            logged as slow.
+        listing_snapshot_store (str): Storage of precomputed customer listings:
+            off, redis or disk.
+        listing_snapshot_dir (str): Directory of the disk listing snapshot store.
+        listing_snapshot_debounce (float): Seconds without badge mutation before
+            a customer's listing snapshot is rebuilt.
+        listing_snapshot_max_delay (float): Seconds a listing snapshot rebuild is
+            postponed by further mutations at most.
+        listing_snapshot_max_age (float): Seconds an outdated listing snapshot may
+            still be served, 0 to serve current snapshots only.
+        listing_snapshot_gzip_level (int): Level listing snapshots are gzipped at
+            ahead of time, 0 to store them uncompressed only.
+        compression_enabled (bool): Compress responses in the coding clients
+            prefer among zstd, brotli and gzip.
+        compression_min_size (int): Smallest response body compressed, in bytes.
+        compression_gzip_level (int): gzip compression level, 1 to 9.
+        compression_brotli_quality (int): brotli compression quality, 0 to 11.
+        compression_zstd_level (int): zstd compression level, 1 to 22.
+        compression_cache_size (int): Bytes of compressed bodies cached per
+            process for responses carrying an ETag.
+        server_workers (int): API worker processes, 0 for one per available CPU.
+        server_backlog (int): Connections waiting to be accepted at most.
+        server_keep_alive (int): Seconds idle keep-alive connections are kept open.
+        host_lock_path (str): Lock file electing the process of a host that runs
+            once-per-host tasks.
+        query_budget_enforced (bool): Fail requests running more SQL statements
+            than their route's budget, instead of logging a warning.
+        redis_connect_timeout (float): Seconds a Redis connection attempt may take.
+        redis_request_timeout (float): Seconds a Redis command of a request,
+            such as a rate limit or cache lookup, may take.
+        redis_breaker_threshold (int): Consecutive Redis connection failures or
+            timeouts of requests after which Redis is skipped.
+        redis_breaker_reset_timeout (float): Seconds before requests try Redis
+            again.
+        customer_config_redis_timeout (float): Seconds a customer config lookup
+            in Redis may take.
+        customer_config_breaker_threshold (int): Consecutive failed customer
+            config lookups in Redis after which the last customers.csv loaded
+            is used instead.
+        customer_config_breaker_reset_timeout (float): Seconds before Redis is
+            tried again for customer config lookups.
 
     Config:
         env_file (str): Configuration file path.
@@ -19,6 +120,80 @@ class AppConfig(BaseSettings):
 
     secret_key: str
     refresh_rate: int
+    unknown_alias_ttl: float = 5
+    self_contained_tokens: bool = False
+    idempotency_ttl: int = 86400
+    idempotency_lock_ttl: int = 60
+    write_behind_enabled: bool = False
+    write_behind_stream: str = "badge_mutations"
+    write_behind_batch_size: int = 500
+    write_behind_flush_interval: float = 1
+    write_behind_drain_timeout: float = 10
+    replica_max_lag: float = 5
+    replica_check_interval: float = 5
+    replica_connect_timeout: int = 2
+    user_cache_ttl: int = 300
+    user_cache_missing_ttl: int = 30
+    user_cache_lock_ttl: float = 5
+    user_cache_wait_timeout: float = 1
+    rate_limit_enabled: bool = True
+    rate_limit: float = 50
+    rate_burst: int = 100
+    customer_config_backend: str = "redis"
+    customer_config_snapshot_path: str = os.path.join(
+        tempfile.gettempdir(),
+        "commentera_customers.snapshot",
+    )
+    customer_config_snapshot_name: str = "commentera_customers"
+    import_batch_size: int = 1000
+    job_stream: str = "jobs"
+    job_max_attempts: int = 3
+    job_retry_backoff: float = 5
+    job_lease_timeout: float = 300
+    job_tenant_concurrency: int = 2
+    job_ttl: int = 7 * 86400
+    job_spool_dir: str = os.path.join(tempfile.gettempdir(), "commentera_jobs")
+    shutdown_grace_period: float = 5
+    shutdown_drain_timeout: float = 20
+    health_check_interval: float = 5
+    health_check_timeout: float = 2
+    badge_events_channel: str = "badge_events"
+    badge_events_heartbeat: float = 15
+    badge_events_queue_size: int = 100
+    badge_changes_retention: float = 7 * 86400
+    badge_changes_prune_interval: float = 3600
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0
+    profiling_sample_interval: float = 0.005
+    profiling_dir: str = os.path.join(tempfile.gettempdir(), "commentera_profiles")
+    slow_query_threshold: float = 0.1
+    listing_snapshot_store: str = "off"
+    listing_snapshot_dir: str = os.path.join(
+        tempfile.gettempdir(),
+        "commentera_listings",
+    )
+    listing_snapshot_debounce: float = 1
+    listing_snapshot_max_delay: float = 5
+    listing_snapshot_max_age: float = 0
+    listing_snapshot_gzip_level: int = 6
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+    compression_cache_size: int = 64 * 1024 * 1024
+    server_workers: int = 0
+    server_backlog: int = 2048
+    server_keep_alive: int = 5
+    host_lock_path: str = os.path.join(tempfile.gettempdir(), "commentera_host.lock")
+    query_budget_enforced: bool = False
+    redis_connect_timeout: float = 1
+    redis_request_timeout: float = 0.25
+    redis_breaker_threshold: int = 5
+    redis_breaker_reset_timeout: float = 5
+    customer_config_redis_timeout: float = 0.25
+    customer_config_breaker_threshold: int = 5
+    customer_config_breaker_reset_timeout: float = 5
 
     class Config:
         """Config class"""
@@ -1,14 +1,27 @@
 """Database module, used for various database related methods"""
 import logging
 import os
+import threading
+import time
+from typing import Dict, List, Tuple
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from modules.utilities.config import app_config
 
 logger = logging.getLogger(__name__)
 
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END",
+)
+
 load_dotenv()
 
 
@@ -21,6 +34,15 @@ def get_db_session() -> sessionmaker:
         db_session.close()
 
 
+def get_read_db_session() -> sessionmaker:
+    """Retrieves a database session for read-only handlers and yields it"""
+    db_session = SessionLocal(bind=REPLICA_ROUTER.read_engine())
+    try:
+        yield db_session
+    finally:
+        db_session.close()
+
+
 def get_environment() -> str:
     """Gets the environment from the environment variable ENV and returns local if it doesn't exist"""
     environment = os.getenv("STAGE", "local")
@@ -56,10 +78,144 @@ def db_connection_string(environment=None) -> str:
     return f"postgresql://{username}:{password}@{postgresql_host}:{postgresql_port}/{db_name}"
 
 
+def replica_connection_strings() -> List[str]:
+    """Reads the comma separated read replica URLs from DATABASE_REPLICA_URLS"""
+    replica_urls = os.getenv("DATABASE_REPLICA_URLS", "")
+    return [url.strip() for url in replica_urls.split(",") if url.strip()]
+
+
+# Replica health and round-robin state are read together on every query.
+class ReplicaRouter:  # pylint: disable=too-many-instance-attributes
+    """
+    Routes read-only sessions to read replicas, round-robin.
+
+    Replicas whose replication lag exceeds the allowed maximum, or that cannot
+    be reached, are skipped until their next check. When no replica is usable
+    reads fall back to the primary.
+
+    Only one request at a time checks a replica; the others use the result of
+    its previous check meanwhile, so an expired check does not make every
+    concurrent request probe the replica.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replica_urls: List[str],
+        max_lag: float,
+        check_interval: float,
+        connect_timeout: int = 2,
+    ) -> None:
+        """
+        Initialize the ReplicaRouter.
+
+        :param primary: Primary engine.
+        :param replica_urls: Read replica connection strings.
+        :param max_lag: Maximum replication lag in seconds.
+        :param check_interval: Seconds a replica lag check is trusted for.
+        :param connect_timeout: Seconds a connection to a replica may take.
+        """
+        self.primary = primary
+        self.replicas = [
+            create_engine(
+                url,
+                pool_pre_ping=True,
+                connect_args={"connect_timeout": connect_timeout},
+            )
+            for url in replica_urls
+        ]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._health: Dict[int, Tuple[float, bool]] = {}
+        self._probing = [threading.Lock() for _ in self.replicas]
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, index: int) -> bool:
+        """
+        Check whether a replica is reachable and within the allowed lag.
+
+        :param index: Replica index.
+        :return: True if the replica can serve reads.
+        """
+        checked_at, healthy = self._health.get(index, (0.0, False))
+        if time.monotonic() - checked_at < self.check_interval:
+            return healthy
+        if not self._probing[index].acquire(blocking=False):
+            # Another request is checking the replica.
+            return healthy
+
+        try:
+            healthy = self._probe(index)
+            with self._lock:
+                self._health[index] = (time.monotonic(), healthy)
+        finally:
+            self._probing[index].release()
+        return healthy
+
+    def _probe(self, index: int) -> bool:
+        """
+        Measure a replica's replication lag.
+
+        :param index: Replica index.
+        :return: True if the replica is reachable and within the allowed lag.
+        """
+        try:
+            with self.replicas[index].connect() as connection:
+                lag = connection.execute(REPLICA_LAG_QUERY).scalar()
+        except SQLAlchemyError as database_error:
+            logger.warning("Read replica %s is unavailable: %s", index, database_error)
+            return False
+        if lag > self.max_lag:
+            logger.warning("Read replica %s is lagging by %ss", index, lag)
+            return False
+        return True
+
+    def read_engine(self) -> Engine:
+        """
+        Pick the engine for a read-only session.
+
+        :return: Next healthy replica engine, or the primary engine.
+        """
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                index = self._next
+                self._next = (self._next + 1) % len(self.replicas)
+            if self._is_healthy(index):
+                return self.replicas[index]
+        return self.primary
+
+    def reads_from_primary(self, db_session: Session) -> bool:
+        """
+        Check whether a session reads from the primary.
+
+        :param db_session: Database session.
+        :return: False if the session is bound to a replica, which may lag.
+        """
+        return db_session.get_bind() is self.primary
+
+    def dispose(self, close: bool = True) -> None:
+        """
+        Close the pooled connections of the primary and replica engines.
+
+        :param close: False to drop the pools without closing their connections,
+            in a forked process whose parent still uses them.
+        """
+        for database_engine in [self.primary, *self.replicas]:
+            database_engine.dispose(close=close)
+
+
 DB_URL = db_connection_string()
 engine = create_engine(DB_URL)
 logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+REPLICA_ROUTER = ReplicaRouter(
+    primary=engine,
+    replica_urls=replica_connection_strings(),
+    max_lag=app_config.replica_max_lag,
+    check_interval=app_config.replica_check_interval,
+    connect_timeout=app_config.replica_connect_timeout,
+)
 
 Base = declarative_base()
 
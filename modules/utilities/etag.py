@@ -0,0 +1,161 @@
+"""
+Per-customer versions and ETag helpers
+"""
+
+import logging
+import threading
+import time
+from typing import Optional, Set
+
+import redis
+
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerVersions:
+    """
+    Per-customer version counters stored in Redis.
+
+    Every badge mutation bumps the customer's version after it is committed,
+    so a version read before a database query never outlives the data it
+    describes. Counters start from the current time in nanoseconds, which
+    keeps versions from being reused if Redis loses its data.
+
+    A failed bump leaves the customer's version unknown: until the bump is
+    retried successfully, get returns None, so no ETag is issued and no
+    snapshot is served against a version the data has already outgrown.
+    """
+
+    def __init__(self, cache: redis.Redis) -> None:
+        """
+        Initialize the CustomerVersions.
+
+        :param cache: Redis client.
+        """
+        self.cache = cache
+        self._unbumped: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(customer_alias: str) -> str:
+        """
+        Build the Redis key of a customer's version.
+
+        :param customer_alias: Customer alias.
+        :return: Redis key.
+        """
+        return f"customer_version:{customer_alias}"
+
+    def bump(self, customer_alias: str) -> None:
+        """
+        Increment a customer's version.
+
+        On failure, the customer's version is unknown until a retried bump
+        succeeds.
+
+        :param customer_alias: Customer alias.
+        :return: True if the version was incremented.
+        """
+        key = self._key(customer_alias)
+        try:
+            pipeline = self.cache.pipeline(transaction=False)
+            pipeline.set(key, time.time_ns(), nx=True)
+            pipeline.incr(key)
+            pipeline.execute()
+        except redis.RedisError as redis_error:
+            logger.error(
+                "Unable to bump version of %s: %s",
+                customer_alias,
+                redis_error,
+            )
+            with self._lock:
+                self._unbumped.add(customer_alias)
+            return False
+        with self._lock:
+            self._unbumped.discard(customer_alias)
+        return True
+
+    def _retry_bumps(self) -> None:
+        """
+        Retry the failed bumps, stopping at the first one failing again.
+        """
+        with self._lock:
+            unbumped = list(self._unbumped)
+        for customer_alias in unbumped:
+            if not self.bump(customer_alias):
+                return
+
+    def get(self, customer_alias: str) -> Optional[int]:
+        """
+        Read a customer's version, creating it if needed.
+
+        Failed bumps are retried first.
+
+        :param customer_alias: Customer alias.
+        :return: Version, or None if Redis is unavailable or the version is
+            unknown.
+        """
+        self._retry_bumps()
+        with self._lock:
+            if customer_alias in self._unbumped:
+                return None
+        key = self._key(customer_alias)
+        try:
+            version = self.cache.get(key)
+            if version is None:
+                self.cache.set(key, time.time_ns(), nx=True)
+                version = self.cache.get(key)
+        except redis.RedisError as redis_error:
+            logger.warning(
+                "Unable to read version of %s: %s",
+                customer_alias,
+                redis_error,
+            )
+            return None
+        return int(version)
+
+    def etag(self, customer_alias: str, *scope: str) -> Optional[str]:
+        """
+        Build a strong ETag for a customer's data.
+
+        :param customer_alias: Customer alias.
+        :param scope: Extra parts identifying the resource.
+        :return: Quoted ETag, or None if the version is unavailable.
+        """
+        version = self.get(customer_alias)
+        if version is None:
+            return None
+        return self.format_etag(customer_alias, version, *scope)
+
+    @staticmethod
+    def format_etag(customer_alias: str, version: int, *scope: str) -> str:
+        """
+        Build the strong ETag of a given version of a customer's data.
+
+        :param customer_alias: Customer alias.
+        :param version: Customer version the data was read at.
+        :param scope: Extra parts identifying the resource.
+        :return: Quoted ETag.
+        """
+        return '"' + "-".join((customer_alias, *scope, str(version))) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Check an If-None-Match header against an ETag.
+
+    :param if_none_match: If-None-Match header value.
+    :param etag: Current ETag.
+    :return: True if the client's copy is current.
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+CUSTOMER_VERSIONS = CustomerVersions(REQUEST_REDIS_CLIENT)
@@ -0,0 +1,200 @@
+"""
+Cached dependency health probes
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from modules.actions.customer import CustomerConfig
+from modules.utilities.auth import CUSTOMER_CONFIG
+from modules.utilities.cache import REDIS_CLIENT, redis_client_with_timeout
+from modules.utilities.config import app_config
+from modules.utilities.database import engine
+
+logger = logging.getLogger(__name__)
+
+ProbeResult = Dict[str, Any]
+
+# Probe rounds missed before cached results are no longer trusted.
+STALE_ROUNDS = 3
+
+# Checks the API cannot serve without. Other failing checks only degrade it:
+# Redis backed features fail open and the last known customer configurations
+# are kept.
+CRITICAL_CHECKS = ("database",)
+
+
+# Probe settings are kept with the latest results they produced.
+class HealthProbes:  # pylint: disable=too-many-instance-attributes
+    """
+    Dependency probes run on a background interval.
+
+    Health endpoints only read the cached results, so frequent load balancer
+    checks cost nothing and never open connections. The probes use one
+    dedicated Redis connection and a single pooled database connection.
+    """
+
+    def __init__(
+        self,
+        database_engine: Engine,
+        cache: redis.Redis,
+        customer_config: CustomerConfig,
+        interval: float,
+        timeout: float,
+    ) -> None:
+        """
+        Initialize the HealthProbes.
+
+        :param database_engine: Engine whose database and pool are probed.
+        :param cache: Redis client whose server is probed.
+        :param customer_config: Customer configuration whose refresh is checked.
+        :param interval: Seconds between probe rounds.
+        :param timeout: Seconds a probe may take.
+        """
+        self.database_engine = database_engine
+        self.cache = redis_client_with_timeout(cache, timeout)
+        self.customer_config = customer_config
+        self.interval = interval
+        self.timeout = timeout
+        self.scheduler = BackgroundScheduler()
+        self._results: Dict[str, ProbeResult] = {}
+        self._checked_at: Optional[float] = None
+
+    def _pool_state(self) -> Dict[str, int]:
+        """
+        Read the database connection pool counters.
+
+        :return: Pool size, connections checked out and overflow connections.
+        """
+        pool = self.database_engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
+    def _probe_database(self) -> ProbeResult:
+        """
+        Run a trivial query.
+
+        :return: Probe result.
+        """
+        with self.database_engine.connect() as connection:
+            timeout_ms = int(self.timeout * 1000)
+            connection.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+            connection.execute(text("SELECT 1"))
+            connection.rollback()
+        return {}
+
+    def _probe_redis(self) -> ProbeResult:
+        """
+        Ping Redis.
+
+        :return: Probe result.
+        """
+        self.cache.ping()
+        return {}
+
+    def _probe_customer_config(self) -> ProbeResult:
+        """
+        Check the customer configurations were refreshed recently.
+
+        :return: Probe result.
+        :raises RuntimeError: If the last refresh is too old.
+        """
+        refreshed_at = self.customer_config.refreshed_at
+        if refreshed_at is None:
+            raise RuntimeError("Customer configurations were never loaded")
+        age = time.time() - refreshed_at
+        if age > STALE_ROUNDS * self.customer_config.refresh_rate:
+            raise RuntimeError(f"Customer configurations are {age:.0f}s old")
+        return {"age": round(age, 3)}
+
+    @staticmethod
+    def _run(probe: Callable[[], ProbeResult]) -> ProbeResult:
+        """
+        Run a probe, catching its failure.
+
+        :param probe: Probe function.
+        :return: Probe result with its status and duration.
+        """
+        started_at = time.monotonic()
+        try:
+            result = {"ok": True, **probe()}
+        except Exception as general_exception:  # pylint: disable=W0703
+            logger.warning("Health probe failed: %s", general_exception)
+            result = {"ok": False, "error": str(general_exception)}
+        result["duration"] = round(time.monotonic() - started_at, 4)
+        return result
+
+    def run_probes(self) -> None:
+        """
+        Run every probe and replace the cached results.
+        """
+        self._results = {
+            "database": {**self._run(self._probe_database), "pool": self._pool_state()},
+            "redis": self._run(self._probe_redis),
+            "customer_config": self._run(self._probe_customer_config),
+        }
+        self._checked_at = time.monotonic()
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build a report from the cached results.
+
+        Results are not trusted once the probes missed a few rounds, as the
+        probe thread itself may be stuck.
+
+        :return: Report with an ok flag, false if the results are stale or a
+            critical check failed, the failed non-critical checks, the results
+            age and checks.
+        """
+        if self._checked_at is None:
+            return {"ok": False, "degraded": [], "age": None, "checks": {}}
+        age = time.monotonic() - self._checked_at
+        results = self._results
+        failed = [name for name, result in results.items() if not result["ok"]]
+        return {
+            "ok": age <= STALE_ROUNDS * self.interval
+            and not any(name in CRITICAL_CHECKS for name in failed),
+            "degraded": [name for name in failed if name not in CRITICAL_CHECKS],
+            "age": round(age, 3),
+            "checks": results,
+        }
+
+    def start(self) -> None:
+        """
+        Run the probes now, then on the background interval.
+        """
+        self.run_probes()
+        self.scheduler.add_job(
+            self.run_probes,
+            trigger="interval",
+            seconds=self.interval,
+            max_instances=1,
+            coalesce=True,
+        )
+        self.scheduler.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background probes and close their Redis connection.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.cache.close()
+
+
+HEALTH_PROBES = HealthProbes(
+    database_engine=engine,
+    cache=REDIS_CLIENT,
+    customer_config=CUSTOMER_CONFIG,
+    interval=app_config.health_check_interval,
+    timeout=app_config.health_check_timeout,
+)
@@ -0,0 +1,68 @@
+"""
+Election of one process per host for once-per-host tasks
+"""
+
+import fcntl
+import os
+from typing import IO, Optional
+
+from modules.utilities.config import app_config
+
+
+class HostLock:
+    """
+    Advisory file lock held by at most one process of a host.
+
+    Processes call acquire() before each once-per-host task. The first one to
+    get the lock keeps it for its lifetime; when it exits, the operating system
+    releases the lock and the next process to try takes over.
+
+    The lock must not be acquired before forking workers, as forked processes
+    would share it.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the HostLock.
+
+        :param path: Path of the lock file.
+        """
+        self.path = path
+        self._file: Optional[IO[bytes]] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        """
+        Whether this process holds the lock.
+        """
+        return self._file is not None and self._pid == os.getpid()
+
+    def acquire(self) -> bool:
+        """
+        Take the lock if no other process holds it.
+
+        :return: True if this process holds the lock.
+        """
+        if self.held:
+            return True
+        lock_file = open(self.path, "ab")  # pylint: disable=consider-using-with
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file, self._pid = lock_file, os.getpid()
+        return True
+
+    def release(self) -> None:
+        """
+        Give the lock up if this process holds it.
+        """
+        if self.held:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._file = self._pid = None
+
+
+HOST_LOCK = HostLock(app_config.host_lock_path)
@@ -0,0 +1,332 @@
+"""
+Idempotency-Key support for write endpoints
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Coroutine, Dict, Optional
+
+import redis
+from fastapi import HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.concurrency import run_in_threadpool
+
+from modules.utilities.auth import verify_customer_token
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+from modules.utilities.config import app_config
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENT_METHODS = frozenset({"POST", "PATCH", "DELETE"})
+MAX_KEY_LENGTH = 255
+
+# Client errors a retry may not get again, such as rate limiting or a
+# conflicting request in progress. Like server errors, they are not stored.
+TRANSIENT_STATUSES = frozenset(
+    {
+        status.HTTP_408_REQUEST_TIMEOUT,
+        status.HTTP_409_CONFLICT,
+        status.HTTP_425_TOO_EARLY,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+    },
+)
+
+RouteHandler = Callable[[Request], Coroutine[Any, Any, Response]]
+
+
+class IdempotencyStore:
+    """
+    Stores the first response for an Idempotency-Key in Redis and replays it.
+    """
+
+    def __init__(self, cache: redis.Redis, ttl: int, lock_ttl: int) -> None:
+        """
+        Initialize the IdempotencyStore.
+
+        :param cache: Redis client.
+        :param ttl: Seconds a stored response is replayed for.
+        :param lock_ttl: Seconds a request is marked as in progress.
+        """
+        self.cache = cache
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+
+    @staticmethod
+    def _redis_key(request: Request, customer_alias: str, idempotency_key: str) -> str:
+        """
+        Build the Redis key, scoped to the authenticated customer and route.
+
+        Keys outlive tokens, so a retry with a refreshed token still replays.
+
+        :param request: Incoming request.
+        :param customer_alias: Authenticated customer alias.
+        :param idempotency_key: Client supplied key.
+        :return: Redis key.
+        """
+        route = f"{request.method}:{request.url.path}"
+        return f"idempotency:{customer_alias}:{route}:{idempotency_key}"
+
+    @staticmethod
+    async def _authenticate(request: Request) -> str:
+        """
+        Verify the request's bearer token before anything is replayed.
+
+        Rate limiting is left to the route's own authentication, so requests
+        that are not replays are counted once.
+
+        :param request: Incoming request.
+        :return: Customer alias.
+        :raises HTTPException: If authentication fails.
+        """
+        scheme, token = get_authorization_scheme_param(
+            request.headers.get("Authorization"),
+        )
+        bearer_token = token if scheme.lower() == "bearer" and token else None
+        customer_alias, _ = await run_in_threadpool(verify_customer_token, bearer_token)
+        return customer_alias
+
+    @staticmethod
+    def _replay(record: Dict[str, Any]) -> Response:
+        """
+        Rebuild a response from a stored record.
+
+        :param record: Stored response record.
+        :return: Response identical to the first one.
+        """
+        headers = {**record["headers"], REPLAYED_HEADER: "true"}
+        return Response(
+            content=record["body"].encode("utf-8"),
+            status_code=record["status_code"],
+            headers=headers,
+        )
+
+    def _store(
+        self,
+        redis_key: str,
+        fingerprint: str,
+        status_code: int,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Store a completed response.
+
+        The response is still served when Redis is unavailable; a retry then
+        runs the request again.
+
+        :param redis_key: Redis key.
+        :param fingerprint: Request body fingerprint.
+        :param status_code: Response status code.
+        :param body: Response body.
+        :param headers: Response headers worth replaying.
+        """
+        record = {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status_code": status_code,
+            "headers": headers or {},
+            "body": body.decode("utf-8"),
+        }
+        try:
+            self.cache.set(redis_key, json.dumps(record), ex=self.ttl)
+        except redis.RedisError as redis_error:
+            logger.warning("Unable to store idempotent response: %s", redis_error)
+
+    def _delete(self, redis_key: str) -> None:
+        """
+        Delete a stored request, logging Redis errors.
+
+        Until the in-progress record expires, retries are answered with a 409.
+
+        :param redis_key: Redis key.
+        """
+        try:
+            self.cache.delete(redis_key)
+        except redis.RedisError as redis_error:
+            logger.warning("Unable to discard idempotent request: %s", redis_error)
+
+    async def _discard(self, redis_key: str) -> None:
+        """
+        Forget a request that failed, so it can be retried.
+
+        :param redis_key: Redis key.
+        """
+        await run_in_threadpool(self._delete, redis_key)
+
+    def _acquire(self, redis_key: str, in_progress: str) -> Optional[bytes]:
+        """
+        Mark a request as in progress, unless its key is already stored.
+
+        :param redis_key: Redis key.
+        :param in_progress: In-progress record.
+        :return: Stored record, None if the request was marked in progress.
+        """
+        if self.cache.set(redis_key, in_progress, nx=True, ex=self.lock_ttl):
+            return None
+        return self.cache.get(redis_key)
+
+    @staticmethod
+    def _check_stored(record: Dict[str, Any], fingerprint: str) -> None:
+        """
+        Ensure a stored record may be replayed for this request.
+
+        :param record: Stored response record.
+        :param fingerprint: Request body fingerprint.
+        :raises HTTPException: If the key was reused or is still in progress.
+        """
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{IDEMPOTENCY_HEADER} was already used with another payload",
+            )
+        if record["state"] != "done":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is in progress",
+            )
+
+    @staticmethod
+    def _is_final(status_code: int) -> bool:
+        """
+        Check whether a response status is worth replaying to retries.
+
+        :param status_code: Response status code.
+        :return: False for server errors and transient client errors.
+        """
+        return (
+            status_code < status.HTTP_500_INTERNAL_SERVER_ERROR
+            and status_code not in TRANSIENT_STATUSES
+        )
+
+    async def _run_and_store(
+        self,
+        request: Request,
+        redis_key: str,
+        fingerprint: str,
+        route_handler: RouteHandler,
+    ) -> Response:
+        """
+        Run the route and store its outcome, unless it is a server error or a
+        transient client error, such as a 429 from rate limiting.
+
+        :param request: Incoming request.
+        :param redis_key: Redis key.
+        :param fingerprint: Request body fingerprint.
+        :param route_handler: The original route handler.
+        :return: Response.
+        """
+        try:
+            response = await route_handler(request)
+        except HTTPException as http_exception:
+            if not self._is_final(http_exception.status_code):
+                await self._discard(redis_key)
+                raise
+            headers = {**(http_exception.headers or {})}
+            headers["content-type"] = "application/json"
+            body = json.dumps({"detail": http_exception.detail}).encode("utf-8")
+            await run_in_threadpool(
+                self._store,
+                redis_key,
+                fingerprint,
+                http_exception.status_code,
+                body,
+                headers,
+            )
+            raise
+        except Exception:
+            await self._discard(redis_key)
+            raise
+
+        if not self._is_final(response.status_code):
+            await self._discard(redis_key)
+            return response
+
+        await run_in_threadpool(
+            self._store,
+            redis_key,
+            fingerprint,
+            response.status_code,
+            response.body,
+            {"content-type": response.headers.get("content-type", "")},
+        )
+        return response
+
+    async def handle(
+        self,
+        request: Request,
+        idempotency_key: str,
+        route_handler: RouteHandler,
+    ) -> Response:
+        """
+        Replay a stored response or run the route and store its response.
+
+        :param request: Incoming request.
+        :param idempotency_key: Client supplied key.
+        :param route_handler: The original route handler.
+        :return: Response.
+        :raises HTTPException: If the key is invalid or authentication fails.
+        """
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters",
+            )
+
+        customer_alias = await self._authenticate(request)
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+        redis_key = self._redis_key(request, customer_alias, idempotency_key)
+        in_progress = json.dumps({"state": "in_progress", "fingerprint": fingerprint})
+
+        try:
+            stored = await run_in_threadpool(self._acquire, redis_key, in_progress)
+        except redis.RedisError as redis_error:
+            logger.warning("Idempotency store unavailable: %s", redis_error)
+            return await route_handler(request)
+
+        if stored is not None:
+            record = json.loads(stored)
+            self._check_stored(record, fingerprint)
+            return self._replay(record)
+
+        return await self._run_and_store(request, redis_key, fingerprint, route_handler)
+
+
+IDEMPOTENCY_STORE = IdempotencyStore(
+    cache=REQUEST_REDIS_CLIENT,
+    ttl=app_config.idempotency_ttl,
+    lock_ttl=app_config.idempotency_lock_ttl,
+)
+
+
+class IdempotentRoute(APIRoute):
+    """
+    Route class honouring the Idempotency-Key header on write methods.
+
+    The caller's token is verified first; the stored response is then
+    replayed before rate limiting, dependency resolution and any database
+    work happen.
+    """
+
+    def get_route_handler(self) -> RouteHandler:
+        """
+        Wrap the default route handler with idempotency handling.
+
+        :return: Route handler.
+        """
+        route_handler = super().get_route_handler()
+
+        async def idempotent_route_handler(request: Request) -> Response:
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if idempotency_key is None or request.method not in IDEMPOTENT_METHODS:
+                return await route_handler(request)
+            return await IDEMPOTENCY_STORE.handle(
+                request,
+                idempotency_key,
+                route_handler,
+            )
+
+        return idempotent_route_handler
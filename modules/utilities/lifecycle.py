@@ -0,0 +1,151 @@
+"""
+Process lifecycle: readiness, in-flight requests and graceful shutdown
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any
+
+import uvicorn
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Tracks whether the process should get traffic and the requests it serves.
+
+    The process is ready once its startup tasks ran, and stops being ready as
+    soon as it starts draining, so load balancers route new requests to other
+    instances while the in-flight ones finish.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the Lifecycle.
+        """
+        self.started = False
+        self.draining = False
+        self.in_flight = 0
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the process should get new requests.
+        """
+        return self.started and not self.draining
+
+    def mark_started(self) -> None:
+        """
+        Record that the startup tasks ran.
+        """
+        self.started = True
+
+    def start_draining(self) -> None:
+        """
+        Stop advertising the process as ready.
+        """
+        if not self.draining:
+            logger.info("Draining, %d requests in flight", self.in_flight)
+        self.draining = True
+
+    async def wait_for_requests(self, timeout: float) -> bool:
+        """
+        Wait for the in-flight requests to finish.
+
+        :param timeout: Seconds to wait at most.
+        :return: True if no request is in flight anymore.
+        """
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.in_flight:
+            logger.warning("Shutting down with %d requests in flight", self.in_flight)
+        return not self.in_flight
+
+
+LIFECYCLE = Lifecycle()
+METRICS.gauge("http_requests_in_flight", lambda: LIFECYCLE.in_flight)
+
+
+class LifecycleMiddleware:
+    """
+    ASGI middleware counting in-flight requests.
+
+    While the process drains, responses ask clients to close their keep-alive
+    connection, so their next requests go through the load balancer again.
+    """
+
+    def __init__(self, app: ASGIApp, lifecycle: Lifecycle = LIFECYCLE) -> None:
+        """
+        Initialize the LifecycleMiddleware.
+
+        :param app: Wrapped ASGI application.
+        :param lifecycle: Lifecycle to report requests to.
+        """
+        self.app = app
+        self.lifecycle = lifecycle
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Serve a request, counting it as in flight.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive channel.
+        :param send: ASGI send channel.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_connection_close(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.lifecycle.draining:
+                headers = list(message.get("headers", []))
+                headers.append((b"connection", b"close"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        self.lifecycle.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_connection_close)
+        finally:
+            self.lifecycle.in_flight -= 1
+
+
+class GracefulServer(uvicorn.Server):
+    """
+    Uvicorn server that drains before it stops accepting connections.
+
+    On SIGTERM the process first fails its readiness probe for the grace
+    period, still serving requests while load balancers deregister it. Uvicorn
+    then stops listening and waits for open connections up to the drain
+    timeout before the application shuts down. A second signal exits at once.
+    """
+
+    def handle_exit(self, sig: int, frame: Any) -> None:
+        """
+        Handle SIGINT and SIGTERM.
+
+        :param sig: Signal number.
+        :param frame: Interrupted stack frame.
+        """
+        if LIFECYCLE.draining:
+            super().handle_exit(sig, frame)
+            return
+
+        LIFECYCLE.start_draining()
+        grace_period = app_config.shutdown_grace_period
+        threading.Timer(grace_period, super().handle_exit, (sig, frame)).start()
+        force_exit = threading.Timer(
+            grace_period + app_config.shutdown_drain_timeout,
+            setattr,
+            (self, "force_exit", True),
+        )
+        force_exit.daemon = True
+        force_exit.start()
@@ -0,0 +1,99 @@
+"""
+In-process metrics, rendered in the Prometheus text format
+"""
+
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """
+    Minimal registry of counters and callback gauges.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the Metrics.
+        """
+        self._counters: Dict[str, Dict[LabelSet, float]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[LabelSet, Callable[[], float]]] = defaultdict(
+            dict,
+        )
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increment a counter.
+
+        :param name: Metric name.
+        :param value: Amount to add.
+        :param labels: Metric labels.
+        """
+        label_set = tuple(sorted(labels.items()))
+        with self._lock:
+            counter = self._counters[name]
+            counter[label_set] = counter.get(label_set, 0) + value
+
+    def gauge(self, name: str, callback: Callable[[], float], **labels: str) -> None:
+        """
+        Register a gauge whose value is read when metrics are rendered.
+
+        :param name: Metric name.
+        :param callback: Function returning the current value.
+        :param labels: Metric labels.
+        """
+        with self._lock:
+            self._gauges[name][tuple(sorted(labels.items()))] = callback
+
+    def value(self, name: str, **labels: str) -> float:
+        """
+        Read the current value of a counter.
+
+        :param name: Metric name.
+        :param labels: Metric labels.
+        :return: Counter value.
+        """
+        with self._lock:
+            return self._counters[name].get(tuple(sorted(labels.items())), 0)
+
+    @staticmethod
+    def _sample(name: str, label_set: LabelSet, value: float) -> str:
+        """
+        Render one sample line.
+
+        :param name: Metric name.
+        :param label_set: Metric labels.
+        :param value: Sample value.
+        :return: Sample line.
+        """
+        if not label_set:
+            return f"{name} {value}"
+        labels = ",".join(f'{key}="{label}"' for key, label in label_set)
+        return f"{name}{{{labels}}} {value}"
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        :return: Metrics text.
+        """
+        lines = []
+        with self._lock:
+            counters = {name: dict(samples) for name, samples in self._counters.items()}
+            gauges = {name: dict(samples) for name, samples in self._gauges.items()}
+        for name, samples in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(self._sample(name, *sample) for sample in samples.items())
+        for name, callbacks in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(
+                self._sample(name, label_set, callback())
+                for label_set, callback in callbacks.items()
+            )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
@@ -0,0 +1,137 @@
+"""
+Pre-forking multi-process server
+"""
+
+import logging
+import math
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+import uvicorn
+
+from modules.utilities.lifecycle import GracefulServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before replacing a worker that exited unexpectedly, so a
+# worker crashing on startup does not make the supervisor spin.
+RESPAWN_DELAY = 1
+
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def available_cpus() -> int:
+    """
+    Count the CPUs this process may use.
+
+    Both the CPU affinity and a cgroup v2 CPU quota, as set by container
+    runtimes, are taken into account.
+
+    :return: Number of usable CPUs, at least 1.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open(CGROUP_CPU_MAX, "r") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+class PreforkServer:
+    """
+    Runs the application in worker processes forked from a supervisor.
+
+    The supervisor imports the application and binds the listening socket
+    once, then forks the workers, which share the imported code pages and
+    accept connections from the same socket. Workers that exit unexpectedly
+    are replaced. SIGTERM and SIGINT are forwarded to the workers, which
+    drain as a single process would, and the supervisor exits once they all
+    have.
+    """
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        workers: int,
+        after_fork: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Initialize the PreforkServer.
+
+        :param config: Uvicorn configuration, holding the loaded application.
+        :param workers: Number of worker processes.
+        :param after_fork: Called in each worker before it starts serving, to
+            reset state inherited from the supervisor such as pooled connections.
+        """
+        self.config = config
+        self.workers = workers
+        self.after_fork = after_fork
+        self.stopping = False
+        self._children: Dict[int, int] = {}
+
+    def _spawn(self, sock: socket.socket, slot: int) -> None:
+        """
+        Fork a worker serving from the listening socket.
+
+        :param sock: Listening socket.
+        :param slot: Worker number, kept by its replacements.
+        """
+        pid = os.fork()
+        if pid:
+            self._children[pid] = slot
+            return
+        status = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            if self.after_fork is not None:
+                self.after_fork()
+            GracefulServer(self.config).run(sockets=[sock])
+            status = 0
+        finally:
+            os._exit(status)  # pylint: disable=protected-access
+
+    def _forward(self, sig: int, _: object) -> None:
+        """
+        Stop respawning workers and pass a shutdown signal on to them.
+
+        :param sig: Signal number.
+        """
+        self.stopping = True
+        for pid in self._children:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        """
+        Bind the socket, fork the workers and supervise them until shutdown.
+        """
+        sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self._forward)
+        signal.signal(signal.SIGINT, self._forward)
+        logger.info("Starting %d workers", self.workers)
+        for slot in range(self.workers):
+            self._spawn(sock, slot)
+
+        while self._children:
+            pid, status = os.wait()
+            slot = self._children.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            logger.warning(
+                "Worker %d exited with status %d, replacing it",
+                pid,
+                os.waitstatus_to_exitcode(status),
+            )
+            time.sleep(RESPAWN_DELAY)
+            if not self.stopping:
+                self._spawn(sock, slot)
+        sock.close()
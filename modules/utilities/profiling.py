@@ -0,0 +1,331 @@
+"""
+Per-request profiling: stack sampling and SQL query timing
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+import anyio.to_thread
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from modules.utilities.config import app_config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile-Token"
+PROJECT_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+)
+
+CURRENT_PROFILE: ContextVar[Optional["RequestProfile"]] = ContextVar(
+    "current_profile",
+    default=None,
+)
+
+
+def _sign(expires: str) -> str:
+    """
+    Sign a profiling token expiry with the app secret key.
+
+    :param expires: Expiry timestamp.
+    :return: Hex signature.
+    """
+    key = app_config.secret_key.encode("utf-8")
+    return hmac.new(key, expires.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def profile_token(ttl: float) -> str:
+    """
+    Create a token enabling profiling of the requests carrying it.
+
+    :param ttl: Seconds the token is valid for.
+    :return: Value of the X-Profile-Token header.
+    """
+    expires = str(int(time.time() + ttl))
+    return f"{expires}.{_sign(expires)}"
+
+
+def is_valid_profile_token(token: str) -> bool:
+    """
+    Check a profiling token's signature and expiry.
+
+    :param token: Value of the X-Profile-Token header.
+    :return: True if the token is valid.
+    """
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _sign(expires))
+
+
+def bind_shape(parameters: Any) -> Any:
+    """
+    Describe query parameters by type and size, without their values.
+
+    :param parameters: DBAPI parameters.
+    :return: Parameter shapes.
+    """
+    if isinstance(parameters, dict):
+        return {name: bind_shape(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [len(parameters), bind_shape(parameters[0])]
+        return f"{type(parameters).__name__}[{len(parameters)}]"
+    return type(parameters).__name__
+
+
+# A record of one request's timings, plus the thread sampling it.
+class RequestProfile:  # pylint: disable=too-many-instance-attributes
+    """
+    Profile of a request: sampled stacks and timed SQL queries.
+
+    Stacks are sampled from every thread running project code while the
+    request is served, as the threadpool running its handlers cannot be told
+    apart from the ones serving other requests; profile under low concurrency
+    for clean flamegraphs. Queries are only those of the request.
+    """
+
+    def __init__(self, method: str, path: str, interval: float) -> None:
+        """
+        Initialize the RequestProfile.
+
+        :param method: Request method.
+        :param path: Request path.
+        :param interval: Seconds between stack samples.
+        """
+        self.profile_id = uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.status: Optional[int] = None
+        self.stacks: Counter = Counter()
+        self.queries: List[Dict[str, Any]] = []
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def _stack(frame: Any) -> Optional[str]:
+        """
+        Render a thread's stack in the collapsed flamegraph format.
+
+        :param frame: Innermost frame.
+        :return: Frames from the outermost, None if no project code is running.
+        """
+        frames, in_project = [], False
+        while frame is not None:
+            code = frame.f_code
+            in_project = in_project or code.co_filename.startswith(PROJECT_DIR)
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            frames.append(f"{module}.{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(frames)) if in_project else None
+
+    def _sample(self) -> None:
+        """
+        Sample thread stacks until the profile stops.
+        """
+        sampler_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            # The only way to read the stacks of other threads.
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for thread_id, frame in frames.items():
+                if thread_id == sampler_id:
+                    continue
+                stack = self._stack(frame)
+                if stack is not None:
+                    self.stacks[stack] += 1
+
+    def start(self) -> None:
+        """
+        Start sampling stacks.
+        """
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling stacks.
+        """
+        self.duration = time.time() - self.started_at
+        self._stop.set()
+        self._sampler.join()
+
+    def record_query(self, statement: str, parameters: Any, duration: float) -> None:
+        """
+        Record a query, logging it if it is slow.
+
+        :param statement: SQL statement.
+        :param parameters: DBAPI parameters.
+        :param duration: Seconds the query took.
+        """
+        query = {
+            "statement": statement,
+            "parameters": bind_shape(parameters),
+            "duration": round(duration, 6),
+        }
+        self.queries.append(query)
+        if duration >= app_config.slow_query_threshold:
+            logger.warning(
+                "Slow query in %s %s (%.1fms): %s %s",
+                self.method,
+                self.path,
+                duration * 1000,
+                statement,
+                query["parameters"],
+            )
+
+    def dump(self, directory: str) -> str:
+        """
+        Write the collapsed stacks and a JSON summary of the profile.
+
+        :param directory: Output directory.
+        :return: Path of the files, without extension.
+        """
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", self.path).strip("_") or "root"
+        timestamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started_at))
+        path = os.path.join(
+            directory,
+            f"{timestamp}-{self.method}-{slug}-{self.profile_id}",
+        )
+        with open(f"{path}.folded", "w", encoding="utf-8") as folded_file:
+            for stack, count in self.stacks.most_common():
+                folded_file.write(f"{stack} {count}\n")
+        with open(f"{path}.json", "w", encoding="utf-8") as summary_file:
+            json.dump(
+                {
+                    "id": self.profile_id,
+                    "method": self.method,
+                    "path": self.path,
+                    "status": self.status,
+                    "duration": round(self.duration, 6),
+                    "samples": sum(self.stacks.values()),
+                    "query_time": round(sum(q["duration"] for q in self.queries), 6),
+                    "queries": self.queries,
+                },
+                summary_file,
+                indent=2,
+            )
+        return path
+
+
+def _before_cursor_execute(conn, *_):
+    """
+    Time a query of a profiled request.
+    """
+    if CURRENT_PROFILE.get() is not None:
+        conn.info.setdefault("profiling_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, _cursor, statement, parameters, *_):
+    """
+    Record a query of a profiled request.
+    """
+    profile = CURRENT_PROFILE.get()
+    if profile is not None and conn.info.get("profiling_started_at"):
+        started_at = conn.info["profiling_started_at"].pop()
+        profile.record_query(statement, parameters, time.perf_counter() - started_at)
+
+
+def install_query_timing() -> None:
+    """
+    Time the queries of profiled requests on every engine.
+
+    Only called when profiling is enabled, so the listeners cost nothing
+    otherwise.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling sampled requests and requests with a valid
+    X-Profile-Token header.
+
+    Only added when profiling is enabled in the app config.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the ProfilingMiddleware.
+
+        :param app: Wrapped ASGI application.
+        """
+        self.app = app
+
+    @staticmethod
+    def _should_profile(scope: Scope) -> bool:
+        """
+        Decide whether to profile a request.
+
+        :param scope: ASGI scope.
+        :return: True if the request is sampled or carries a valid token.
+        """
+        token = Headers(scope=scope).get(PROFILE_HEADER)
+        if token is not None:
+            return is_valid_profile_token(token)
+        return random.random() < app_config.profiling_sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Serve a request, profiling it if selected.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive channel.
+        :param send: ASGI send channel.
+        """
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            scope["method"],
+            scope["path"],
+            app_config.profiling_sample_interval,
+        )
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = CURRENT_PROFILE.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            CURRENT_PROFILE.reset(token)
+            profile.stop()
+            path = await anyio.to_thread.run_sync(
+                profile.dump,
+                app_config.profiling_dir,
+            )
+            logger.info(
+                "Profiled %s %s in %.1fms with %d queries: %s",
+                profile.method,
+                profile.path,
+                profile.duration * 1000,
+                len(profile.queries),
+                path,
+            )
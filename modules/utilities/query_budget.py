@@ -0,0 +1,206 @@
+"""
+Per-request SQL statement counting and query budgets
+"""
+
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+Endpoint = TypeVar("Endpoint", bound=Callable)
+
+CURRENT_QUERIES: ContextVar[Optional["QueryStats"]] = ContextVar(
+    "current_queries",
+    default=None,
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a request runs more SQL statements than its route allows and
+    budgets are enforced.
+    """
+
+
+class QueryStats:
+    """
+    SQL statements run while serving a request, and their total duration.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the QueryStats.
+        """
+        self.count = 0
+        self.duration = 0.0
+
+    def record(self, duration: float) -> None:
+        """
+        Record a statement.
+
+        :param duration: Seconds the statement took.
+        """
+        self.count += 1
+        self.duration += duration
+
+
+def query_budget(max_queries: int) -> Callable[[Endpoint], Endpoint]:
+    """
+    Declare the most SQL statements a route may run per request.
+
+    Apply it below the router decorator, so the route registers the
+    annotated endpoint:
+
+        @router.get("/users/{user_id}/badges/")
+        @query_budget(1)
+        def get_badges(...):
+
+    :param max_queries: Statements allowed per request.
+    :return: Decorator annotating the endpoint.
+    """
+
+    def annotate(endpoint: Endpoint) -> Endpoint:
+        endpoint.query_budget = max_queries
+        return endpoint
+
+    return annotate
+
+
+def _before_cursor_execute(conn, *_):
+    """
+    Time a statement of a counted request.
+    """
+    if CURRENT_QUERIES.get() is not None:
+        conn.info.setdefault("query_budget_started_at", []).append(
+            time.perf_counter(),
+        )
+
+
+def _after_cursor_execute(conn, *_):
+    """
+    Count a statement of a counted request.
+    """
+    stats = CURRENT_QUERIES.get()
+    if stats is not None and conn.info.get("query_budget_started_at"):
+        started_at = conn.info["query_budget_started_at"].pop()
+        stats.record(time.perf_counter() - started_at)
+
+
+def install_query_counting() -> None:
+    """
+    Count the statements of requests on every engine.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware counting the SQL statements of each request and checking
+    them against the budget declared by its route with query_budget.
+
+    Statements and their total duration are added up per endpoint in the
+    db_statements_total and db_seconds_total metrics. Requests over budget are
+    logged as a warning and counted in the query_budget_exceeded_total metric.
+    When budgets are enforced, as they are in the tests, they also fail with
+    QueryBudgetExceeded before their response starts.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Initialize the QueryBudgetMiddleware.
+
+        :param app: Wrapped ASGI application.
+        """
+        self.app = app
+
+    @staticmethod
+    def _over_budget(scope: Scope, stats: QueryStats) -> Optional[str]:
+        """
+        Check a request's statements against its route's budget.
+
+        :param scope: ASGI scope, holding the matched endpoint.
+        :param stats: Statements of the request so far.
+        :return: Message describing the excess, None if within budget.
+        """
+        endpoint = scope.get("endpoint")
+        budget = getattr(endpoint, "query_budget", None)
+        if budget is None or stats.count <= budget:
+            return None
+        return (
+            f"{scope['method']} {scope['path']} ran {stats.count} SQL statements "
+            f"in {stats.duration * 1000:.1f}ms, over the budget of "
+            f"{endpoint.__name__}: {budget}"
+        )
+
+    def _enforce(self, scope: Scope, stats: QueryStats) -> None:
+        """
+        Fail a request over budget before its response starts, when budgets
+        are enforced.
+
+        :param scope: ASGI scope, holding the matched endpoint.
+        :param stats: Statements of the request so far.
+        :raises QueryBudgetExceeded: If over budget and budgets are enforced.
+        """
+        message = self._over_budget(scope, stats)
+        if message is not None and app_config.query_budget_enforced:
+            raise QueryBudgetExceeded(message)
+
+    def _record(self, scope: Scope, stats: QueryStats) -> None:
+        """
+        Record a served request's statements, logging any excess.
+
+        :param scope: ASGI scope, holding the matched endpoint.
+        :param stats: Statements of the request.
+        """
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return
+        name = endpoint.__name__
+        METRICS.increment("db_statements_total", stats.count, endpoint=name)
+        METRICS.increment("db_seconds_total", stats.duration, endpoint=name)
+
+        message = self._over_budget(scope, stats)
+        if message is not None:
+            METRICS.increment("query_budget_exceeded_total", endpoint=name)
+            logger.warning(message)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Serve a request, counting its statements.
+
+        The budget is enforced when the response starts, so the request can
+        still fail with a 500. Statements run while a response streams are
+        only logged.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive channel.
+        :param send: ASGI send channel.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+
+        async def send_within_budget(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                self._enforce(scope, stats)
+            await send(message)
+
+        token = CURRENT_QUERIES.set(stats)
+        try:
+            await self.app(scope, receive, send_within_budget)
+        finally:
+            CURRENT_QUERIES.reset(token)
+        self._record(scope, stats)
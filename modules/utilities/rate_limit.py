@@ -0,0 +1,155 @@
+"""
+Per-customer rate limiting
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import redis
+from fastapi import HTTPException, status
+
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Refills the bucket for the time elapsed since the last request and takes a
+# token from it. Returns whether the request is allowed and, if not, the
+# seconds until a token is available. Uses the Redis clock so that every API
+# process shares the same notion of time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RateLimiter:
+    """
+    Per-customer token bucket rate limiter.
+
+    Buckets live in Redis and are updated atomically by a Lua script. Once a
+    customer is limited, the process remembers until when, so a flood of
+    requests is rejected locally without a Redis round trip per request.
+    """
+
+    def __init__(
+        self,
+        cache: redis.Redis,
+        default_rate: float,
+        default_burst: int,
+        enabled: bool = True,
+    ) -> None:
+        """
+        Initialize the RateLimiter.
+
+        :param cache: Redis client.
+        :param default_rate: Requests per second for customers without a limit.
+        :param default_burst: Bucket size for customers without a burst.
+        :param enabled: Whether requests are rate limited.
+        """
+        self.cache = cache
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.enabled = enabled
+        self.script = cache.register_script(TOKEN_BUCKET_SCRIPT)
+        self._limited_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _retry_after(self, customer_alias: str) -> Optional[float]:
+        """
+        Check the local record of limited customers.
+
+        :param customer_alias: Customer alias.
+        :return: Seconds until the customer may retry, None if not limited.
+        """
+        with self._lock:
+            limited_until = self._limited_until.get(customer_alias)
+            if limited_until is None:
+                return None
+            remaining = limited_until - time.monotonic()
+            if remaining <= 0:
+                del self._limited_until[customer_alias]
+                return None
+            return remaining
+
+    def _take_token(self, customer_alias: str, rate: float, burst: int) -> float:
+        """
+        Take a token from the customer's bucket in Redis.
+
+        :param customer_alias: Customer alias.
+        :param rate: Requests per second.
+        :param burst: Bucket size.
+        :return: 0 if allowed, else seconds until a token is available.
+        """
+        try:
+            allowed, retry_after = self.script(
+                keys=[f"rate_limit:{customer_alias}"],
+                args=[rate, burst],
+            )
+        except redis.RedisError as redis_error:
+            logger.warning("Rate limiter unavailable: %s", redis_error)
+            return 0
+        if allowed:
+            return 0
+
+        retry_after = float(retry_after)
+        with self._lock:
+            self._limited_until[customer_alias] = time.monotonic() + retry_after
+        return retry_after
+
+    def check(self, customer_alias: str, customer_info: Dict[str, Any]) -> None:
+        """
+        Count a request against the customer's limit.
+
+        :param customer_alias: Customer alias.
+        :param customer_info: Customer configuration.
+        :raises HTTPException: If the customer exceeded its limit.
+        """
+        if not self.enabled:
+            return
+
+        retry_after = self._retry_after(customer_alias)
+        if retry_after is None:
+            retry_after = self._take_token(
+                customer_alias,
+                customer_info.get("rate_limit") or self.default_rate,
+                customer_info.get("rate_burst") or self.default_burst,
+            )
+        if not retry_after:
+            return
+
+        METRICS.increment("rate_limited_requests_total", customer=customer_alias)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+RATE_LIMITER = RateLimiter(
+    cache=REQUEST_REDIS_CLIENT,
+    default_rate=app_config.rate_limit,
+    default_burst=app_config.rate_burst,
+    enabled=app_config.rate_limit_enabled,
+)
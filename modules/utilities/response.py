@@ -1,4 +1,9 @@
 """Potential responses from path operations"""
+from contextlib import contextmanager
+from typing import Iterator
+
+from fastapi import HTTPException, status
+
 from modules.database.schemas import message_schemas
 
 base_responses = {
@@ -6,5 +11,27 @@ base_responses = {
     401: {"model": message_schemas.Message, "description": "Unauthorized"},
     403: {"model": message_schemas.Message, "description": "Forbidden"},
     404: {"model": message_schemas.Message, "description": "Resource Not Found"},
+    429: {"model": message_schemas.Message, "description": "Too Many Requests"},
     500: {"model": message_schemas.Message, "description": "Internal Server Error"},
 }
+
+
+@contextmanager
+def internal_errors(action: str) -> Iterator[None]:
+    """
+    Answer unexpected errors of a path operation with a 500 response.
+
+    HTTPExceptions raised within are passed through.
+
+    :param action: What the operation does, completing "Unable to ...".
+    :raises HTTPException: 500 Internal Server Error on any other exception.
+    """
+    try:
+        yield
+    except HTTPException:
+        raise
+    except Exception as general_exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unable to {action}: {str(general_exception)}",
+        ) from general_exception
@@ -0,0 +1,92 @@
+"""
+Request body streaming helpers
+"""
+
+import codecs
+from typing import AsyncIterator, Iterable, Iterator, List
+
+import anyio.from_thread
+from fastapi import Request
+
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+class LineTooLongError(ValueError):
+    """
+    Raised when a line exceeds the maximum line length.
+    """
+
+
+def iter_request_chunks(request: Request) -> Iterator[bytes]:
+    """
+    Iterate over a request body from a threadpool endpoint.
+
+    Chunks are pulled from the event loop one at a time as they are consumed,
+    so the body is never buffered.
+
+    :param request: Incoming request.
+    :return: Body chunks.
+    """
+    stream: AsyncIterator[bytes] = request.stream()
+
+    async def next_chunk() -> bytes:
+        return await anext(stream)
+
+    while True:
+        try:
+            chunk = anyio.from_thread.run(next_chunk)
+        except StopAsyncIteration:
+            return
+        if chunk:
+            yield chunk
+
+
+def iter_decoded(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    """
+    Decode byte chunks incrementally.
+
+    :param chunks: Byte chunks.
+    :param encoding: Text encoding.
+    :return: Decoded text of each chunk, then of any trailing bytes.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_text_lines(
+    chunks: Iterable[bytes],
+    encoding: str = "utf-8-sig",
+    max_line_length: int = MAX_LINE_LENGTH,
+) -> Iterator[str]:
+    """
+    Decode byte chunks into lines, keeping line endings.
+
+    Multi-byte characters and lines split across chunks are reassembled. The
+    pieces of a line are joined once it is complete, so long lines cost linear
+    time. The lines can be fed to csv.reader, which joins the lines of quoted
+    fields.
+
+    :param chunks: Byte chunks.
+    :param encoding: Text encoding, a leading BOM is skipped by default.
+    :param max_line_length: Characters a line may have, its ending excluded.
+    :return: Lines.
+    :raises LineTooLongError: If a line is longer than max_line_length.
+    """
+    pieces: List[str] = []
+    length = 0
+    for text in iter_decoded(chunks, encoding):
+        for index, piece in enumerate(text.split("\n")):
+            if index:
+                yield "".join(pieces) + "\n"
+                pieces, length = [], 0
+            length += len(piece)
+            if length > max_line_length:
+                raise LineTooLongError(
+                    f"Lines must not exceed {max_line_length} characters"
+                )
+            pieces.append(piece)
+    tail = "".join(pieces)
+    if tail:
+        yield tail
@@ -2,6 +2,7 @@
 import csv
 import uuid
 
+from modules.actions.customer import parse_badge_names
 from modules.database.models import Badge, User
 from modules.utilities.database import SessionLocal
 
@@ -20,16 +21,11 @@ def seed_user_and_badge_tables_from_csv():
         csv_reader = csv.DictReader(file)
         for row in csv_reader:
             customer_id = row["customer_id"]
-            status = row["status"]
 
             # Generate a new UUID for the user
             user_id = uuid.uuid4()
 
-            badge_names = [
-                badge
-                for badge in row.values()
-                if badge and badge != customer_id and badge != status
-            ]
+            badge_names = parse_badge_names(row)
 
             # Check if the user already exists in the database
             user = session.query(User).filter(User.id == user_id).first()
@@ -1,4 +1,5 @@
 """Conftest file"""
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from unittest.mock import patch
 from uuid import uuid4
@@ -7,10 +8,13 @@ import jwt
 import pytest
 from fastapi.testclient import TestClient
 from pytest_mock import MockerFixture
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from main import app
 from modules.database.models import Badge, User
 from modules.utilities.auth import SECRET_KEY
+from modules.utilities.config import app_config
 from modules.utilities.database import SessionLocal
 
 
@@ -22,6 +26,45 @@ def client():
     return TestClient(app=app)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def enforce_query_budgets():
+    """
+    Fail requests running more SQL statements than their route's budget.
+    """
+    app_config.query_budget_enforced = True
+    yield
+    app_config.query_budget_enforced = False
+
+
+@pytest.fixture
+def assert_query_count():
+    """
+    Assert the exact number of SQL statements run within a block.
+
+        with assert_query_count(2):
+            client.get(...)
+    """
+
+    @contextmanager
+    def count_queries(expected: int):
+        statements = []
+
+        def record(_conn, _cursor, statement, *_):
+            statements.append(statement)
+
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+        assert len(statements) == expected, "\n\n".join(
+            [f"Expected {expected} SQL statements, got {len(statements)}:"]
+            + statements,
+        )
+
+    return count_queries
+
+
 @pytest.fixture
 def mock_get():
     """Mock get request"""
@@ -102,6 +145,16 @@ def mock_delete_badge_user(db_session):
     return mock_user
 
 
+@pytest.fixture
+# pylint: disable=W0621
+def mock_badgeless_user(db_session):
+    """Create mock user without badges for the token's customer"""
+    mock_user = User(id=uuid4(), customer_id="xbahn")
+    db_session.add(mock_user)
+    db_session.commit()
+    return mock_user
+
+
 @pytest.fixture
 def generate_mock_token():
     """Generate test token"""
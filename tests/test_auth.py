@@ -2,8 +2,14 @@
 Tests for user badges endpoints.
 
 """
+import time
+
+import jwt
 from fastapi import HTTPException, status
 
+from modules.utilities.auth import CUSTOMER_CONFIG, SECRET_KEY
+from modules.utilities.config import app_config
+
 
 def test_generate_token_valid_customer(client):
     """
@@ -48,3 +54,39 @@ def test_generate_token_inactive_customer(client, mock_generate_jwt_token):
     print(response.status_code)
     assert response.status_code == status.HTTP_402_PAYMENT_REQUIRED
     assert response.json() == {"detail": "Payment required"}
+
+
+def test_self_contained_token_skips_lookup_while_generation_is_current(
+    client,
+    monkeypatch,
+    mocker,
+):
+    """
+    Test self-contained tokens are trusted until the configurations change.
+    """
+    monkeypatch.setattr(app_config, "self_contained_tokens", True)
+    monkeypatch.setattr(CUSTOMER_CONFIG, "generation", 1)
+    monkeypatch.setattr(CUSTOMER_CONFIG, "refreshed_at", time.time())
+    token = client.post("/generate_token", json={"customer_alias": "bbg"}).json()
+    payload = jwt.decode(token["token"], SECRET_KEY, algorithms=["HS256"])
+    assert payload["status"] == "active"
+    assert payload["generation"] == 1
+
+    lookup = mocker.patch.object(
+        CUSTOMER_CONFIG,
+        "get_customer_config",
+        return_value={"customer_id": "bbg", "status": "suspended"},
+    )
+    headers = {"Authorization": f"Bearer {token['token']}"}
+    response = client.get("/users/by_customer", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    lookup.assert_not_called()
+
+    monkeypatch.setattr(CUSTOMER_CONFIG, "generation", 2)
+    response = client.get("/users/by_customer", headers=headers)
+    assert response.status_code == status.HTTP_402_PAYMENT_REQUIRED
+
+    monkeypatch.setattr(CUSTOMER_CONFIG, "generation", 1)
+    monkeypatch.setattr(CUSTOMER_CONFIG, "refreshed_at", time.time() - 3600)
+    response = client.get("/users/by_customer", headers=headers)
+    assert response.status_code == status.HTTP_402_PAYMENT_REQUIRED
@@ -0,0 +1,134 @@
+"""
+Tests for the badge change event stream.
+"""
+
+import asyncio
+import json
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException, status
+from sqlalchemy import update
+
+from modules.actions.badge_changes import (
+    ensure_changes_retained,
+    get_badge_changes,
+    get_last_sequence,
+    prune_badge_changes,
+    record_badge_changes,
+)
+from modules.actions.badge_stream import (
+    BadgeEventHub,
+    BadgeListener,
+    _catch_up,
+    stream_badge_events,
+)
+from modules.database.models import BadgeChange
+from modules.database.schemas.user_schemas import BadgeChangeSchema
+from modules.utilities.cache import REDIS_CLIENT
+from modules.utilities.config import app_config
+from modules.utilities.database import SessionLocal
+
+
+def record_change(user, operation):
+    """Record a change of the user's badges in its own transaction"""
+    with SessionLocal() as db_session:
+        record_badge_changes(user.customer_id, [user.id], db_session, operation)
+        db_session.commit()
+
+
+def parse_event(event):
+    """Parse a server-sent event into its fields"""
+    fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+    return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+
+def test_stream_resumes_then_follows_published_changes(mock_badgeless_user):
+    """
+    Test a resumed stream replays missed changes before live ones.
+    """
+    record_change(mock_badgeless_user, "add")
+
+    async def follow():
+        hub = BadgeEventHub(REDIS_CLIENT, app_config.badge_events_channel, 10)
+        with SessionLocal() as db_session:
+            last_sequence = get_last_sequence("xbahn", db_session)
+        stream = stream_badge_events("xbahn", last_sequence - 1, hub, heartbeat=60)
+        try:
+            assert (await stream.__anext__()).startswith("retry:")
+            replayed = await asyncio.wait_for(stream.__anext__(), 5)
+            await asyncio.to_thread(record_change, mock_badgeless_user, "delete")
+            live = await asyncio.wait_for(stream.__anext__(), 5)
+        finally:
+            await stream.aclose()
+            await hub.close()
+        return last_sequence, parse_event(replayed), parse_event(live)
+
+    last_sequence, replayed, live = asyncio.run(follow())
+
+    assert replayed[:2] == (last_sequence, "add")
+    assert live[:2] == (last_sequence + 1, "delete")
+    assert live[2]["user_id"] == str(mock_badgeless_user.id)
+    assert live[2]["badge_names"] == []
+
+
+def test_full_listener_asks_to_catch_up():
+    """
+    Test a slow stream drops buffered changes for a catch-up marker.
+    """
+    listener = BadgeListener("xbahn", queue_size=2)
+    for sequence in range(1, 4):
+        listener.put(
+            BadgeChangeSchema(sequence=sequence, user_id=uuid4(), badge_names=[]),
+        )
+
+    assert listener.queue.qsize() == 1
+    assert listener.queue.get_nowait() is None
+
+
+def test_catch_up_reads_one_page_at_a_time(mocker, mock_badgeless_user):
+    """
+    Test missed changes are read page by page up to the live change.
+    """
+    mocker.patch("modules.actions.badge_stream.MAX_BADGE_CHANGES", 1)
+    for operation in ("add", "delete", "add"):
+        record_change(mock_badgeless_user, operation)
+    with SessionLocal() as db_session:
+        last_sequence = get_last_sequence("xbahn", db_session)
+
+    async def read_pages():
+        pages = _catch_up("xbahn", last_sequence - 3, last_sequence - 1)
+        return [[change.sequence for change in page] async for page in pages]
+
+    assert asyncio.run(read_pages()) == [[last_sequence - 2], [last_sequence - 1]]
+
+
+def test_pruned_changes_are_gone():
+    """
+    Test changes older than the retention are pruned, all but the last, and
+    clients asking for them are told to reload.
+    """
+    customer_alias = f"pruned_{uuid4().hex}"
+    with SessionLocal() as db_session:
+        record_badge_changes(customer_alias, [uuid4(), uuid4()], db_session, "add")
+        db_session.commit()
+        db_session.execute(
+            update(BadgeChange)
+            .where(BadgeChange.customer_id == customer_alias)
+            .values(created_at=datetime(2000, 1, 1))
+        )
+        db_session.commit()
+
+        prune_badge_changes(10 * 365 * 86400, db_session)
+
+        page = get_badge_changes(customer_alias, 1, 10, db_session)
+        assert page.last_sequence == 2
+        assert len(page.changes) == 1
+        ensure_changes_retained(customer_alias, 1, db_session)
+        with pytest.raises(HTTPException) as gone:
+            get_badge_changes(customer_alias, 0, 10, db_session)
+        assert gone.value.status_code == status.HTTP_410_GONE
+        with pytest.raises(HTTPException) as gone:
+            ensure_changes_retained(customer_alias, 0, db_session)
+        assert gone.value.status_code == status.HTTP_410_GONE
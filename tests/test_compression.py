@@ -0,0 +1,102 @@
+"""
+Tests for response compression.
+"""
+
+import zstandard
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from modules.utilities.compression import CompressionMiddleware, negotiate_encoding
+
+BODY = b'{"badges": "' + b"PAID," * 1000 + b'"}'
+
+
+def create_app():
+    """Create an app behind the compression middleware"""
+    app = FastAPI()
+
+    @app.get("/listing")
+    def listing():
+        return Response(BODY, media_type="application/json", headers={"ETag": '"1"'})
+
+    @app.get("/small")
+    def small():
+        return Response(b"{}", media_type="application/json")
+
+    @app.get("/not_modified")
+    def not_modified():
+        return Response(status_code=304, headers={"ETag": '"1"'})
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BODY, BODY]), media_type="text/event-stream")
+
+    return CompressionMiddleware(app, min_size=100)
+
+
+def test_negotiate_encoding():
+    """
+    Test the most accepted coding wins, ties going to the server's preference.
+    """
+    available = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, br", available) == "br"
+    assert negotiate_encoding("gzip;q=1, br;q=0.5", available) == "gzip"
+    assert negotiate_encoding("*;q=0.1, gzip;q=0", available) == "zstd"
+    assert negotiate_encoding("*;q=0.5, zstd;q=0, br;q=0", available) == "gzip"
+    assert negotiate_encoding("identity", available) is None
+    assert negotiate_encoding(None, available) is None
+
+
+def test_compressed_once_per_etag():
+    """
+    Test ETag responses are compressed once, in the negotiated coding.
+    """
+    middleware = create_app()
+    client = TestClient(middleware)
+
+    for _ in range(2):
+        response = client.get("/listing", headers={"Accept-Encoding": "br"})
+        assert response.headers["Content-Encoding"] == "br"
+        assert response.headers["ETag"] == 'W/"1"'
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert response.content == BODY
+    assert list(middleware.cache) == [("/listing", '"1"', "br")]
+
+    response = client.get("/listing", headers={"Accept-Encoding": "zstd, br;q=0.9"})
+    decompressor = zstandard.ZstdDecompressor()
+    assert decompressor.decompressobj().decompress(response.content) == BODY
+    assert len(middleware.cache) == 2
+
+
+def test_small_and_streamed_responses_pass_through():
+    """
+    Test bodies under the threshold and streamed bodies are left as is.
+    """
+    client = TestClient(create_app())
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    stream = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in small.headers
+    assert "Content-Encoding" not in stream.headers
+    assert stream.content == BODY * 2
+
+
+def test_validators_match_whether_compressed_or_not():
+    """
+    Test compressible and 304 responses vary by Accept-Encoding and carry the
+    same weak ETag, compressed or not.
+    """
+    client = TestClient(create_app())
+
+    compressed = client.get("/listing", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/listing", headers={"Accept-Encoding": "identity"})
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    not_modified = client.get("/not_modified", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in identity.headers
+    for response in (compressed, identity, small, not_modified):
+        assert response.headers["Vary"] == "Accept-Encoding"
+    for response in (compressed, identity, not_modified):
+        assert response.headers["ETag"] == 'W/"1"'
@@ -0,0 +1,234 @@
+"""
+Tests for customer configuration backends.
+"""
+# pylint: disable=protected-access
+
+from uuid import uuid4
+
+import pytest
+import redis
+from fastapi import HTTPException, status
+
+from modules.actions.customer import GENERATION_GRACE, CustomerConfig
+from modules.actions.customer_backends import (
+    InMemoryConfigBackend,
+    MmapConfigBackend,
+    SharedMemoryConfigBackend,
+    create_config_backend,
+)
+from modules.actions.customer_snapshot import CustomerSnapshot, encode_snapshot
+from modules.utilities.circuit_breaker import CircuitBreaker
+from modules.utilities.host_lock import HostLock
+from modules.utilities.metrics import METRICS
+
+
+def test_memory_backend_loads_without_refresh_task():
+    """
+    Test the in-memory backend serves customers.csv without Redis.
+    """
+    customer_config = CustomerConfig(backend=InMemoryConfigBackend())
+
+    assert customer_config.get_customer_config("xbahn")["status"] == "active"
+    with pytest.raises(HTTPException) as exc_info:
+        customer_config.get_customer_config("unknown")
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_memory_backend_swaps_snapshot():
+    """
+    Test a publication replaces the whole snapshot.
+    """
+    backend = InMemoryConfigBackend()
+    backend.publish({"a": {"customer_id": "a"}})
+    backend.publish({"b": {"customer_id": "b"}})
+
+    assert backend.get("a") is None
+    assert backend.get("b") == {"customer_id": "b"}
+
+
+def test_mmap_backend_is_shared_between_processes(tmp_path):
+    """
+    Test a snapshot published by one backend is read by another.
+    """
+    path = str(tmp_path / "customers.snapshot")
+    publisher, reader = MmapConfigBackend(path), MmapConfigBackend(path)
+    customers = {
+        f"customer{index}": {"customer_id": f"customer{index}", "badges": ["b"]}
+        for index in range(50)
+    }
+
+    publisher.publish(customers)
+    assert reader.get("customer7") is None
+    reader.reload()
+
+    assert all(reader.get(alias) == info for alias, info in customers.items())
+    assert reader.get("customer") is None
+
+    publisher.publish({"other": {"customer_id": "other"}})
+    reader.reload()
+    assert reader.get("customer7") is None
+    assert reader.get("other") == {"customer_id": "other"}
+
+
+def test_shared_memory_backend_swaps_by_generation():
+    """
+    Test readers attach newer shared memory snapshots only.
+    """
+    name = f"test_{uuid4().hex[:12]}"
+    publisher, reader = SharedMemoryConfigBackend(name), SharedMemoryConfigBackend(name)
+    try:
+        publisher.publish({"a": {"customer_id": "a"}})
+        reader.reload()
+        generation = reader.generation
+        assert reader.get("a") == {"customer_id": "a"}
+
+        publisher.publish({"a": {"customer_id": "a"}})
+        reader.reload()
+        assert reader.generation == generation
+
+        for alias in ("b", "c", "d"):
+            publisher.publish({alias: {"customer_id": alias}})
+        reader.reload()
+        assert reader.generation > generation
+        assert reader.get("a") is None
+        assert reader.get("d") == {"customer_id": "d"}
+    finally:
+        for segment in publisher._published:
+            segment.unlink()
+        publisher._control().unlink()
+
+
+def test_snapshot_lookup_reuses_decoded_configuration():
+    """
+    Test repeated lookups return the configuration decoded the first time.
+    """
+    customers = {alias: {"customer_id": alias} for alias in ("x", "yy", "zzz", "é")}
+    snapshot = CustomerSnapshot(encode_snapshot(customers, generation=1))
+
+    assert all(snapshot.get(alias) == info for alias, info in customers.items())
+    assert snapshot.get("yy") is snapshot.get("yy")
+    assert snapshot.get("y") is None
+    snapshot.close()
+
+
+def test_unknown_backend_is_rejected():
+    """
+    Test an unknown backend name raises a ValueError.
+    """
+    with pytest.raises(ValueError):
+        create_config_backend("memcached")
+
+
+def test_unknown_aliases_are_rejected_without_backend_lookup(mocker):
+    """
+    Test aliases missing from the loaded configurations never reach the backend.
+    """
+    customer_config = CustomerConfig(backend=InMemoryConfigBackend())
+    lookup = mocker.spy(customer_config.backend, "get")
+
+    with pytest.raises(HTTPException) as exc_info:
+        customer_config.get_customer_config("unknown")
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+    lookup.assert_not_called()
+    assert customer_config.get_customer_config("xbahn")["status"] == "active"
+
+
+def test_backend_misses_are_cached_until_refresh(mocker):
+    """
+    Test a shared backend is asked once about an unknown alias.
+    """
+    backend = mocker.Mock(shared=True)
+    backend.get.return_value = None
+    customer_config = CustomerConfig(backend=backend)
+
+    for _ in range(3):
+        with pytest.raises(HTTPException):
+            customer_config.get_customer_config("unknown")
+    backend.get.assert_called_once_with("unknown")
+
+    customer_config._refresh_config()
+    backend.get.return_value = {"customer_id": "unknown"}
+    with pytest.raises(HTTPException):
+        customer_config.get_customer_config("unknown")
+    assert customer_config.is_known_alias("xbahn")
+
+
+def test_only_host_lock_holder_publishes(mocker, tmp_path):
+    """
+    Test one process per host publishes to a shared backend, the others reload.
+    """
+    path = str(tmp_path / "host.lock")
+    leader_lock, follower_lock = HostLock(path), HostLock(path)
+    leader = CustomerConfig(backend=mocker.Mock(shared=True), host_lock=leader_lock)
+    follower = CustomerConfig(
+        backend=mocker.Mock(shared=True),
+        host_lock=follower_lock,
+    )
+
+    leader._refresh_config()
+    follower._refresh_config()
+    leader.backend.publish.assert_called_once()
+    follower.backend.publish.assert_not_called()
+    follower.backend.reload.assert_called_once()
+    assert follower.is_known_alias("xbahn")
+
+    leader_lock.release()
+    follower._refresh_config()
+    follower.backend.publish.assert_called_once()
+    follower_lock.release()
+
+
+def test_open_circuit_serves_last_known_good_configs(mocker):
+    """
+    Test Redis failures open the circuit and lookups fall back to customers.csv.
+    """
+    backend = mocker.Mock(shared=True)
+    backend.get.side_effect = redis.TimeoutError("Timeout reading from socket")
+    breaker = CircuitBreaker("test_customer_config", failure_threshold=2)
+    customer_config = CustomerConfig(backend=backend, breaker=breaker)
+    customer_config._refresh_config()
+
+    for _ in range(3):
+        assert customer_config.get_customer_config("xbahn")["status"] == "active"
+    assert breaker.state == "open"
+    assert backend.get.call_count == 2
+    assert 'circuit_breaker_state{breaker="test_customer_config"} 1' in (
+        METRICS.render()
+    )
+    with pytest.raises(HTTPException) as exc_info:
+        customer_config.get_customer_config("unknown")
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_circuit_closes_after_successful_trial(mocker):
+    """
+    Test the circuit lets a trial lookup through after its reset timeout.
+    """
+    backend = mocker.Mock(shared=True)
+    backend.get.side_effect = [redis.ConnectionError(), {"customer_id": "xbahn"}]
+    breaker = CircuitBreaker("test_trial", failure_threshold=1, reset_timeout=0)
+    customer_config = CustomerConfig(backend=backend, breaker=breaker)
+    customer_config._refresh_config()
+
+    assert customer_config.get_customer_config("xbahn")["status"] == "active"
+    assert breaker.state == "open"
+    assert customer_config.get_customer_config("xbahn") == {"customer_id": "xbahn"}
+    assert breaker.state == "closed"
+
+
+def test_generation_expires_after_one_missed_refresh():
+    """
+    Test claims stop being trusted once a refresh is later than the grace.
+    """
+    customer_config = CustomerConfig(backend=InMemoryConfigBackend())
+    customer_config._refresh_config()
+    refreshed_at = customer_config.refreshed_at
+
+    customer_config.refreshed_at = (
+        refreshed_at - customer_config.refresh_rate - GENERATION_GRACE + 1
+    )
+    assert customer_config.current_generation == customer_config.generation
+    customer_config.refreshed_at = (
+        refreshed_at - customer_config.refresh_rate - GENERATION_GRACE - 1
+    )
+    assert customer_config.current_generation is None
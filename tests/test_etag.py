@@ -0,0 +1,45 @@
+"""
+Tests for ETag helpers.
+"""
+
+import redis
+
+from modules.actions.listing_snapshots import DiskListingSnapshotStore, ListingSnapshots
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+from modules.utilities.etag import CustomerVersions, etag_matches
+
+
+def test_etag_matches():
+    """
+    Test If-None-Match parsing.
+    """
+    assert etag_matches('"bbg-1"', '"bbg-1"')
+    assert etag_matches('"bbg-0", W/"bbg-1"', '"bbg-1"')
+    assert etag_matches("*", '"bbg-1"')
+    assert not etag_matches('"bbg-0"', '"bbg-1"')
+    assert not etag_matches(None, '"bbg-1"')
+    assert not etag_matches('"bbg-1"', None)
+
+
+def test_failed_bump_withholds_etags(mocker, tmp_path):
+    """
+    Test a failed bump withholds ETags and snapshots until a bump succeeds.
+    """
+    versions = CustomerVersions(REQUEST_REDIS_CLIENT)
+    snapshots = ListingSnapshots(DiskListingSnapshotStore(str(tmp_path)), versions)
+    snapshots.build("xbahn")
+    mocker.patch.object(snapshots, "schedule_rebuild")
+    pipeline = mocker.patch.object(
+        versions.cache,
+        "pipeline",
+        side_effect=redis.ConnectionError,
+    )
+
+    assert not versions.bump("xbahn")
+    assert versions.etag("xbahn") is None
+    assert snapshots.serve("xbahn") is None
+
+    mocker.stop(pipeline)
+    before = versions.cache.get("customer_version:xbahn")
+    assert versions.etag("xbahn") is not None
+    assert int(versions.cache.get("customer_version:xbahn")) > int(before)
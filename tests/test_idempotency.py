@@ -0,0 +1,148 @@
+"""
+Tests for Idempotency-Key handling on badge endpoints.
+"""
+
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import jwt
+from fastapi import HTTPException, status
+
+from modules.database.models import User
+from modules.utilities.auth import SECRET_KEY
+from modules.utilities.rate_limit import RATE_LIMITER
+
+
+def test_retry_replays_first_response(
+    db_session,
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+):
+    """
+    Test a retried request is answered from the stored response.
+    """
+    headers = {"Authorization": generate_mock_token, "Idempotency-Key": str(uuid4())}
+    payload = {"badge_names": ["SPAMMER", "PAID"]}
+
+    first = client.post(
+        f"/users/{mock_badgeless_user.id}/badges/",
+        json=payload,
+        headers=headers,
+    )
+    retry = client.post(
+        f"/users/{mock_badgeless_user.id}/badges/",
+        json=payload,
+        headers=headers,
+    )
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    updated_user = db_session.query(User).get(
+        (mock_badgeless_user.customer_id, mock_badgeless_user.id),
+    )
+    db_session.refresh(updated_user)
+    assert len(updated_user.badges) == 2
+
+
+def test_key_reused_with_other_payload(
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+):
+    """
+    Test reusing a key for a different payload is rejected.
+    """
+    headers = {"Authorization": generate_mock_token, "Idempotency-Key": str(uuid4())}
+
+    client.post(
+        f"/users/{mock_badgeless_user.id}/badges/",
+        json={"badge_names": ["SPAMMER"]},
+        headers=headers,
+    )
+    response = client.post(
+        f"/users/{mock_badgeless_user.id}/badges/",
+        json={"badge_names": ["PAID"]},
+        headers=headers,
+    )
+
+    assert response.status_code == 422
+
+
+def test_retry_with_refreshed_token_replays(
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+):
+    """
+    Test keys are scoped to the customer, not to the token, and that a token
+    is still verified before a response is replayed.
+    """
+    key = str(uuid4())
+    path = f"/users/{mock_badgeless_user.id}/badges/"
+    payload = {"badge_names": ["PAID"]}
+    client.post(
+        path,
+        json=payload,
+        headers={"Authorization": generate_mock_token, "Idempotency-Key": key},
+    )
+
+    refreshed_token = jwt.encode(
+        {"customer_alias": "xbahn", "exp": datetime.utcnow() + timedelta(hours=1)},
+        SECRET_KEY,
+        algorithm="HS256",
+    )
+    retry = client.post(
+        path,
+        json=payload,
+        headers={"Authorization": f"Bearer {refreshed_token}", "Idempotency-Key": key},
+    )
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    expired_token = jwt.encode(
+        {"customer_alias": "xbahn", "exp": datetime.utcnow() - timedelta(minutes=1)},
+        SECRET_KEY,
+        algorithm="HS256",
+    )
+    expired = client.post(
+        path,
+        json=payload,
+        headers={"Authorization": f"Bearer {expired_token}", "Idempotency-Key": key},
+    )
+    assert expired.status_code == 401
+    assert "Idempotent-Replayed" not in expired.headers
+
+
+def test_rate_limited_request_is_not_replayed(
+    mocker,
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+):
+    """
+    Test a retry of a rate limited request runs again instead of replaying
+    the 429.
+    """
+    mocker.patch.object(
+        RATE_LIMITER,
+        "check",
+        side_effect=[
+            HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+            ),
+            None,
+        ],
+    )
+    headers = {"Authorization": generate_mock_token, "Idempotency-Key": str(uuid4())}
+    path = f"/users/{mock_badgeless_user.id}/badges/"
+
+    limited = client.post(path, json={"badge_names": ["PAID"]}, headers=headers)
+    retry = client.post(path, json={"badge_names": ["PAID"]}, headers=headers)
+
+    assert limited.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert retry.status_code == status.HTTP_200_OK
+    assert "Idempotent-Replayed" not in retry.headers
@@ -0,0 +1,128 @@
+"""
+Tests for background jobs.
+"""
+
+import time
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+
+from modules.actions.jobs import JOB_HANDLERS, JOB_QUEUE, JobQueue, job_handler
+from modules.database.schemas.job_schemas import JobStatus
+from modules.utilities.cache import REDIS_CLIENT
+
+
+@pytest.fixture(name="job_queue")
+def job_queue_fixture():
+    """Job queue on a stream of its own"""
+    stream = f"test_jobs:{uuid4()}"
+    yield JobQueue(
+        REDIS_CLIENT,
+        stream=stream,
+        max_attempts=2,
+        retry_backoff=0,
+        lease_timeout=60,
+        tenant_concurrency=1,
+        ttl=60,
+    )
+    REDIS_CLIENT.delete(stream, f"{stream}:delayed")
+
+
+@pytest.fixture(name="flaky_job")
+def flaky_job_fixture():
+    """Job type failing on its first attempts"""
+    calls, cleanups = [], []
+
+    def cleanup(job):
+        cleanups.append(job.id)
+
+    @job_handler("test_flaky", cleanup=cleanup)
+    def run(job, progress):
+        calls.append(job.attempts)
+        progress({"calls": len(calls)})
+        if len(calls) <= job.payload["failures"]:
+            raise RuntimeError("Temporary failure")
+        return {"calls": len(calls)}
+
+    yield calls, cleanups
+    del JOB_HANDLERS["test_flaky"]
+
+
+def test_failed_job_is_retried(job_queue, flaky_job):
+    """
+    Test a job failing once succeeds on its second attempt.
+    """
+    job = job_queue.enqueue("test_flaky", "xbahn", {"failures": 1})
+
+    assert job_queue.run_once("test", block=0.01) == 1
+    retried = job_queue.get(job.id)
+    assert retried.status == JobStatus.QUEUED
+    assert retried.error == "Temporary failure"
+
+    assert job_queue.run_once("test", block=0.01) == 1
+    finished = job_queue.get(job.id)
+    assert finished.status == JobStatus.SUCCEEDED
+    assert finished.attempts == 2
+    assert finished.result == finished.progress == {"calls": 2}
+    assert flaky_job[1] == [job.id]
+
+
+def test_job_fails_after_max_attempts(job_queue, flaky_job):
+    """
+    Test a job failing on every attempt is marked as failed.
+    """
+    job = job_queue.enqueue("test_flaky", "xbahn", {"failures": 5})
+
+    while job_queue.run_once("test", block=0.01):
+        pass
+
+    failed = job_queue.get(job.id)
+    assert failed.status == JobStatus.FAILED
+    assert failed.attempts == 2
+    assert flaky_job[0] == [0, 1]
+
+
+def test_customer_concurrency_is_limited(job_queue, flaky_job):
+    """
+    Test a job waits while its customer's slots are taken.
+    """
+    slots_key = job_queue._slots_key("xbahn")  # pylint: disable=protected-access
+    REDIS_CLIENT.zadd(slots_key, {"running": time.time() + 60})
+    waiting = job_queue.enqueue("test_flaky", "xbahn", {"failures": 0})
+
+    job_queue.run_once("test", block=0.01)
+
+    assert job_queue.get(waiting.id).status == JobStatus.QUEUED
+    assert not flaky_job[0]
+
+    REDIS_CLIENT.delete(slots_key)
+    time.sleep(1)
+    job_queue.run_once("test", block=0.01)
+    assert job_queue.get(waiting.id).status == JobStatus.SUCCEEDED
+
+
+def test_queue_user_import(client, generate_mock_token):
+    """
+    Test a queued import is run by a worker and its summary reported.
+    """
+    user_id = uuid4()
+    response = client.post(
+        "/jobs/user_import/",
+        content=f"user_id,badge1\n{user_id},SPAMMER\n".encode(),
+        headers={"Authorization": generate_mock_token, "Content-Type": "text/csv"},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.json()["id"]
+    assert "payload" not in response.json()
+
+    while JOB_QUEUE.get(job_id).status == JobStatus.QUEUED:
+        JOB_QUEUE.run_once("test", block=0.01)
+
+    response = client.get(
+        f"/jobs/{job_id}/",
+        headers={"Authorization": generate_mock_token},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == "succeeded"
+    assert response.json()["result"]["users_created"] == 1
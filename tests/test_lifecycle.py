@@ -0,0 +1,96 @@
+"""
+Tests for readiness and draining.
+"""
+
+import asyncio
+import time
+
+import pytest
+import redis
+from fastapi import status
+
+from modules.utilities.auth import CUSTOMER_CONFIG
+from modules.utilities.health import HEALTH_PROBES
+from modules.utilities.lifecycle import LIFECYCLE, Lifecycle
+
+
+@pytest.fixture(name="probed")
+def probed_fixture(monkeypatch):
+    """Run the dependency probes with freshly loaded customer configurations"""
+    monkeypatch.setattr(CUSTOMER_CONFIG, "refreshed_at", time.time())
+    HEALTH_PROBES.run_probes()
+
+
+@pytest.mark.usefixtures("probed")
+def test_readiness_follows_lifecycle(client, monkeypatch):
+    """
+    Test the readiness probe fails until started and once draining.
+    """
+    monkeypatch.setattr(LIFECYCLE, "started", False)
+    monkeypatch.setattr(LIFECYCLE, "draining", False)
+    assert client.get("/readyz").status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    LIFECYCLE.mark_started()
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_200_OK
+    assert "close" not in response.headers.get("connection", "")
+
+    LIFECYCLE.start_draining()
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json()["status"] == "draining"
+    assert response.headers["connection"] == "close"
+    assert client.get("/healthz").status_code == status.HTTP_200_OK
+
+
+def test_wait_for_requests_times_out():
+    """
+    Test waiting for in-flight requests is bounded by the timeout.
+    """
+    lifecycle = Lifecycle()
+    lifecycle.in_flight = 1
+
+    assert not asyncio.run(lifecycle.wait_for_requests(0.1))
+    lifecycle.in_flight = 0
+    assert asyncio.run(lifecycle.wait_for_requests(0.1))
+
+
+@pytest.mark.usefixtures("probed")
+def test_probes_report_dependencies(client, monkeypatch, mocker):
+    """
+    Test probe results are cached, failing Redis degrades the process and a
+    failing database makes it unready.
+    """
+    monkeypatch.setattr(LIFECYCLE, "started", True)
+    monkeypatch.setattr(LIFECYCLE, "draining", False)
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_200_OK
+    checks = response.json()["checks"]
+    assert checks["database"]["ok"] and checks["redis"]["ok"]
+    assert "checked_out" in checks["database"]["pool"]
+
+    mocker.patch.object(
+        HEALTH_PROBES.cache,
+        "ping",
+        side_effect=redis.ConnectionError("Connection refused"),
+    )
+    assert client.get("/readyz").json()["status"] == "ready"
+    HEALTH_PROBES.run_probes()
+
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == "degraded"
+    assert response.json()["degraded"] == ["redis"]
+    assert response.json()["checks"]["redis"]["error"] == "Connection refused"
+
+    mocker.patch.object(
+        HEALTH_PROBES,
+        "_probe_database",
+        side_effect=RuntimeError("Database is down"),
+    )
+    HEALTH_PROBES.run_probes()
+
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json()["status"] == "unavailable"
+    assert client.get("/healthz").status_code == status.HTTP_200_OK
@@ -0,0 +1,80 @@
+"""
+Tests for precomputed listing snapshots.
+"""
+
+import gzip
+import json
+
+from modules.actions.badge_events import badges_changed
+from modules.actions.listing_snapshots import (
+    LISTING_SNAPSHOTS,
+    DiskListingSnapshotStore,
+    ListingSnapshots,
+)
+from modules.utilities.etag import CUSTOMER_VERSIONS
+
+
+def test_listing_served_from_snapshot(
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+    mocker,
+    tmp_path,
+):
+    """
+    Test the listing is served from a current snapshot, gzipped on request.
+    """
+    headers = {"Authorization": generate_mock_token, "Accept-Encoding": "identity"}
+    live = client.get("/users/by_customer/", headers=headers)
+    store = DiskListingSnapshotStore(str(tmp_path))
+    snapshots = ListingSnapshots(store, CUSTOMER_VERSIONS)
+    snapshots.build("xbahn")
+    mocker.patch("modules.routers.user.LISTING_SNAPSHOTS", snapshots)
+
+    response = client.get("/users/by_customer/", headers=headers)
+    assert response.headers["ETag"] == live.headers["ETag"]
+    assert response.headers["X-Badge-Sequence"] == live.headers["X-Badge-Sequence"]
+    assert sorted(response.json(), key=lambda user: user["id"]) == sorted(
+        live.json(),
+        key=lambda user: user["id"],
+    )
+    assert str(mock_badgeless_user.id) in response.text
+
+    snapshot = snapshots.load("xbahn")
+    served = snapshots.serve("xbahn", accept_encoding="gzip, br;q=0.5")
+    assert served.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(served.body)) == json.loads(snapshot.body)
+
+    not_modified = client.get(
+        "/users/by_customer/",
+        headers={**headers, "If-None-Match": live.headers["ETag"]},
+    )
+    assert not_modified.status_code == 304
+
+
+def test_outdated_snapshot_within_staleness_bound(tmp_path, mocker):
+    """
+    Test an outdated snapshot is rebuilt, and only served while young enough.
+    """
+    store = DiskListingSnapshotStore(str(tmp_path))
+    strict = ListingSnapshots(store, CUSTOMER_VERSIONS, max_age=0)
+    lenient = ListingSnapshots(store, CUSTOMER_VERSIONS, max_age=60)
+    strict.build("xbahn")
+    CUSTOMER_VERSIONS.bump("xbahn")
+    schedule_rebuild = mocker.patch.object(strict, "schedule_rebuild")
+
+    assert strict.serve("xbahn") is None
+    schedule_rebuild.assert_called_once_with("xbahn")
+    assert lenient.serve("xbahn").status_code == 200
+    lenient.stop()
+
+
+def test_badge_changes_schedule_rebuild(mocker, mock_badgeless_user):
+    """
+    Test committed badge changes schedule the rebuild of the customer's snapshot.
+    """
+    schedule_rebuild = mocker.patch.object(LISTING_SNAPSHOTS, "schedule_rebuild")
+
+    badges_changed("xbahn", iter([mock_badgeless_user.id]))
+
+    schedule_rebuild.assert_called_once_with("xbahn")
@@ -0,0 +1,85 @@
+"""
+Tests for per-request profiling.
+"""
+
+import json
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from modules.utilities.config import app_config
+from modules.utilities.database import SessionLocal
+from modules.utilities.profiling import (
+    PROFILE_HEADER,
+    ProfilingMiddleware,
+    bind_shape,
+    install_query_timing,
+    profile_token,
+)
+
+profiled_app = FastAPI()
+profiled_app.add_middleware(ProfilingMiddleware)
+
+
+@profiled_app.get("/work/{value}")
+def work(value: int):
+    """Run a query and some Python code"""
+    with SessionLocal() as session:
+        result = session.execute(text("SELECT :value"), {"value": value}).scalar()
+    time.sleep(0.05)
+    return {"result": result}
+
+
+def test_signed_requests_are_profiled(tmp_path, monkeypatch, caplog):
+    """
+    Test only requests with a valid token are profiled when sampling is off.
+    """
+    monkeypatch.setattr(app_config, "profiling_dir", str(tmp_path))
+    monkeypatch.setattr(app_config, "profiling_sample_rate", 0)
+    monkeypatch.setattr(app_config, "slow_query_threshold", 0)
+    install_query_timing()
+    client = TestClient(profiled_app)
+
+    response = client.get("/work/1")
+    assert "x-profile-id" not in response.headers
+    expired = client.get("/work/1", headers={PROFILE_HEADER: profile_token(-10)})
+    assert "x-profile-id" not in expired.headers
+    forged = client.get("/work/1", headers={PROFILE_HEADER: f"{2**40}.forged"})
+    assert "x-profile-id" not in forged.headers
+    assert not list(tmp_path.iterdir())
+
+    response = client.get("/work/7", headers={PROFILE_HEADER: profile_token(60)})
+    assert response.json() == {"result": 7}
+    profile_id = response.headers["x-profile-id"]
+    (summary_path,) = tmp_path.glob(f"*-{profile_id}.json")
+    summary = json.loads(summary_path.read_text())
+    assert summary["status"] == 200
+    assert summary["queries"][0]["statement"] == "SELECT %(value)s"
+    assert summary["queries"][0]["parameters"] == {"value": "int"}
+    assert "Slow query in GET /work/7" in caplog.text
+    folded = summary_path.with_suffix(".folded").read_text()
+    assert "test_profiling.work" in folded
+
+
+def test_sampled_requests_are_profiled(tmp_path, monkeypatch):
+    """
+    Test the sample rate profiles requests without a token.
+    """
+    monkeypatch.setattr(app_config, "profiling_dir", str(tmp_path))
+    monkeypatch.setattr(app_config, "profiling_sample_rate", 1)
+
+    response = TestClient(profiled_app).get("/work/2")
+    assert "x-profile-id" in response.headers
+
+
+def test_bind_shape_hides_values():
+    """
+    Test bind shapes describe parameters without their values.
+    """
+    assert bind_shape({"alias": "secret", "ids": [1, 2, 3]}) == {
+        "alias": "str",
+        "ids": "list[3]",
+    }
+    assert bind_shape([{"id": 1}, {"id": 2}]) == [2, {"id": "int"}]
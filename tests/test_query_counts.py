@@ -0,0 +1,207 @@
+"""
+Exact SQL statement counts of the user badge endpoints.
+
+A changed count means a query was added or removed: check it is intended,
+then update the count here and the route's query budget.
+"""
+
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from main import app
+from modules.routers.user import get_changes
+from modules.utilities.config import app_config
+from modules.utilities.metrics import METRICS
+
+
+class TestUserQueryCounts:
+    """
+    Statements run by each endpoint of modules/routers/user.py.
+    """
+
+    @staticmethod
+    def test_add_badges(
+        client,
+        generate_mock_token,
+        mock_badgeless_user,
+        assert_query_count,
+    ):
+        """
+        Adding badges loads the user and their badges, then writes them all
+        with one statement.
+        """
+        path = f"/users/{mock_badgeless_user.id}/badges/"
+        with assert_query_count(6):
+            response = client.post(
+                path,
+                json={"badge_names": ["PAID", "CONTRIBUTOR"]},
+                headers={"Authorization": generate_mock_token},
+            )
+        assert response.status_code == 200
+
+    @staticmethod
+    def test_update_badges(
+        client,
+        generate_mock_token,
+        mock_update_badge_user,
+        assert_query_count,
+    ):
+        """
+        Updating badges loads the user and their badges, then writes.
+        """
+        path = f"/users/{mock_update_badge_user.id}/badges/"
+        with assert_query_count(6):
+            response = client.patch(
+                path,
+                json={"old_badge_names": ["SPAMMER"], "new_badge_names": ["PAID"]},
+                headers={"Authorization": generate_mock_token},
+            )
+        assert response.status_code == 200
+
+    @staticmethod
+    def test_delete_badges(
+        client,
+        generate_mock_token,
+        mock_delete_badge_user,
+        assert_query_count,
+    ):
+        """
+        Deleting badges does not query each badge.
+        """
+        path = f"/users/{mock_delete_badge_user.id}/badges/"
+        with assert_query_count(6):
+            response = client.request(
+                "DELETE",
+                path,
+                json={"badge_names": ["SPAMMER", "CONTRIBUTOR"]},
+                headers={"Authorization": generate_mock_token},
+            )
+        assert response.status_code == 200
+
+    @staticmethod
+    def test_lookup_badges(
+        client,
+        generate_mock_token,
+        mock_update_badge_user,
+        mock_delete_badge_user,
+        assert_query_count,
+    ):
+        """
+        Looking badges up loads the uncached users in one query, then none.
+        """
+        payload = {
+            "user_ids": [
+                str(mock_update_badge_user.id),
+                str(mock_delete_badge_user.id),
+                str(uuid4()),
+            ],
+        }
+        headers = {"Authorization": generate_mock_token}
+        with assert_query_count(1):
+            response = client.post(
+                "/users/badges/lookup/",
+                json=payload,
+                headers=headers,
+            )
+        assert response.status_code == 200
+        with assert_query_count(0):
+            client.post("/users/badges/lookup/", json=payload, headers=headers)
+
+    @staticmethod
+    def test_get_badges(
+        client,
+        generate_mock_token,
+        mock_update_badge_user,
+        assert_query_count,
+    ):
+        """
+        Reading a user's badges queries once, then hits the cache.
+        """
+        path = f"/users/{mock_update_badge_user.id}/badges/"
+        headers = {"Authorization": generate_mock_token}
+        with assert_query_count(1):
+            response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        with assert_query_count(0):
+            client.get(path, headers=headers)
+
+    @staticmethod
+    def test_get_users_by_customer(
+        client,
+        generate_mock_token,
+        mock_update_badge_user,
+        mock_delete_badge_user,
+        assert_query_count,
+    ):
+        """
+        Listing a customer's users reads the change sequence and loads the users
+        with their badges in one query, then answers 304 without querying.
+        """
+        headers = {"Authorization": generate_mock_token}
+        assert mock_update_badge_user.id and mock_delete_badge_user.id
+        with assert_query_count(2):
+            response = client.get("/users/by_customer/", headers=headers)
+        assert response.status_code == 200
+        with assert_query_count(0):
+            client.get(
+                "/users/by_customer/",
+                headers={**headers, "If-None-Match": response.headers["ETag"]},
+            )
+
+    @staticmethod
+    def test_get_changes(client, generate_mock_token, assert_query_count):
+        """
+        Reading the change log queries it once.
+        """
+        with assert_query_count(1):
+            response = client.get(
+                "/users/badges/changes/",
+                headers={"Authorization": generate_mock_token},
+            )
+        assert response.status_code == 200
+
+
+def test_over_budget_is_logged_when_not_enforced(
+    mocker,
+    client,
+    generate_mock_token,
+    caplog,
+):
+    """
+    Test a request over its route's budget is served and logged in production.
+    """
+    mocker.patch.object(app_config, "query_budget_enforced", False)
+    mocker.patch.object(get_changes, "query_budget", 0)
+    exceeded = METRICS.value("query_budget_exceeded_total", endpoint="get_changes")
+
+    response = client.get(
+        "/users/badges/changes/",
+        headers={"Authorization": generate_mock_token},
+    )
+
+    assert response.status_code == 200
+    assert "over the budget of get_changes: 0" in caplog.text
+    assert (
+        METRICS.value("query_budget_exceeded_total", endpoint="get_changes")
+        == exceeded + 1
+    )
+
+
+def test_over_budget_fails_before_the_response_when_enforced(
+    mocker,
+    generate_mock_token,
+):
+    """
+    Test a request over its route's budget is answered with a 500 when
+    budgets are enforced, as the response has not started yet.
+    """
+    mocker.patch.object(get_changes, "query_budget", 0)
+
+    enforced_client = TestClient(app, raise_server_exceptions=False)
+    response = enforced_client.get(
+        "/users/badges/changes/",
+        headers={"Authorization": generate_mock_token},
+    )
+
+    assert response.status_code == 500
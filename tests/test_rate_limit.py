@@ -0,0 +1,73 @@
+"""
+Tests for per-customer rate limiting.
+"""
+
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException, status
+
+from modules.actions.customer import CustomerConfig
+from modules.utilities.cache import REDIS_CLIENT, GuardedRedis
+from modules.utilities.circuit_breaker import CircuitBreaker
+from modules.utilities.rate_limit import RateLimiter
+
+
+def test_limited_customer_gets_retry_after(mocker):
+    """
+    Test requests over the burst are rejected, then rejected locally.
+    """
+    limiter = RateLimiter(REDIS_CLIENT, default_rate=50, default_burst=100)
+    customer_alias = f"test-{uuid4()}"
+    customer_info = {"rate_limit": 0.5, "rate_burst": 2}
+
+    limiter.check(customer_alias, customer_info)
+    limiter.check(customer_alias, customer_info)
+    with pytest.raises(HTTPException) as exc_info:
+        limiter.check(customer_alias, customer_info)
+
+    assert exc_info.value.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert exc_info.value.headers["Retry-After"] == "2"
+
+    take_token = mocker.spy(limiter, "_take_token")
+    with pytest.raises(HTTPException):
+        limiter.check(customer_alias, customer_info)
+    take_token.assert_not_called()
+
+
+def test_customer_limits_are_loaded_from_csv():
+    """
+    Test rate limit columns are parsed and not mistaken for badges.
+    """
+    customer_data = CustomerConfig._load_config()  # pylint: disable=W0212
+
+    assert customer_data["ltr"]["rate_limit"] == 5
+    assert customer_data["ltr"]["rate_burst"] == 10
+    assert customer_data["ltr"]["badges"] == []
+    assert customer_data["bbg"]["rate_limit"] is None
+    assert customer_data["bbg"]["badges"] == ["EDITOR", "PAID"]
+
+
+def test_unavailable_redis_fails_open_behind_breaker(mocker):
+    """
+    Test requests are let through while Redis is down, without reaching it
+    once the circuit is open.
+    """
+    breaker = CircuitBreaker("test_rate_limit", failure_threshold=2, reset_timeout=60)
+    cache = GuardedRedis(
+        breaker,
+        host="127.0.0.1",
+        port=1,
+        socket_timeout=0.1,
+        socket_connect_timeout=0.1,
+    )
+    limiter = RateLimiter(cache, default_rate=1, default_burst=1)
+    get_connection = mocker.spy(cache.connection_pool, "get_connection")
+
+    for _ in range(2):
+        limiter.check("xbahn", {})
+    assert breaker.state == "open"
+    attempts = get_connection.call_count
+
+    limiter.check("xbahn", {})
+    assert get_connection.call_count == attempts
@@ -3,10 +3,12 @@ tests for user badges endpoints.
 """
 
 import json
+from uuid import uuid4
 
 import pytest
 from fastapi import HTTPException, status
 
+from modules.actions.user import load_user_badge_names
 from modules.database.models import Badge, User
 from modules.database.schemas.user_schemas import AddBadges
 from modules.routers.user import add_badges
@@ -195,9 +197,237 @@ class TestDeleteBadge:
             "message": "Delete user badge request successful",
         }
 
-        updated_user = db_session.query(User).get(mock_delete_badge_user.id)
+        updated_user = db_session.query(User).get(
+            (mock_delete_badge_user.customer_id, mock_delete_badge_user.id),
+        )
         assert len(updated_user.badges) == 1
         assert updated_user.badges[0].badge_name == "SPAMMER"
 
         db_session.delete(updated_user)
         db_session.commit()
+
+
+class TestListUsers:
+    """
+    Test cases for listing a customer's users.
+    """
+
+    @staticmethod
+    def test_not_modified_until_badges_change(
+        client,
+        generate_mock_token,
+        mock_badgeless_user,
+    ):
+        """
+        Test the listing ETag is honoured until a badge mutation.
+        """
+        headers = {"Authorization": generate_mock_token}
+        response = client.get("/users/by_customer/", headers=headers)
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+
+        response = client.get(
+            "/users/by_customer/",
+            headers={**headers, "If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+
+        client.post(
+            f"/users/{mock_badgeless_user.id}/badges/",
+            json={"badge_names": ["PAID"]},
+            headers=headers,
+        )
+        response = client.get(
+            "/users/by_customer/",
+            headers={**headers, "If-None-Match": etag},
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    @staticmethod
+    def test_replica_listing_has_no_etag(
+        mocker,
+        client,
+        generate_mock_token,
+        mock_badgeless_user,
+    ):
+        """
+        Test listings read from a replica, which may lag, are not tagged.
+        """
+        mocker.patch(
+            "modules.routers.user.REPLICA_ROUTER.reads_from_primary",
+            return_value=False,
+        )
+        response = client.get(
+            "/users/by_customer/",
+            headers={"Authorization": generate_mock_token},
+        )
+
+        assert response.status_code == 200
+        assert str(mock_badgeless_user.id) in response.text
+        assert "ETag" not in response.headers
+        assert "Cache-Control" not in response.headers
+
+
+class TestBadgeChanges:
+    """
+    Test cases for syncing badge changes.
+    """
+
+    @staticmethod
+    def test_changes_after_listing_sequence(
+        client,
+        generate_mock_token,
+        mock_badgeless_user,
+    ):
+        """
+        Test every mutation after a listing is returned in order, in pages.
+        """
+        headers = {"Authorization": generate_mock_token}
+        listing = client.get("/users/by_customer/", headers=headers)
+        sequence = int(listing.headers["X-Badge-Sequence"])
+        path = f"/users/{mock_badgeless_user.id}/badges/"
+
+        client.post(path, json={"badge_names": ["PAID"]}, headers=headers)
+        client.patch(
+            path,
+            json={"old_badge_names": ["PAID"], "new_badge_names": ["CONTRIBUTOR"]},
+            headers=headers,
+        )
+        client.request(
+            "DELETE",
+            path,
+            data=json.dumps({"badge_names": ["CONTRIBUTOR"]}),
+            headers=headers,
+        )
+
+        page = client.get(
+            "/users/badges/changes/",
+            params={"after": sequence, "limit": 2},
+            headers=headers,
+        ).json()
+        assert page["has_more"] is True
+        assert [change["sequence"] for change in page["changes"]] == [
+            sequence + 1,
+            sequence + 2,
+        ]
+        assert [change["badge_names"] for change in page["changes"]] == [
+            ["PAID"],
+            ["CONTRIBUTOR"],
+        ]
+
+        page = client.get(
+            "/users/badges/changes/",
+            params={"after": page["last_sequence"]},
+            headers=headers,
+        ).json()
+        assert page["has_more"] is False
+        assert page["last_sequence"] == sequence + 3
+        (change,) = page["changes"]
+        assert change["user_id"] == str(mock_badgeless_user.id)
+        assert change["badge_names"] == []
+
+
+class TestGetBadges:
+    """
+    Test cases for reading a single user's badges.
+    """
+
+    @staticmethod
+    def test_get_badges_is_cached_and_invalidated(
+        mocker,
+        client,
+        generate_mock_token,
+        mock_update_badge_user,
+    ):
+        """
+        Test a cached read is invalidated by a badge update.
+        """
+        loader = mocker.patch(
+            "modules.actions.user.load_user_badge_names",
+            wraps=load_user_badge_names,
+        )
+        headers = {"Authorization": generate_mock_token}
+        path = f"/users/{mock_update_badge_user.id}/badges/"
+
+        first = client.get(path, headers=headers)
+        second = client.get(path, headers=headers)
+        assert first.status_code == 200
+        assert second.json() == first.json()
+        assert first.json()["badges"] == [{"badge_name": "SPAMMER"}]
+        assert loader.call_count == 1
+        assert "user_badge_cache_hits_total" in client.get("/metrics").text
+
+        client.patch(
+            path,
+            json={"old_badge_names": ["SPAMMER"], "new_badge_names": ["CONTRIBUTOR"]},
+            headers=headers,
+        )
+        response = client.get(path, headers=headers)
+        assert response.json()["badges"] == [{"badge_name": "CONTRIBUTOR"}]
+        assert loader.call_count == 2
+
+    @staticmethod
+    def test_get_badges_unknown_user(client, generate_mock_token):
+        """
+        Test reading badges of an unknown user.
+        """
+        response = client.get(
+            f"/users/{uuid4()}/badges/",
+            headers={"Authorization": generate_mock_token},
+        )
+
+        assert response.status_code == 404
+
+
+class TestLookupBadges:
+    """
+    Test cases for reading the badges of many users.
+    """
+
+    @staticmethod
+    def test_lookup_reports_missing_users(
+        client,
+        generate_mock_token,
+        mock_update_badge_user,
+        mock_badgeless_user,
+    ):
+        """
+        Test found users are returned and unknown ones reported missing.
+        """
+        unknown_id = str(uuid4())
+        user_ids = [str(mock_update_badge_user.id), str(mock_badgeless_user.id)]
+        payload = {"user_ids": [*user_ids, unknown_id, user_ids[0]]}
+
+        for _ in range(2):
+            response = client.post(
+                "/users/badges/lookup/",
+                json=payload,
+                headers={"Authorization": generate_mock_token},
+            )
+            assert response.status_code == 200
+            assert response.json() == {
+                "users": [
+                    {
+                        "id": user_ids[0],
+                        "customer_alias": "xbahn",
+                        "badges": [{"badge_name": "SPAMMER"}],
+                    },
+                    {"id": user_ids[1], "customer_alias": "xbahn", "badges": []},
+                ],
+                "missing": [unknown_id],
+            }
+
+    @staticmethod
+    def test_lookup_size_limit(client, generate_mock_token):
+        """
+        Test the number of users per lookup is limited.
+        """
+        response = client.post(
+            "/users/badges/lookup/",
+            json={"user_ids": [str(uuid4()) for _ in range(501)]},
+            headers={"Authorization": generate_mock_token},
+        )
+
+        assert response.status_code == 422
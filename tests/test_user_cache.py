@@ -0,0 +1,36 @@
+"""
+Tests for the user badge cache.
+"""
+
+from uuid import uuid4
+
+import redis
+
+from modules.actions.user_cache import UserBadgeCache
+from modules.utilities.cache import REQUEST_REDIS_CLIENT
+
+
+def test_generations_expire_after_entries():
+    """
+    Test invalidated generations expire, later than the entries tagged with them.
+    """
+    cache = UserBadgeCache(REQUEST_REDIS_CLIENT, 300, 30, 5, 1)
+    user_id = uuid4()
+
+    cache.invalidate("xbahn", [user_id])
+
+    generation_key = f"user_badges:xbahn:{user_id}:generation"
+    generation_ttl = REQUEST_REDIS_CLIENT.ttl(generation_key)
+    assert 300 < generation_ttl <= cache.generation_ttl
+
+
+def test_failed_store_does_not_reload(mocker):
+    """
+    Test a failed cache fill returns the loaded badges without loading again.
+    """
+    cache = UserBadgeCache(REQUEST_REDIS_CLIENT, 300, 30, 5, 1)
+    mocker.patch.object(cache, "store", side_effect=redis.ConnectionError)
+    loader = mocker.Mock(return_value=["SPAMMER"])
+
+    assert cache.get_badge_names("xbahn", uuid4(), loader) == ["SPAMMER"]
+    loader.assert_called_once_with()
@@ -0,0 +1,95 @@
+"""
+Tests for the user CSV import.
+"""
+
+import csv
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+
+from modules.actions.user import load_user_badge_names
+from modules.utilities.config import app_config
+from modules.utilities.streaming import LineTooLongError, iter_text_lines
+
+
+def test_import_users_in_batches(
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+    db_session,
+    monkeypatch,
+):
+    """
+    Test valid rows are imported and invalid ones reported.
+    """
+    monkeypatch.setattr(app_config, "import_batch_size", 2)
+    new_user_id = uuid4()
+    body = (
+        "user_id,badge1,badge2\n"
+        f"{new_user_id},SPAMMER,\n"
+        f"{mock_badgeless_user.id},CONTRIBUTOR,\n"
+        "not-a-uuid,SPAMMER,\n"
+        f"{uuid4()},EDITOR,\n"
+        f"{new_user_id},PAID,CONTRIBUTOR\n"
+        f"{mock_badgeless_user.id},SPAMMER,CONTRIBUTOR\n"
+    )
+
+    response = client.post(
+        "/users/import/",
+        content=body.encode(),
+        headers={"Authorization": generate_mock_token, "Content-Type": "text/csv"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    summary = response.json()
+    assert summary["rows"] == 6
+    assert summary["users_created"] == 1
+    assert summary["badges_added"] == 3
+    assert [error["line"] for error in summary["errors"]] == [4, 5, 6]
+    assert load_user_badge_names(new_user_id, "xbahn", db_session) == ["SPAMMER"]
+    assert sorted(
+        load_user_badge_names(mock_badgeless_user.id, "xbahn", db_session),
+    ) == ["CONTRIBUTOR", "SPAMMER"]
+
+
+def test_import_requires_user_id_column(client, generate_mock_token):
+    """
+    Test a CSV without a user_id column is rejected.
+    """
+    response = client.post(
+        "/users/import/",
+        content=b"id,badge1\n",
+        headers={"Authorization": generate_mock_token, "Content-Type": "text/csv"},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_lines_are_reassembled_across_chunks():
+    """
+    Test characters and quoted fields split across chunks are parsed.
+    """
+    content = 'user_id,note\r\n1,"café\nline"\r\n2,x'.encode()
+    chunks = [content[index : index + 3] for index in range(0, len(content), 3)]
+
+    rows = list(csv.DictReader(iter_text_lines(chunks)))
+
+    assert rows == [
+        {"user_id": "1", "note": "café\nline"},
+        {"user_id": "2", "note": "x"},
+    ]
+
+
+def test_long_lines_are_rejected():
+    """
+    Test a line longer than the limit is rejected, even split across chunks.
+    """
+    chunks = [b"user_id\n", b"a" * 6, b"a" * 6, b"\n"]
+
+    with pytest.raises(LineTooLongError):
+        list(iter_text_lines(chunks, max_line_length=10))
+    assert list(iter_text_lines(chunks, max_line_length=12)) == [
+        "user_id\n",
+        "a" * 12 + "\n",
+    ]
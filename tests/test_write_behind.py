@@ -0,0 +1,167 @@
+"""
+Tests for the write-behind badge queue.
+"""
+
+from uuid import uuid4
+
+import pytest
+
+from modules.actions.write_behind import BadgeWriteBehind, apply_mutation
+from modules.database.models import User
+from modules.utilities.cache import REDIS_CLIENT
+from modules.utilities.metrics import METRICS
+
+
+@pytest.fixture(name="write_behind")
+def write_behind_fixture(mocker):
+    """Enable write-behind on a throwaway stream"""
+    queue = BadgeWriteBehind(
+        cache=REDIS_CLIENT,
+        stream=f"test_badge_mutations:{uuid4()}",
+        enabled=True,
+    )
+    mocker.patch("modules.actions.user.WRITE_BEHIND", queue)
+    yield queue
+    REDIS_CLIENT.delete(queue.stream)
+
+
+def test_apply_mutation():
+    """
+    Test mutations apply in order and tolerate already applied state.
+    """
+    names = apply_mutation(["SPAMMER"], {"op": "add", "badge_names": ["PAID"]})
+    assert names == ["SPAMMER", "PAID"]
+
+    names = apply_mutation(
+        names,
+        {
+            "op": "update",
+            "old_badge_names": ["SPAMMER"],
+            "new_badge_names": ["CONTRIBUTOR"],
+        },
+    )
+    assert names == ["CONTRIBUTOR", "PAID"]
+    assert apply_mutation(names, {"op": "add", "badge_names": ["PAID"]}) == names
+
+
+@pytest.mark.parametrize("queued", [False, True])
+def test_add_rejects_assigned_badges_in_both_modes(
+    request,
+    client,
+    generate_mock_token,
+    mock_update_badge_user,
+    queued,
+):
+    """
+    Test adding a badge the user has fails the same way, queued or not.
+    """
+    if queued:
+        request.getfixturevalue("write_behind")
+    headers = {"Authorization": generate_mock_token}
+    path = f"/users/{mock_update_badge_user.id}/badges/"
+
+    response = client.post(path, json={"badge_names": ["SPAMMER"]}, headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {
+        "detail": "Badges ['SPAMMER'] are already assigned or repeated",
+    }
+
+    response = client.post(path, json={"badge_names": ["PAID"]}, headers=headers)
+    assert response.status_code == 200
+    response = client.get(path, headers=headers)
+    assert sorted(badge["badge_name"] for badge in response.json()["badges"]) == [
+        "PAID",
+        "SPAMMER",
+    ]
+
+
+def test_queued_write_is_readable_and_flushed(
+    db_session,
+    client,
+    generate_mock_token,
+    mock_badgeless_user,
+    write_behind,
+):
+    """
+    Test a queued write is visible before and after it is flushed.
+    """
+    headers = {"Authorization": generate_mock_token}
+    response = client.post(
+        f"/users/{mock_badgeless_user.id}/badges/",
+        json={"badge_names": ["SPAMMER", "PAID"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    db_session.refresh(mock_badgeless_user)
+    assert mock_badgeless_user.badges == []
+
+    response = client.post(
+        f"/users/{mock_badgeless_user.id}/badges/",
+        json={"badge_names": ["CONTRIBUTOR"]},
+        headers=headers,
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Maximum 2 badges allowed per user"}
+
+    assert write_behind.flush() == 1
+    assert write_behind.pending_badge_names(mock_badgeless_user.id, []) == []
+
+    updated_user = db_session.query(User).get(
+        (mock_badgeless_user.customer_id, mock_badgeless_user.id),
+    )
+    db_session.refresh(updated_user)
+    assert sorted(badge.badge_name for badge in updated_user.badges) == [
+        "PAID",
+        "SPAMMER",
+    ]
+
+
+def test_flush_rejects_mutations_invalidated_by_other_workers(
+    db_session,
+    mock_badgeless_user,
+    write_behind,
+):
+    """
+    Test mutations queued concurrently by different workers are validated
+    again when flushed.
+    """
+    other_worker = BadgeWriteBehind(cache=REDIS_CLIENT, stream=write_behind.stream)
+    rejected = METRICS.value("write_behind_rejected_mutations_total", op="add")
+    write_behind.enqueue(mock_badgeless_user, {"op": "add", "badge_names": ["PAID"]})
+    other_worker.enqueue(
+        mock_badgeless_user,
+        {"op": "add", "badge_names": ["SPAMMER", "CONTRIBUTOR"]},
+    )
+    other_worker.enqueue(
+        mock_badgeless_user,
+        {"op": "update", "old_badge_names": ["SPAMMER"], "new_badge_names": ["PAID"]},
+    )
+
+    assert write_behind.flush() == 3
+
+    db_session.refresh(mock_badgeless_user)
+    assert [badge.badge_name for badge in mock_badgeless_user.badges] == ["PAID"]
+    assert (
+        METRICS.value("write_behind_rejected_mutations_total", op="add")
+        == rejected + 1
+    )
+
+
+def test_flush_keeps_users_of_different_customers_apart(db_session, write_behind):
+    """
+    Test users sharing an ID across customers are flushed separately.
+    """
+    user_id = uuid4()
+    users = [User(id=user_id, customer_id="xbahn"), User(id=user_id, customer_id="bbg")]
+    db_session.add_all(users)
+    db_session.commit()
+    write_behind.enqueue(users[0], {"op": "add", "badge_names": ["SPAMMER"]})
+    write_behind.enqueue(users[1], {"op": "add", "badge_names": ["EDITOR"]})
+
+    assert write_behind.flush() == 2
+
+    for user in users:
+        db_session.refresh(user)
+    assert [badge.badge_name for badge in users[0].badges] == ["SPAMMER"]
+    assert [badge.badge_name for badge in users[1].badges] == ["EDITOR"]
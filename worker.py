@@ -0,0 +1,39 @@
+"""Background job worker"""
+import logging
+import os
+import signal
+import socket
+import threading
+
+from dotenv import load_dotenv
+
+# Register the job handlers, and the listing snapshot rebuild on badge changes.
+from modules.actions import (  # noqa: F401 pylint: disable=W0611
+    job_handlers,
+    listing_snapshots,
+)
+from modules.actions.jobs import JOB_QUEUE
+from modules.utilities.auth import CUSTOMER_CONFIG
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+
+def run_worker() -> None:
+    """
+    Process background jobs until SIGTERM or SIGINT is received.
+
+    The job being run when the signal arrives is finished first.
+    """
+    logging.basicConfig(level=logging.INFO)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    CUSTOMER_CONFIG.start_background_refresh_task()
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    JOB_QUEUE.run(consumer, stop)
+
+
+if __name__ == "__main__":
+    run_worker()